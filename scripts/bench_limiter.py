@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import os
+import tempfile
+import time
+
+from ratelimmq.limiter import TokenBucket
+from ratelimmq.shared_limiter import SharedBucketTable, SharedTokenBucket
+
+
+def _per_call_ns(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e9
+
+
+def bench_in_process(n: int) -> float:
+    b = TokenBucket(capacity=1e12, refill_rate=1e12)
+    return _per_call_ns(b.allow, n)
+
+
+def bench_shared(path: str, n: int) -> float:
+    b = SharedTokenBucket(path, capacity=1e12, refill_rate=1e12)
+    try:
+        return _per_call_ns(b.allow, n)
+    finally:
+        b.close()
+
+
+def bench_table(path: str, n: int, keys: int) -> float:
+    t = SharedBucketTable(path, capacity=1e12, refill_rate=1e12, slots=max(16, keys * 2))
+    names = [f"host{i}.example" for i in range(keys)]
+    i = 0
+
+    def one() -> None:
+        nonlocal i
+        t.allow(names[i % keys])
+        i += 1
+
+    try:
+        return _per_call_ns(one, n)
+    finally:
+        t.close()
+
+
+def _worker(path: str, n: int, q) -> None:
+    b = SharedTokenBucket(path, capacity=1e12, refill_rate=1e12)
+    q.put(_per_call_ns(b.allow, n))
+    b.close()
+
+
+def bench_multi_process(path: str, n: int, procs: int) -> tuple[float, float]:
+    """Returns (mean ns/decision per process, aggregate decisions/sec)."""
+    ctx = mp.get_context("fork")
+    q = ctx.Queue()
+    ps = [ctx.Process(target=_worker, args=(path, n, q)) for _ in range(procs)]
+    t0 = time.perf_counter()
+    for p in ps:
+        p.start()
+    per = [q.get() for _ in ps]
+    for p in ps:
+        p.join()
+    total = time.perf_counter() - t0
+    return sum(per) / len(per), (n * procs) / total
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Per-decision cost: in-process vs shared-memory token buckets")
+    ap.add_argument("-n", type=int, default=200_000, help="decisions per measurement")
+    ap.add_argument("--keys", type=int, default=1000, help="distinct keys for the keyed table")
+    ap.add_argument("--procs", type=int, default=os.cpu_count() or 2)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        local = bench_in_process(args.n)
+        shared = bench_shared(os.path.join(d, "single"), args.n)
+        table = bench_table(os.path.join(d, "table"), args.n, args.keys)
+        mp_ns, mp_rate = bench_multi_process(os.path.join(d, "mp"), args.n // args.procs, args.procs)
+
+    print(f"in-process TokenBucket.allow        {local:8.0f} ns/decision")
+    print(f"SharedTokenBucket.allow             {shared:8.0f} ns/decision  ({shared / local:.1f}x)")
+    print(f"SharedBucketTable.allow ({args.keys} keys) {table:8.0f} ns/decision  ({table / local:.1f}x)")
+    print(f"SharedTokenBucket x{args.procs} procs (1 key)  {mp_ns:8.0f} ns/decision  {mp_rate:,.0f} decisions/s total")
+
+
+if __name__ == "__main__":
+    main()
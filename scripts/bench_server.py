@@ -0,0 +1,426 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ratelimmq.metrics import LatencySketch
+
+# TCP load generator for server.handle_client: N connections spread over P
+# client processes, each sending batches of `pipeline` commands drawn from a
+# weighted mix and waiting for all of their replies. The server runs as a
+# child process so its CPU time can be reported separately.
+#
+# Mix entries:
+#   ping      PING                          (free when the limiter is on)
+#   limited   HELP, costs one token         ("ERR rate limited" past --limit-rate)
+#   oversized a line longer than RATELIMMQ_MAX_LINE_BYTES  ("ERR line too long")
+#   qlen      QLEN bench                    (free when the limiter is on)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+DEFAULT_HISTORY = os.path.join(HERE, "bench_server_history.jsonl")
+MIX_KINDS = ("ping", "limited", "oversized", "qlen")
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse "ping=90,limited=5,oversized=5" into normalized weights."""
+    mix: Dict[str, float] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, value = item.partition("=")
+        name = name.strip().lower()
+        if not sep or name not in MIX_KINDS:
+            raise ValueError(f"bad --mix entry {item!r}; kinds are {', '.join(MIX_KINDS)}")
+        if float(value) > 0:
+            mix[name] = float(value)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError("--mix needs at least one positive weight")
+    return {k: v / total for k, v in mix.items()}
+
+
+def command_lines(max_line_bytes: int) -> Dict[str, bytes]:
+    return {
+        "ping": b"PING\n",
+        "limited": b"HELP\n",
+        "oversized": b"x" * (max_line_bytes + 1) + b"\n",
+        "qlen": b"QLEN bench\n",
+    }
+
+
+def classify(line: bytes) -> str:
+    if line.startswith(b"ERR rate limited"):
+        return "rate_limited"
+    if line.startswith(b"ERR line too long"):
+        return "too_long"
+    if line.startswith(b"ERR"):
+        return "error"
+    return "ok"
+
+
+# --- client side -------------------------------------------------------------
+
+
+async def _connection(
+    host: str,
+    port: int,
+    batches: List[bytes],
+    pipeline: int,
+    start_at: float,
+    end_at: float,
+    sketch: LatencySketch,
+    counts: Dict[str, int],
+    connect_sem: asyncio.Semaphore,
+) -> None:
+    try:
+        async with connect_sem:
+            reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        counts["connect_errors"] += 1
+        return
+    counts["connected"] += 1
+    delay = start_at - time.time()
+    if delay > 0:
+        await asyncio.sleep(delay)
+    i = random.randrange(len(batches))
+    try:
+        while True:
+            t0 = time.perf_counter()
+            writer.write(batches[i])
+            replies = []
+            for _ in range(pipeline):
+                line = await reader.readline()
+                if not line:
+                    raise ConnectionError("server closed the connection")
+                replies.append(line)
+            if time.time() > end_at:
+                break
+            for line in replies:
+                counts[classify(line)] += 1
+            # Per-command latency is the batch round trip (what a pipelining client sees).
+            sketch.add(time.perf_counter() - t0, pipeline)
+            counts["commands"] += pipeline
+            counts["batches"] += 1
+            i = (i + 1) % len(batches)
+    except (OSError, ConnectionError):
+        counts["io_errors"] += 1
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+
+async def _client(opts: Dict[str, Any], connections: int, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    lines = command_lines(opts["max_line_bytes"])
+    kinds, weights = zip(*opts["mix"].items())
+    # A fixed ring of pre-built batches keeps command generation off the hot path.
+    batches = [
+        b"".join(lines[k] for k in rng.choices(kinds, weights, k=opts["pipeline"]))
+        for _ in range(64)
+    ]
+    sketch = LatencySketch(relative_accuracy=0.01)
+    counts = dict.fromkeys(
+        ("connected", "connect_errors", "io_errors", "commands", "batches", "ok", "rate_limited", "too_long", "error"),
+        0,
+    )
+    sem = asyncio.Semaphore(opts["connect_concurrency"])
+    await asyncio.gather(*(
+        _connection(
+            opts["host"], opts["port"], batches, opts["pipeline"],
+            opts["start_at"], opts["end_at"], sketch, counts, sem,
+        )
+        for _ in range(connections)
+    ))
+    return {"counts": counts, "sketch": sketch.to_dict()}
+
+
+def _client_proc(opts: Dict[str, Any], connections: int, seed: int, q) -> None:
+    q.put(asyncio.run(_client(opts, connections, seed)))
+
+
+def run_load(opts: Dict[str, Any], connections: int, procs: int) -> Tuple[Dict[str, int], LatencySketch]:
+    ctx = mp.get_context("fork")
+    q = ctx.Queue()
+    share = [connections // procs + (1 if i < connections % procs else 0) for i in range(procs)]
+    ps = [ctx.Process(target=_client_proc, args=(opts, n, i, q)) for i, n in enumerate(share) if n]
+    for p in ps:
+        p.start()
+    parts = [q.get() for _ in ps]
+    for p in ps:
+        p.join()
+
+    counts: Dict[str, int] = {}
+    sketch = LatencySketch(relative_accuracy=0.01)
+    for part in parts:
+        for k, v in part["counts"].items():
+            counts[k] = counts.get(k, 0) + v
+        sketch.merge(LatencySketch.from_dict(part["sketch"]))
+    return counts, sketch
+
+
+# --- server side -------------------------------------------------------------
+
+
+def _free_port() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def server_env(args: argparse.Namespace, port: int, mix: Dict[str, float]) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.join(ROOT, "src")
+    env["RATELIMMQ_HOST"] = "127.0.0.1"
+    env["RATELIMMQ_PORT"] = str(port)
+    env["RATELIMMQ_WORKERS"] = str(args.workers)
+    env["RATELIMMQ_MAX_LINE_BYTES"] = str(args.max_line_bytes)
+    env["RATELIMMQ_LOG_LEVEL"] = "WARNING"
+    if "limited" in mix:
+        # One global bucket; everything except the "limited" command is free,
+        # so only that share of the mix pays for (and is refused by) the limiter.
+        env["RATELIMMQ_ENABLE_LIMITER"] = "1"
+        env["RATELIMMQ_CAPACITY"] = str(args.limit_rate)
+        env["RATELIMMQ_REFILL_RATE"] = str(args.limit_rate)
+        env["RATELIMMQ_COMMAND_COSTS"] = "PING=0,QLEN=0"
+    return env
+
+
+def start_server(args: argparse.Namespace, port: int, mix: Dict[str, float]) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-u", "-m", "ratelimmq"],
+        env=server_env(args, port, mix),
+        stdout=subprocess.PIPE,
+        text=True,
+        cwd=ROOT,
+    )
+    assert proc.stdout is not None
+    seen = 0
+    deadline = time.time() + 10.0
+    while seen < args.workers:
+        line = proc.stdout.readline()
+        if not line or time.time() > deadline:
+            proc.kill()
+            raise SystemExit(f"server failed to start: {line!r}")
+        seen += line.count("listening on")
+    return proc
+
+
+def _send(host: str, port: int, line: bytes) -> bytes:
+    with socket.create_connection((host, port), timeout=5.0) as s:
+        s.sendall(line)
+        s.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            data = s.recv(65536)
+            if not data:
+                return b"".join(chunks)
+            chunks.append(data)
+
+
+def _cpu_children() -> float:
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ru.ru_utime + ru.ru_stime
+
+
+def _raise_nofile(n: int) -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    want = n if hard == resource.RLIM_INFINITY else min(n, hard)
+    if soft != resource.RLIM_INFINITY and soft < want:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (want, hard))
+
+
+def _read_proc_cpu(pid: int) -> Optional[float]:
+    """utime + stime of `pid` in seconds, from /proc (None where unavailable)."""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+# --- history -----------------------------------------------------------------
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, check=True, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def last_matching(path: str, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Most recent history entry recorded with the same config, if any."""
+    if not os.path.exists(path):
+        return None
+    found = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                if entry.get("config") == config:
+                    found = entry
+    return found
+
+
+def compare(cur: Dict[str, Any], prev: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions: commands/s down, p99 up or server CPU per command up by more than `tolerance`."""
+    problems = []
+    if prev.get("cps") and cur["cps"] < prev["cps"] * (1.0 - tolerance):
+        problems.append(f"cps {cur['cps']:.0f} < {prev['cps']:.0f}")
+    if prev.get("p99_ms") and cur["p99_ms"] > prev["p99_ms"] * (1.0 + tolerance):
+        problems.append(f"p99 {cur['p99_ms']:.2f}ms > {prev['p99_ms']:.2f}ms")
+    if prev.get("server_cpu_us_per_cmd") and cur.get("server_cpu_us_per_cmd"):
+        if cur["server_cpu_us_per_cmd"] > prev["server_cpu_us_per_cmd"] * (1.0 + tolerance):
+            problems.append(
+                f"server cpu/cmd {cur['server_cpu_us_per_cmd']:.1f}us > {prev['server_cpu_us_per_cmd']:.1f}us"
+            )
+    return problems
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Load generator / throughput benchmark for the TCP server")
+    ap.add_argument("-c", "--connections", type=int, default=1000)
+    ap.add_argument("-P", "--pipeline", type=int, default=8, help="commands in flight per connection")
+    ap.add_argument("-d", "--duration", type=float, default=10.0, help="measured seconds")
+    ap.add_argument("--ramp", type=float, default=2.0, help="seconds allowed for connecting before measuring")
+    ap.add_argument("--mix", default="ping=90,limited=5,oversized=5")
+    ap.add_argument("--procs", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="client processes")
+    ap.add_argument("--connect-concurrency", type=int, default=128, help="concurrent connects per client process")
+    ap.add_argument("--workers", type=int, default=1, help="RATELIMMQ_WORKERS for the spawned server")
+    ap.add_argument("--max-line-bytes", type=int, default=4096)
+    ap.add_argument("--limit-rate", type=float, default=1000.0, help="tokens/s for the limited commands")
+    ap.add_argument("--target", default=None, metavar="HOST:PORT",
+                    help="load an already running server instead (no server CPU figures)")
+    ap.add_argument("--out", default=None, help="write the result JSON here")
+    ap.add_argument("--record", nargs="?", const=DEFAULT_HISTORY, default=None,
+                    help=f"append the result to a JSONL history (default {DEFAULT_HISTORY}) "
+                    "after comparing it with the last entry of the same config")
+    ap.add_argument("--tolerance", type=float, default=0.20)
+    args = ap.parse_args()
+
+    mix = parse_mix(args.mix)
+    _raise_nofile(args.connections + 256)
+
+    proc = None
+    if args.target:
+        host, _, p = args.target.rpartition(":")
+        port = int(p)
+    else:
+        host, port = "127.0.0.1", _free_port()
+        proc = start_server(args, port, mix)
+
+    try:
+        start_at = time.time() + args.ramp
+        opts = {
+            "host": host,
+            "port": port,
+            "pipeline": args.pipeline,
+            "mix": mix,
+            "max_line_bytes": args.max_line_bytes,
+            "connect_concurrency": args.connect_concurrency,
+            "start_at": start_at,
+            "end_at": start_at + args.duration,
+        }
+        # Windowed CPU is read from /proc for a single server process only;
+        # with workers the pid is the supervisor.
+        watch = proc.pid if proc is not None and args.workers == 1 else None
+        cpu_before = _read_proc_cpu(watch) if watch is not None else None
+        counts, sketch = run_load(opts, args.connections, min(args.procs, args.connections))
+        cpu_after = _read_proc_cpu(watch) if watch is not None else None
+        stats_line = _send(host, port, b"STATS\n").decode("utf-8", "replace").strip()
+    finally:
+        server_cpu_total = None
+        if proc is not None:
+            before = _cpu_children()
+            try:
+                _send(host, port, b"SHUTDOWN\n")
+            except OSError:
+                proc.terminate()
+            proc.wait(timeout=10.0)
+            server_cpu_total = _cpu_children() - before
+
+    s = sketch.summary(total_time_s=args.duration)
+    result: Dict[str, Any] = {
+        "commands": counts["commands"],
+        "cps": round(counts["commands"] / args.duration, 1),
+        "p50_ms": round(s.p50_ms, 3),
+        "p95_ms": round(s.p95_ms, 3),
+        "p99_ms": round(s.p99_ms, 3),
+        "connected": counts["connected"],
+        "connect_errors": counts["connect_errors"],
+        "io_errors": counts["io_errors"],
+        "replies": {k: counts[k] for k in ("ok", "rate_limited", "too_long", "error")},
+        "server_stats": stats_line,
+    }
+    if cpu_before is not None and cpu_after is not None:
+        # Only the measured window (Linux /proc, single server process).
+        cpu = cpu_after - cpu_before
+        result["server_cpu_s"] = round(cpu, 3)
+        result["server_cpu_us_per_cmd"] = round(cpu / max(1, counts["commands"]) * 1e6, 2)
+    if server_cpu_total is not None:
+        # Whole server lifetime including startup and workers (any platform).
+        result["server_cpu_total_s"] = round(server_cpu_total, 3)
+
+    config = {
+        k: getattr(args, k)
+        for k in ("connections", "pipeline", "duration", "mix", "procs", "workers", "max_line_bytes", "limit_rate")
+    }
+    print(
+        f"conns={counts['connected']}/{args.connections} pipeline={args.pipeline} mix={args.mix} "
+        f"cps={result['cps']:,.0f} p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+        f"p99={result['p99_ms']:.2f}ms server_cpu={result.get('server_cpu_s', '-')}s "
+        f"({result.get('server_cpu_us_per_cmd', '-')}us/cmd) errors={counts['connect_errors'] + counts['io_errors']}"
+    )
+    print(f"replies {result['replies']}")
+    print(stats_line)
+
+    entry = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git": _git_rev(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": config,
+        "result": result,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if args.record and not args.target:
+        prev = last_matching(args.record, config)
+        problems = compare(result, prev["result"], args.tolerance) if prev else []
+        with open(args.record, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, sort_keys=True) + "\n")
+        if prev:
+            for p in problems:
+                print(f"REGRESSION vs {prev['git']} ({prev['created']}): {p}")
+            if problems:
+                raise SystemExit(1)
+            print(f"no regressions vs {prev['git']} ({prev['created']}, tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
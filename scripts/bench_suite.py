@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+from urllib.request import urlopen
+
+# Self-contained fetch benchmark: starts scripts/origin_server.py as a
+# separate process (so its CPU is not charged to the client), runs each
+# mode of scripts/bench_urls.py in its own process (so max RSS is per
+# mode), writes JSON and optionally compares against a stored baseline.
+# Each mode runs --repeat times and every metric is the median of the runs,
+# so one noisy run neither trips the regression check nor skews a baseline.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "bench_baseline.json")
+
+
+def start_origin(args: argparse.Namespace) -> tuple[subprocess.Popen, int]:
+    cmd = [
+        sys.executable, os.path.join(HERE, "origin_server.py"),
+        "--port", "0",
+        "--hosts", str(args.hosts),
+        "--latency-ms", str(args.latency_ms),
+        "--latency-dist", args.latency_dist,
+        "--body-bytes", str(args.body_bytes),
+        "--error-rate", str(args.error_rate),
+        "--seed", str(args.seed),
+    ]
+    if args.no_keep_alive:
+        cmd.append("--no-keep-alive")
+    for spec in args.vhost:
+        cmd += ["--vhost", spec]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    assert proc.stdout is not None
+    line = proc.stdout.readline()
+    if not line.startswith("listening "):
+        proc.kill()
+        raise SystemExit(f"origin failed to start: {line!r}")
+    return proc, int(line.split()[1])
+
+
+def origin_stats(port: int) -> Dict[str, int]:
+    with urlopen(f"http://127.0.0.1:{port}/__stats", timeout=5.0) as r:
+        return json.loads(r.read())
+
+
+def write_urls(path: str, port: int, hosts: int, n: int) -> None:
+    # Distinct paths so nothing coalesces or caches; hosts round-robin.
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            f.write(f"http://127.0.0.{1 + i % hosts}:{port}/item/{i}\n")
+
+
+def run_mode(mode: str, urls_file: str, args: argparse.Namespace) -> Dict[str, Any]:
+    env = dict(os.environ)
+    src = os.path.join(os.path.dirname(HERE), "src")
+    env["PYTHONPATH"] = src + (os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+    cmd = [
+        sys.executable, os.path.join(HERE, "bench_urls.py"), urls_file,
+        "--mode", mode,
+        "--concurrency", str(args.concurrency),
+        "--per-host", str(args.per_host),
+        "--timeout", str(args.timeout),
+        "--json",
+    ]
+    out = subprocess.run(cmd, env=env, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def median_result(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Per-metric median over repeated runs of one mode."""
+    out = dict(runs[-1])
+    for key, value in runs[-1].items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            m = statistics.median(r[key] for r in runs)
+            out[key] = int(m) if isinstance(value, int) else round(m, 4)
+    return out
+
+
+def _python_minor(version: str) -> str:
+    return ".".join(str(version).split(".")[:2])
+
+
+def config_mismatch(report: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """
+    Config keys (and the Python version) that differ between a run and the
+    baseline. Python is compared as major.minor: CI pins "3.12", so the patch
+    release it gets can change, and patch releases don't move these numbers.
+    """
+    # Round-trip so tuples/ints from argparse compare equal to what json.load gives back.
+    cur = json.loads(json.dumps(report["config"]))
+    base = baseline.get("config", {})
+    keys = sorted(k for k in set(cur) | set(base) if cur.get(k) != base.get(k))
+    if _python_minor(report.get("python", "")) != _python_minor(baseline.get("python", "")):
+        keys.append("python")
+    return keys
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Regressions vs baseline["results"]: rps down or p99 / cpu per request up
+    by more than `tolerance` (fraction). Modes missing on either side are skipped.
+    """
+    problems = []
+    for mode, cur in results.items():
+        base = baseline.get("results", {}).get(mode)
+        if not base:
+            continue
+        if base.get("rps") and cur["rps"] < base["rps"] * (1.0 - tolerance):
+            problems.append(f"{mode}: rps {cur['rps']:.1f} < baseline {base['rps']:.1f}")
+        if base.get("p99_ms") and cur["p99_ms"] > base["p99_ms"] * (1.0 + tolerance):
+            problems.append(f"{mode}: p99 {cur['p99_ms']:.2f}ms > baseline {base['p99_ms']:.2f}ms")
+        cur_cpu = cur["cpu_s"] / max(1, cur["requests"])
+        base_cpu = base.get("cpu_s", 0.0) / max(1, base.get("requests", 1))
+        if base_cpu and cur_cpu > base_cpu * (1.0 + tolerance):
+            problems.append(
+                f"{mode}: cpu/request {cur_cpu * 1e6:.0f}us > baseline {base_cpu * 1e6:.0f}us"
+            )
+    return problems
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Fetch benchmark suite against a local stand-in origin")
+    ap.add_argument("--modes", default="seq,threads,pool,asyncio")
+    ap.add_argument("-n", "--requests", type=int, default=2000)
+    ap.add_argument("--seq-requests", type=int, default=500, help="cap for the (slow) seq mode")
+    ap.add_argument("--hosts", type=int, default=4, help="virtual hosts 127.0.0.1..N")
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--per-host", type=int, default=10)
+    ap.add_argument("--timeout", type=float, default=10.0)
+    ap.add_argument("--latency-ms", type=float, default=2.0)
+    ap.add_argument("--latency-dist", default="lognormal")
+    ap.add_argument("--body-bytes", type=int, default=4096)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--no-keep-alive", action="store_true")
+    ap.add_argument("--vhost", action="append", default=[], help="passed to origin_server.py --vhost")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3, help="runs per mode; metrics are the median")
+    ap.add_argument("--out", default=None, help="write results JSON here")
+    ap.add_argument("--baseline", default=None, help=f"compare with this file (e.g. {DEFAULT_BASELINE})")
+    ap.add_argument("--save-baseline", default=None, help="write results as the new baseline")
+    ap.add_argument("--tolerance", type=float, default=0.20, help="allowed regression fraction")
+    args = ap.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    proc, port = start_origin(args)
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for mode in modes:
+                n = min(args.requests, args.seq_requests) if mode == "seq" else args.requests
+                urls_file = os.path.join(tmp, f"{mode}.txt")
+                write_urls(urls_file, port, args.hosts, n)
+                runs = []
+                for _ in range(max(1, args.repeat)):
+                    before = origin_stats(port)
+                    res = run_mode(mode, urls_file, args)
+                    after = origin_stats(port)
+                    # -1: the /__stats request itself opens a connection
+                    res["origin_connections"] = after["connections"] - before["connections"] - 1
+                    res.pop("mode", None)
+                    runs.append(res)
+                res = results[mode] = median_result(runs)
+                print(
+                    f"{mode:8s} n={res['requests']:<6d} rps={res['rps']:>9.1f} "
+                    f"p50={res['p50_ms']:7.2f}ms p95={res['p95_ms']:7.2f}ms p99={res['p99_ms']:7.2f}ms "
+                    f"cpu={res['cpu_s']:6.2f}s rss={res['max_rss_mib']:6.1f}MiB "
+                    f"conns={res['origin_connections']} errors={res['errors']}",
+                    flush=True,
+                )
+    finally:
+        proc.terminate()
+        proc.wait(timeout=5.0)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            k: getattr(args, k)
+            for k in (
+                "requests", "seq_requests", "hosts", "concurrency", "per_host", "latency_ms",
+                "latency_dist", "body_bytes", "error_rate", "no_keep_alive", "vhost", "seed",
+                "repeat",
+            )
+        },
+        "results": results,
+    }
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+                f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        # Numbers from a different workload or interpreter are not comparable.
+        mismatch = config_mismatch(report, baseline)
+        if mismatch:
+            print(
+                f"baseline {args.baseline} was recorded with a different {', '.join(mismatch)}; "
+                "not comparing (rerun with its options, or record a new one with --save-baseline)",
+                file=sys.stderr,
+            )
+            raise SystemExit(2)
+        problems = compare(results, baseline, args.tolerance)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        if problems:
+            raise SystemExit(1)
+        print(f"no regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
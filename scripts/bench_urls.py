@@ -2,65 +2,116 @@ from __future__ import annotations
 
 import argparse
 import asyncio
+import json
+import resource
+import sys
 import time
 from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
 from urllib.request import urlopen
 
-from ratelimmq.fetcher import run_asyncio_fetch
+from ratelimmq.client import fetch_all
+from ratelimmq.dispatcher import PoolLimits
 from ratelimmq.metrics import summarize_latencies
 
+# seq / threads: plain urllib; pool / asyncio: run_pool + fetch_one on the
+# thread and native asyncio backends (ratelimmq.client.fetch_all).
+MODES = ("seq", "threads", "pool", "asyncio")
+
 
 def read_urls(path: str) -> list[str]:
     with open(path, "r", encoding="utf-8") as f:
         return [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
 
 
-def fetch_blocking(url: str, timeout_s: float = 10.0) -> float:
+def fetch_blocking(url: str, timeout_s: float = 10.0) -> Tuple[bool, float]:
     t0 = time.perf_counter()
-    with urlopen(url, timeout=timeout_s) as r:
-        _ = r.read(1024)  # read a little; enough to measure latency
-    return time.perf_counter() - t0
+    try:
+        with urlopen(url, timeout=timeout_s) as r:
+            while r.read(64 * 1024):
+                pass
+        ok = True
+    except Exception:
+        ok = False
+    return ok, time.perf_counter() - t0
 
 
-def bench_sequential(urls: list[str]) -> tuple[list[float], float]:
+def bench_sequential(urls: list[str], timeout_s: float) -> tuple[list[float], int, float]:
     t0 = time.perf_counter()
-    lat = [fetch_blocking(u) for u in urls]
-    return lat, time.perf_counter() - t0
+    out = [fetch_blocking(u, timeout_s) for u in urls]
+    return [lat for ok, lat in out if ok], sum(1 for ok, _ in out if not ok), time.perf_counter() - t0
 
 
-def bench_threads(urls: list[str], workers: int) -> tuple[list[float], float]:
+def bench_threads(urls: list[str], workers: int, timeout_s: float) -> tuple[list[float], int, float]:
     t0 = time.perf_counter()
     with ThreadPoolExecutor(max_workers=workers) as ex:
-        lat = list(ex.map(fetch_blocking, urls))
-    return lat, time.perf_counter() - t0
+        out = list(ex.map(lambda u: fetch_blocking(u, timeout_s), urls))
+    return [lat for ok, lat in out if ok], sum(1 for ok, _ in out if not ok), time.perf_counter() - t0
 
 
-async def bench_asyncio(urls: list[str], concurrency: int) -> tuple[list[float], float]:
+async def bench_pool(
+    urls: list[str], backend: str, concurrency: int, per_host: int, timeout_s: float
+) -> tuple[list[float], int, float]:
+    limits = PoolLimits(total_concurrency=concurrency, per_host_concurrency=per_host)
     t0 = time.perf_counter()
-    results = await run_asyncio_fetch(urls, concurrency=concurrency)
-    lat = [r.elapsed_s for r in results if r.ok]
-    return lat, time.perf_counter() - t0
+    results = await fetch_all(urls, limits=limits, timeout_s=timeout_s, backend=backend)
+    total = time.perf_counter() - t0
+    lat = [r.elapsed_ms / 1000.0 for r in results if r.ok]
+    return lat, sum(1 for r in results if not r.ok), total
+
+
+def run_mode(mode: str, urls: list[str], concurrency: int, per_host: int, timeout_s: float) -> Dict[str, float]:
+    """Run one mode; returns rps, latency quantiles (ms), errors, CPU seconds and peak RSS."""
+    ru0 = resource.getrusage(resource.RUSAGE_SELF)
+    if mode == "seq":
+        lat, errors, total = bench_sequential(urls, timeout_s)
+    elif mode == "threads":
+        lat, errors, total = bench_threads(urls, concurrency, timeout_s)
+    elif mode in ("pool", "asyncio"):
+        backend = "thread" if mode == "pool" else "asyncio"
+        lat, errors, total = asyncio.run(bench_pool(urls, backend, concurrency, per_host, timeout_s))
+    else:
+        raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+    ru1 = resource.getrusage(resource.RUSAGE_SELF)
+
+    s = summarize_latencies(lat, total_time_s=total)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss_kib = ru1.ru_maxrss // 1024 if sys.platform == "darwin" else ru1.ru_maxrss
+    return {
+        "requests": len(urls),
+        "ok": s.count,
+        "errors": errors,
+        "total_s": round(total, 4),
+        "rps": round(len(urls) / total, 1) if total > 0 else 0.0,
+        "p50_ms": round(s.p50_ms, 3),
+        "p95_ms": round(s.p95_ms, 3),
+        "p99_ms": round(s.p99_ms, 3),
+        "cpu_s": round((ru1.ru_utime - ru0.ru_utime) + (ru1.ru_stime - ru0.ru_stime), 4),
+        "max_rss_mib": round(rss_kib / 1024.0, 1),
+    }
 
 
 def main() -> None:
-    ap = argparse.ArgumentParser()
+    ap = argparse.ArgumentParser(description="Fetch a URL list with one strategy and report latency/throughput")
     ap.add_argument("urls_file", help="text file with one URL per line")
-    ap.add_argument("--mode", choices=["seq", "threads", "asyncio"], default="asyncio")
+    ap.add_argument("--mode", choices=MODES, default="asyncio")
     ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--per-host", type=int, default=10, help="per-host cap (pool / asyncio modes)")
+    ap.add_argument("--timeout", type=float, default=10.0)
+    ap.add_argument("--json", action="store_true", help="print one JSON object instead of text")
     args = ap.parse_args()
 
     urls = read_urls(args.urls_file)
-
-    if args.mode == "seq":
-        lat, total = bench_sequential(urls)
-    elif args.mode == "threads":
-        lat, total = bench_threads(urls, workers=args.concurrency)
-    else:
-        lat, total = asyncio.run(bench_asyncio(urls, concurrency=args.concurrency))
-
-    s = summarize_latencies(lat, total_time_s=total)
-    print(f"mode={args.mode} urls={len(urls)} ok={s.count} total_s={total:.3f}")
-    print(f"p50={s.p50_ms:.1f}ms p95={s.p95_ms:.1f}ms p99={s.p99_ms:.1f}ms rps={s.rps:.1f}")
+    res = run_mode(args.mode, urls, args.concurrency, args.per_host, args.timeout)
+
+    if args.json:
+        print(json.dumps({"mode": args.mode, **res}))
+        return
+    print(f"mode={args.mode} urls={len(urls)} ok={res['ok']} errors={res['errors']} total_s={res['total_s']:.3f}")
+    print(
+        f"p50={res['p50_ms']:.1f}ms p95={res['p95_ms']:.1f}ms p99={res['p99_ms']:.1f}ms rps={res['rps']:.1f} "
+        f"cpu_s={res['cpu_s']:.2f} max_rss={res['max_rss_mib']:.1f}MiB"
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import random
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple
+
+LATENCY_DISTS = ("fixed", "uniform", "exp", "lognormal")
+
+
+@dataclass(frozen=True)
+class Profile:
+    """How one (virtual) host behaves."""
+
+    latency_ms: float = 0.0
+    latency_dist: str = "fixed"  # fixed | uniform (0..2x) | exp | lognormal (sigma 1), all with mean latency_ms
+    body_bytes: int = 1024
+    error_rate: float = 0.0
+    error_status: int = 503
+    keep_alive: bool = True
+
+    def delay_s(self, rng: random.Random) -> float:
+        mean = self.latency_ms / 1000.0
+        if mean <= 0:
+            return 0.0
+        if self.latency_dist == "uniform":
+            return rng.uniform(0.0, 2.0 * mean)
+        if self.latency_dist == "exp":
+            return rng.expovariate(1.0 / mean)
+        if self.latency_dist == "lognormal":
+            return rng.lognormvariate(math.log(mean) - 0.5, 1.0)
+        return mean
+
+
+def parse_profile(spec: str, base: Profile) -> Tuple[str, Profile]:
+    """Parse "HOST:key=value,..." (keys are Profile fields) into (host, profile)."""
+    host, sep, rest = spec.partition(":")
+    if not sep or not host:
+        raise ValueError(f"bad --vhost {spec!r}; expected HOST:key=value,...")
+    changes: Dict[str, object] = {}
+    for item in rest.split(","):
+        if not item.strip():
+            continue
+        key, _, value = item.partition("=")
+        key = key.strip()
+        if key in ("latency_ms", "error_rate"):
+            changes[key] = float(value)
+        elif key in ("body_bytes", "error_status"):
+            changes[key] = int(value)
+        elif key == "keep_alive":
+            changes[key] = value.strip().lower() in ("1", "true", "yes")
+        elif key == "latency_dist":
+            changes[key] = value.strip()
+        else:
+            raise ValueError(f"unknown --vhost key {key!r}")
+    return host.lower(), replace(base, **changes)  # type: ignore[arg-type]
+
+
+class Origin:
+    """
+    Stand-in HTTP/1.1 origin for benchmarks: answers every GET after a
+    sampled delay with a fixed-size body (or an error status), per-host
+    profiles selected by the Host header, keep-alive unless disabled.
+    GET /__stats returns {"requests": .., "connections": ..} as JSON.
+    """
+
+    def __init__(self, default: Profile, vhosts: Optional[Dict[str, Profile]] = None, seed: int = 0) -> None:
+        self.default = default
+        self.vhosts = dict(vhosts or {})
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.connections = 0
+        self._bodies: Dict[int, bytes] = {}
+
+    def _body(self, n: int) -> bytes:
+        b = self._bodies.get(n)
+        if b is None:
+            b = self._bodies[n] = (b"0123456789abcdef" * (n // 16 + 1))[:n]
+        return b
+
+    def profile(self, host_header: str) -> Profile:
+        host = host_header.rsplit(":", 1)[0] if not host_header.endswith("]") else host_header
+        return self.vhosts.get(host.lower(), self.default)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                parts = lines[0].split()
+                headers = {}
+                for line in lines[1:]:
+                    k, sep, v = line.partition(":")
+                    if sep:
+                        headers[k.strip().lower()] = v.strip()
+
+                if len(parts) >= 2 and parts[1] == "/__stats":
+                    body = json.dumps({"requests": self.requests, "connections": self.connections}).encode()
+                    status, keep = 200, False
+                else:
+                    self.requests += 1
+                    prof = self.profile(headers.get("host", ""))
+                    delay = prof.delay_s(self.rng)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    if prof.error_rate > 0 and self.rng.random() < prof.error_rate:
+                        status, body = prof.error_status, b"error"
+                    else:
+                        status, body = 200, self._body(prof.body_bytes)
+                    keep = (
+                        prof.keep_alive
+                        and headers.get("connection", "").lower() != "close"
+                        and (len(parts) < 3 or parts[2] != "HTTP/1.0")
+                    )
+                writer.write(
+                    (
+                        f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                        f"Content-Length: {len(body)}\r\n"
+                        "Content-Type: application/octet-stream\r\n"
+                        f"Connection: {'keep-alive' if keep else 'close'}\r\n\r\n"
+                    ).encode("latin-1")
+                    + body
+                )
+                await writer.drain()
+                if not keep:
+                    return
+        finally:
+            writer.close()
+
+
+async def serve(origin: Origin, hosts: List[str], port: int) -> Tuple[List[asyncio.AbstractServer], int]:
+    """Listen on every address in `hosts` with one shared port (port 0 picks a free one)."""
+    servers = [await asyncio.start_server(origin.handle, hosts[0], port, backlog=1024)]
+    port = servers[0].sockets[0].getsockname()[1]
+    for h in hosts[1:]:
+        servers.append(await asyncio.start_server(origin.handle, h, port, backlog=1024))
+    return servers, port
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Stand-in HTTP origin for fetch benchmarks")
+    ap.add_argument("--port", type=int, default=8000, help="0 picks a free port (printed on startup)")
+    ap.add_argument("--hosts", type=int, default=1, help="also listen on 127.0.0.2..N (virtual hosts)")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="mean response delay")
+    ap.add_argument("--latency-dist", choices=LATENCY_DISTS, default="fixed")
+    ap.add_argument("--body-bytes", type=int, default=1024)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction answered with --error-status")
+    ap.add_argument("--error-status", type=int, default=503)
+    ap.add_argument("--no-keep-alive", action="store_true", help="close the connection after each response")
+    ap.add_argument(
+        "--vhost", action="append", default=[], metavar="HOST:key=value,...",
+        help="per-host overrides, e.g. 127.0.0.2:latency_ms=200,error_rate=0.1",
+    )
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    default = Profile(
+        latency_ms=args.latency_ms,
+        latency_dist=args.latency_dist,
+        body_bytes=args.body_bytes,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        keep_alive=not args.no_keep_alive,
+    )
+    vhosts = dict(parse_profile(spec, default) for spec in args.vhost)
+    origin = Origin(default, vhosts, seed=args.seed)
+    hosts = [f"127.0.0.{i}" for i in range(1, max(1, args.hosts) + 1)]
+
+    async def _run() -> None:
+        servers, port = await serve(origin, hosts, args.port)
+        print(f"listening {port} hosts={','.join(hosts)}", flush=True)
+        await asyncio.gather(*(s.serve_forever() for s in servers))
+
+    try:
+        asyncio.run(_run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
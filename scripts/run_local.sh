@@ -4,11 +4,13 @@ set -euo pipefail
 # Defaults (can be overridden by env vars)
 HOST="${RATELIMMQ_HOST:-127.0.0.1}"
 PORT="${RATELIMMQ_PORT:-5555}"
+WORKERS="${RATELIMMQ_WORKERS:-1}"
 
 # Week 3 limiter knobs (optional)
 ENABLE_LIMITER="${RATELIMMQ_ENABLE_LIMITER:-0}"
 CAPACITY="${RATELIMMQ_CAPACITY:-5}"
 REFILL_RATE="${RATELIMMQ_REFILL_RATE:-1}"
+LIMITER_MAX_WAIT_MS="${RATELIMMQ_LIMITER_MAX_WAIT_MS:-0}"
 
 # Activate venv if present
 if [ -f ".venv/bin/activate" ]; then
@@ -19,12 +21,14 @@ fi
 export PYTHONPATH="${PYTHONPATH:-src}"
 export RATELIMMQ_HOST="$HOST"
 export RATELIMMQ_PORT="$PORT"
+export RATELIMMQ_WORKERS="$WORKERS"
 export RATELIMMQ_ENABLE_LIMITER="$ENABLE_LIMITER"
 export RATELIMMQ_CAPACITY="$CAPACITY"
 export RATELIMMQ_REFILL_RATE="$REFILL_RATE"
+export RATELIMMQ_LIMITER_MAX_WAIT_MS="$LIMITER_MAX_WAIT_MS"
 
-echo "Starting ratelimmq on ${HOST}:${PORT}"
-echo "Limiter: enabled=${ENABLE_LIMITER} capacity=${CAPACITY} refill_rate=${REFILL_RATE}"
+echo "Starting ratelimmq on ${HOST}:${PORT} (workers=${WORKERS})"
+echo "Limiter: enabled=${ENABLE_LIMITER} capacity=${CAPACITY} refill_rate=${REFILL_RATE} max_wait_ms=${LIMITER_MAX_WAIT_MS}"
 echo
 echo "Tip: connect with: nc ${HOST} ${PORT}"
 echo
@@ -1,7 +1,5 @@
 from __future__ import annotations
 
-import asyncio
-
 from ratelimmq.logging_config import configure_logging
 
 
@@ -9,10 +7,10 @@ def main() -> None:
     # Configure logging ONCE, right when the program starts
     configure_logging()
 
-    # Now run the server entrypoint
-    from ratelimmq.server import main as server_main
+    # Now run the server entrypoint (single process, or supervisor + workers)
+    from ratelimmq.server import run as server_run
 
-    asyncio.run(server_main())
+    server_run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+
+log = logging.getLogger("ratelimmq.breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# FetchResult.error prefix for requests refused by an open breaker.
+CIRCUIT_OPEN_ERROR = "CircuitOpen"
+
+
+class _Breaker:
+    __slots__ = ("state", "failures", "window", "opened_at", "probes", "probe_successes")
+
+    def __init__(self, window: int) -> None:
+        self.state = CLOSED
+        self.failures = 0  # consecutive
+        self.window: Deque[bool] = deque(maxlen=window)  # recent outcomes, True = failure
+        self.opened_at = 0.0
+        self.probes = 0  # half-open requests in flight
+        self.probe_successes = 0
+
+
+class HostBreakers:
+    """
+    One circuit breaker per host: closed -> open -> half-open -> closed.
+
+    - closed: requests pass; the breaker opens after `failure_threshold`
+      consecutive failures, or when at least `min_requests` of the last
+      `window` outcomes are recorded and `error_rate` of them failed
+    - open: requests are refused (allow() is False) for `reset_timeout_s`
+    - half-open: up to `half_open_probes` requests pass; `success_threshold`
+      successes close the breaker, any failure re-opens it
+
+    Transitions are logged and counted (opened, half_opened, closed), as are
+    refused requests (rejected). Hosts whose breaker is closed and idle are
+    forgotten, oldest first, past `max_hosts`.
+    """
+
+    def __init__(
+        self,
+        *,
+        failure_threshold: int = 5,
+        error_rate: float = 0.5,
+        window: int = 20,
+        min_requests: int = 10,
+        reset_timeout_s: float = 10.0,
+        half_open_probes: int = 1,
+        success_threshold: int = 1,
+        max_hosts: int = 10_000,
+    ) -> None:
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold must be >= 1")
+        if not 0.0 < error_rate <= 1.0:
+            raise ValueError("error_rate must be in (0, 1]")
+        if window < 1 or min_requests < 1:
+            raise ValueError("window and min_requests must be >= 1")
+        if reset_timeout_s < 0:
+            raise ValueError("reset_timeout_s must be >= 0")
+        if half_open_probes < 1 or success_threshold < 1:
+            raise ValueError("half_open_probes and success_threshold must be >= 1")
+        self.failure_threshold = int(failure_threshold)
+        self.error_rate = float(error_rate)
+        self.window = int(window)
+        self.min_requests = min(int(min_requests), self.window)
+        self.reset_timeout_s = float(reset_timeout_s)
+        self.half_open_probes = int(half_open_probes)
+        self.success_threshold = int(success_threshold)
+        self.max_hosts = int(max_hosts)
+        self._hosts: "OrderedDict[str, _Breaker]" = OrderedDict()
+
+        # Counters
+        self.opened = 0
+        self.half_opened = 0
+        self.closed = 0
+        self.rejected = 0
+
+    def state(self, host: str) -> str:
+        b = self._hosts.get(host)
+        return b.state if b is not None else CLOSED
+
+    def states(self) -> Dict[str, str]:
+        """Hosts whose breaker is not closed."""
+        return {h: b.state for h, b in self._hosts.items() if b.state != CLOSED}
+
+    def rejecting(self, host: str, now: Optional[float] = None) -> bool:
+        """
+        True while the host's breaker is open and still cooling down. Doesn't
+        change state, so callers can use it to skip queueing.
+        """
+        b = self._hosts.get(host)
+        if b is None or b.state != OPEN:
+            return False
+        t = time.monotonic() if now is None else float(now)
+        return t - b.opened_at < self.reset_timeout_s
+
+    def allow(self, host: str, now: Optional[float] = None) -> bool:
+        """May a request to `host` go out now? Every True must be followed by record()."""
+        b = self._hosts.get(host)
+        if b is None or b.state == CLOSED:
+            return True
+        t = time.monotonic() if now is None else float(now)
+        if b.state == OPEN:
+            if t - b.opened_at < self.reset_timeout_s:
+                self.rejected += 1
+                return False
+            self._transition(host, b, HALF_OPEN, t)
+        if b.probes < self.half_open_probes:
+            b.probes += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def record(self, host: str, ok: bool, now: Optional[float] = None) -> None:
+        """Report the outcome of a request that allow() let through."""
+        t = time.monotonic() if now is None else float(now)
+        b = self._hosts.get(host)
+        if b is None:
+            if ok:
+                return  # healthy hosts cost no memory until they fail
+            b = _Breaker(self.window)
+            self._hosts[host] = b
+            self._forget_healthy()
+        else:
+            self._hosts.move_to_end(host)
+
+        if b.state == HALF_OPEN:
+            b.probes = max(0, b.probes - 1)
+            if not ok:
+                self._transition(host, b, OPEN, t)
+            else:
+                b.probe_successes += 1
+                if b.probe_successes >= self.success_threshold:
+                    self._transition(host, b, CLOSED, t)
+            return
+        if b.state == OPEN:
+            return  # a straggler from before the breaker opened
+
+        b.window.append(not ok)
+        b.failures = 0 if ok else b.failures + 1
+        if not ok and (
+            b.failures >= self.failure_threshold
+            or (len(b.window) >= self.min_requests and sum(b.window) >= self.error_rate * len(b.window))
+        ):
+            self._transition(host, b, OPEN, t)
+
+    def abandon(self, host: str) -> None:
+        """A request allow() let through ended without an outcome (e.g. cancelled)."""
+        b = self._hosts.get(host)
+        if b is not None and b.state == HALF_OPEN:
+            b.probes = max(0, b.probes - 1)
+
+    def _transition(self, host: str, b: _Breaker, state: str, now: float) -> None:
+        log.warning(
+            "breaker_state",
+            extra={"host": host, "from": b.state, "to": state, "consecutive_failures": b.failures},
+        )
+        b.state = state
+        if state == OPEN:
+            self.opened += 1
+            b.opened_at = now
+            b.probes = 0
+        elif state == HALF_OPEN:
+            self.half_opened += 1
+            b.probes = 0
+            b.probe_successes = 0
+        else:
+            self.closed += 1
+            b.failures = 0
+            b.window.clear()
+
+    def _forget_healthy(self) -> None:
+        excess = len(self._hosts) - self.max_hosts
+        if excess <= 0:
+            return
+        for host in list(self._hosts)[:excess]:
+            if self._hosts[host].state == CLOSED:
+                del self._hosts[host]
@@ -0,0 +1,399 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+# Only plain successful responses are cached.
+CACHEABLE_STATUS = frozenset({200, 203})
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    status: int
+    body: bytes
+    stored_at: float
+    expires_at: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    def fresh(self, now: float) -> bool:
+        return now < self.expires_at
+
+    def validators(self) -> Dict[str, str]:
+        """Headers for a conditional GET (empty if the origin gave no validators)."""
+        h: Dict[str, str] = {}
+        if self.etag:
+            h["If-None-Match"] = self.etag
+        if self.last_modified:
+            h["If-Modified-Since"] = self.last_modified
+        return h
+
+
+def freshness(headers: Dict[str, str], default_ttl_s: float, now_wall: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds a response stays fresh, from Cache-Control max-age or Expires
+    (falling back to default_ttl_s). None means "do not store".
+    no-cache responses are stored but always revalidated (TTL 0). This is a
+    private cache, so the shared-cache s-maxage is ignored.
+    """
+    cc = {}
+    for part in headers.get("cache-control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            cc[name.lower()] = value.strip('"')
+    if "no-store" in cc:
+        return None
+    if "no-cache" in cc:
+        return 0.0
+    if "max-age" in cc:
+        try:
+            return max(0.0, float(cc["max-age"]))
+        except ValueError:
+            return 0.0
+    if "expires" in headers:
+        try:
+            expires = parsedate_to_datetime(headers["expires"]).timestamp()
+        except (TypeError, ValueError):
+            return 0.0
+        now_wall = time.time() if now_wall is None else now_wall
+        return max(0.0, expires - now_wall)
+    return default_ttl_s
+
+
+class ResponseCache:
+    """
+    LRU cache of GET response bodies for the fetch path.
+
+    - bounded by entry count and total body bytes; the least recently used
+      entry is evicted first, bodies over max_entry_bytes are never stored
+    - freshness from Cache-Control / Expires (else default_ttl_s); stale
+      entries with an ETag or Last-Modified are revalidated with a
+      conditional GET, so a 304 costs no body transfer
+    - disk_dir (optional): entries are also written there and read back on
+      a memory miss, so the cache survives restarts. The files are an LRU
+      bounded by disk_max_entries and disk_max_bytes; expired files that
+      can't be revalidated (no ETag / Last-Modified) are deleted when read
+
+    alookup() / astore() / arecord_not_modified() are the event-loop versions
+    used by fetch_one: disk reads and writes run in a worker thread.
+
+    Expiry uses time.monotonic() (pass `now` for tests); the disk tier stores
+    wall-clock expiry so it stays meaningful across processes.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_entries: int = 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_entry_bytes: int = 8 * 1024 * 1024,
+        default_ttl_s: float = 0.0,
+        disk_dir: Optional[str] = None,
+        disk_max_entries: int = 10_000,
+        disk_max_bytes: int = 256 * 1024 * 1024,
+    ) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be >= 1")
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self.max_entry_bytes = min(int(max_entry_bytes), self.max_bytes)
+        self.default_ttl_s = float(default_ttl_s)
+        self.disk_dir = disk_dir
+        self.disk_max_entries = max(1, int(disk_max_entries))
+        self.disk_max_bytes = max(1, int(disk_max_bytes))
+
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+
+        # Disk tier index: file path -> size, least recently used first.
+        # Updated from worker threads, hence the lock.
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._disk_lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._scan_disk()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0  # nothing usable cached, or a revalidation got a new body
+        self.revalidations = 0  # 304 Not Modified: cached body reused
+        self.stores = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self.disk_evictions = 0  # files deleted for the disk limits or expiry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    # --- lookups ---
+
+    def lookup(self, url: str, now: Optional[float] = None) -> Tuple[Optional[CacheEntry], bool]:
+        """
+        Returns (entry, fresh). A fresh entry counts as a hit; a missing one,
+        or a stale one without validators, as a miss. A stale entry that can
+        be revalidated is counted once the conditional GET returns: by
+        record_not_modified() (a revalidation) or record_miss().
+        """
+        t = time.monotonic() if now is None else float(now)
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        elif self.disk_dir:
+            entry = self._loaded(self._load(url, t))
+        return self._classify(entry, t)
+
+    async def alookup(self, url: str, now: Optional[float] = None) -> Tuple[Optional[CacheEntry], bool]:
+        """lookup() with the disk read in a worker thread."""
+        t = time.monotonic() if now is None else float(now)
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        elif self.disk_dir:
+            entry = self._loaded(await asyncio.to_thread(self._load, url, t))
+        return self._classify(entry, t)
+
+    def _loaded(self, entry: Optional[CacheEntry]) -> Optional[CacheEntry]:
+        if entry is not None:
+            self.disk_hits += 1
+            self._insert(entry)
+        return entry
+
+    def _classify(self, entry: Optional[CacheEntry], t: float) -> Tuple[Optional[CacheEntry], bool]:
+        if entry is not None and entry.fresh(t):
+            self.hits += 1
+            return entry, True
+        if entry is None or not entry.validators():
+            self.misses += 1
+        return entry, False
+
+    def record_miss(self) -> None:
+        """A stale entry's conditional GET returned a new body (or failed)."""
+        self.misses += 1
+
+    # --- updates ---
+
+    def store(
+        self,
+        url: str,
+        status: int,
+        headers: Dict[str, str],
+        body: bytes,
+        now: Optional[float] = None,
+    ) -> Optional[CacheEntry]:
+        """Cache a full response if its status and headers allow it."""
+        t = time.monotonic() if now is None else float(now)
+        entry, drop = self._store(url, status, headers, body, t)
+        if self.disk_dir:
+            if drop:
+                self._unlink(self._path(url))
+            elif entry is not None:
+                self._save(entry, t)
+        return entry
+
+    async def astore(
+        self,
+        url: str,
+        status: int,
+        headers: Dict[str, str],
+        body: bytes,
+        now: Optional[float] = None,
+    ) -> Optional[CacheEntry]:
+        """store() with the disk write in a worker thread."""
+        t = time.monotonic() if now is None else float(now)
+        entry, drop = self._store(url, status, headers, body, t)
+        if self.disk_dir:
+            if drop:
+                await asyncio.to_thread(self._unlink, self._path(url))
+            elif entry is not None:
+                await asyncio.to_thread(self._save, entry, t)
+        return entry
+
+    def _store(
+        self, url: str, status: int, headers: Dict[str, str], body: bytes, t: float
+    ) -> Tuple[Optional[CacheEntry], bool]:
+        """Memory-tier part of store(): (entry stored, disk copy must go)."""
+        if status not in CACHEABLE_STATUS or len(body) > self.max_entry_bytes:
+            return None, False
+        ttl = freshness(headers, self.default_ttl_s)
+        if ttl is None:
+            self._forget(url)
+            return None, True
+        etag = headers.get("etag")
+        last_modified = headers.get("last-modified")
+        if ttl <= 0 and not (etag or last_modified):
+            return None, False  # would be stale on arrival and can't be revalidated
+
+        entry = CacheEntry(
+            url=url,
+            status=status,
+            body=bytes(body),
+            stored_at=t,
+            expires_at=t + ttl,
+            etag=etag,
+            last_modified=last_modified,
+        )
+        self._insert(entry)
+        self.stores += 1
+        return entry, False
+
+    def record_not_modified(self, entry: CacheEntry, headers: Dict[str, str], now: Optional[float] = None) -> None:
+        """A conditional GET returned 304: extend the entry's freshness."""
+        t = time.monotonic() if now is None else float(now)
+        self._revalidated(entry, headers, t)
+        if self.disk_dir:
+            self._save(entry, t)
+
+    async def arecord_not_modified(
+        self, entry: CacheEntry, headers: Dict[str, str], now: Optional[float] = None
+    ) -> None:
+        """record_not_modified() with the disk write in a worker thread."""
+        t = time.monotonic() if now is None else float(now)
+        self._revalidated(entry, headers, t)
+        if self.disk_dir:
+            await asyncio.to_thread(self._save, entry, t)
+
+    def _revalidated(self, entry: CacheEntry, headers: Dict[str, str], t: float) -> None:
+        ttl = freshness(headers, self.default_ttl_s)
+        entry.expires_at = t + (ttl or 0.0)
+        entry.etag = headers.get("etag", entry.etag)
+        entry.last_modified = headers.get("last-modified", entry.last_modified)
+        self.revalidations += 1
+
+    def invalidate(self, url: str) -> None:
+        self._forget(url)
+        if self.disk_dir:
+            self._unlink(self._path(url))
+
+    def _forget(self, url: str) -> None:
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self._bytes -= len(entry.body)
+
+    def _insert(self, entry: CacheEntry) -> None:
+        old = self._entries.pop(entry.url, None)
+        if old is not None:
+            self._bytes -= len(old.body)
+        self._entries[entry.url] = entry
+        self._bytes += len(entry.body)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.body)
+            self.evictions += 1
+
+    # --- disk tier ---
+
+    def _path(self, url: str) -> str:
+        assert self.disk_dir
+        return os.path.join(self.disk_dir, hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def _save(self, entry: CacheEntry, now: float) -> None:
+        meta = {
+            "url": entry.url,
+            "status": entry.status,
+            "expires_wall": time.time() + (entry.expires_at - now),
+            "etag": entry.etag,
+            "last_modified": entry.last_modified,
+        }
+        path = self._path(entry.url)
+        tmp = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+        head = json.dumps(meta).encode("utf-8") + b"\n"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(head)
+                f.write(entry.body)
+            os.replace(tmp, path)
+        except OSError:
+            # The disk tier is best effort; the memory tier still has the entry.
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+        self._track(path, len(head) + len(entry.body))
+
+    def _load(self, url: str, now: float) -> Optional[CacheEntry]:
+        path = self._path(url)
+        try:
+            with open(path, "rb") as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url:
+            return None
+        remaining = float(meta["expires_wall"]) - time.time()
+        if remaining <= 0 and not (meta.get("etag") or meta.get("last_modified")):
+            # Expired and can't be revalidated: useless, delete it.
+            self._unlink(path)
+            with self._disk_lock:
+                self.disk_evictions += 1
+            return None
+        with self._disk_lock:
+            if path in self._files:
+                self._files.move_to_end(path)
+        return CacheEntry(
+            url=url,
+            status=int(meta["status"]),
+            body=body,
+            stored_at=now,
+            expires_at=now + remaining,
+            etag=meta.get("etag"),
+            last_modified=meta.get("last_modified"),
+        )
+
+    def _scan_disk(self) -> None:
+        # Rebuild the index from an existing directory, oldest first.
+        assert self.disk_dir
+        found = []
+        for de in os.scandir(self.disk_dir):
+            if not de.is_file():
+                continue
+            if ".tmp" in de.name:  # left behind by a crash mid-write
+                self._unlink(de.path)
+                continue
+            st = de.stat()
+            found.append((st.st_mtime, de.path, st.st_size))
+        for _, path, size in sorted(found):
+            self._files[path] = size
+            self._disk_bytes += size
+        self._evict_files()
+
+    def _track(self, path: str, size: int) -> None:
+        with self._disk_lock:
+            self._disk_bytes += size - self._files.pop(path, 0)
+            self._files[path] = size
+            self._evict_files()
+
+    def _evict_files(self) -> None:
+        while self._files and (len(self._files) > self.disk_max_entries or self._disk_bytes > self.disk_max_bytes):
+            path, size = self._files.popitem(last=False)
+            self._disk_bytes -= size
+            self.disk_evictions += 1
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def _unlink(self, path: str) -> None:
+        with self._disk_lock:
+            self._disk_bytes -= self._files.pop(path, 0)
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
@@ -1,12 +1,77 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from ratelimmq.breaker import HostBreakers
+from ratelimmq.cache import ResponseCache
+from ratelimmq.dispatcher import PoolLimits, run_pool
 from ratelimmq.fetcher import fetch_one, FetchResult
+from ratelimmq.httpclient import ConnectionPool
+from ratelimmq.resolver import DNSCache
+from ratelimmq.retry import RetryPolicy
+from ratelimmq.sinks import BodySink
+
+BACKENDS = ("thread", "asyncio")
+
 
 async def fetch_all(
     urls: Iterable[str],
     *,
     limits: PoolLimits = PoolLimits(),
     timeout_s: float = 10.0,
+    backend: str = "thread",
+    cache: Optional[ResponseCache] = None,
+    retry: Optional[RetryPolicy] = None,
+    breakers: Optional[HostBreakers] = None,
+    resolver: Optional[DNSCache] = None,
+    coalesce: Union[bool, Callable[[str], str]] = False,
+    max_body_bytes: Optional[int] = None,
+    stop_after_bytes: Optional[int] = None,
+    body_sink: Optional[Callable[[str], BodySink]] = None,
 ) -> List[FetchResult]:
-    async def _one(u: str) -> FetchResult:
-        return await fetch_one(u, timeout_s=timeout_s)
+    """
+    Fetch many URLs under the pool limits.
+
+    - backend="thread": urllib in worker threads (default)
+    - backend="asyncio": native HTTP/1.1 with keep-alive connections,
+      at most limits.per_host_concurrency open per host
+    - cache: optional ResponseCache shared by every fetch (see fetch_one)
+    - retry: optional RetryPolicy; retries hold the URL's host slot and take a
+      per-host rate token, so they count against limits like first attempts
+    - breakers: optional HostBreakers; URLs of a host whose breaker is open
+      fail at once with a "CircuitOpen" error instead of waiting for a slot
+    - resolver: optional DNSCache; host names are resolved once per TTL
+      instead of once per connection (both backends)
+    - coalesce: fetch duplicate URLs once while in flight and share the
+      FetchResult (True: exact match; or a key function like normalize_url)
+    - max_body_bytes / stop_after_bytes / body_sink: body size caps and
+      streaming sinks (see fetch_one); memory per fetch stays at one chunk
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}, got {backend!r}")
+
+    opts: Dict[str, Any] = dict(
+        timeout_s=timeout_s,
+        cache=cache,
+        retry=retry,
+        breakers=breakers,
+        max_body_bytes=max_body_bytes,
+        stop_after_bytes=stop_after_bytes,
+        body_sink=body_sink,
+    )
+
+    if backend == "thread":
+        async def _one(u: str) -> FetchResult:
+            return await fetch_one(u, resolver=resolver, **opts)
+
+        return await run_pool(urls, _one, limits=limits, breakers=breakers, coalesce=coalesce)
+
+    per_host = limits.per_host_concurrency
+    if limits.adaptive_per_host:
+        # The pool must not cap hosts below what the adaptive limiter allows.
+        per_host = max(per_host, limits.max_per_host_concurrency)
+    async with ConnectionPool(per_host=per_host, resolver=resolver) as pool:
+        async def _pooled(u: str) -> FetchResult:
+            return await fetch_one(u, pool=pool, **opts)
 
-    return await run_pool(urls, _one, limits=limits)
+        return await run_pool(urls, _pooled, limits=limits, breakers=breakers, coalesce=coalesce)
@@ -1,15 +1,27 @@
 from __future__ import annotations
 
 import asyncio
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any
 
-from ratelimmq.limiter import TokenBucket
+from ratelimmq.cache import ResponseCache
+from ratelimmq.limiter import KeyedTokenBuckets, TokenBucket
+from ratelimmq.shared_limiter import SharedTokenBucket
+from ratelimmq.stats import ServerStats
 
 
 @dataclass
 class Context:
     stop_event: asyncio.Event
-    cache: Any | None = None
+    cache: ResponseCache | None = None
     queue: Any | None = None
-    limiter: TokenBucket | None = None
+    limiter: TokenBucket | SharedTokenBucket | None = None
+    # >0: queue a limited command for up to this long instead of rejecting it
+    limiter_max_wait_s: float = 0.0
+    # Optional per-client buckets, keyed by "peer" address or AUTH "client" id
+    client_limiter: KeyedTokenBuckets | None = None
+    limit_by: str = "peer"
+    # Tokens charged per command (default 1; 0 = free)
+    command_costs: dict[str, float] = field(default_factory=dict)
+    # Live counters behind the STATS command
+    stats: ServerStats = field(default_factory=ServerStats)
@@ -1,12 +1,38 @@
 from __future__ import annotations
 
 import asyncio
-from dataclasses import dataclass
-from typing import Awaitable, Callable, Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
-from urllib.parse import urlparse
+import functools
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+from urllib.parse import urlparse, urlunparse
+
+from ratelimmq.breaker import HostBreakers
+from ratelimmq.limiter import KeyedRateLimiter
+from ratelimmq.metrics import POOL_METRICS, PoolMetrics
+from ratelimmq.retry import retry_gate
 
 T = TypeVar("T")
 
+log = logging.getLogger("ratelimmq.dispatcher")
+
 
 def host_key(url: str) -> str:
     """
@@ -20,77 +46,565 @@ def host_key(url: str) -> str:
     return host or "unknown"
 
 
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of a URL for coalescing duplicates:
+    lower-case scheme and host, default port and fragment dropped, empty path -> "/".
+    Examples:
+      - HTTP://Example.com:80 -> http://example.com/
+      - https://example.com/a?x=1#top -> https://example.com/a?x=1
+    """
+    p = urlparse(url.strip())
+    scheme = p.scheme.lower()
+    host = (p.hostname or "").lower()
+    if ":" in host:
+        host = f"[{host}]"  # IPv6 literal
+    try:
+        port = p.port
+    except ValueError:
+        return url
+    netloc = host if port is None or port == _DEFAULT_PORTS.get(scheme) else f"{host}:{port}"
+    if p.username is not None:
+        userinfo = p.netloc.rpartition("@")[0]
+        netloc = f"{userinfo}@{netloc}"
+    return urlunparse((scheme, netloc, p.path or "/", p.params, p.query, ""))
+
+
 @dataclass(frozen=True)
 class PoolLimits:
     total_concurrency: int = 50
     per_host_concurrency: int = 10
 
+    # Optional request-rate limits (requests/second per host).
+    # per_host_rate=None means no rate limit unless a host has an override;
+    # an override of None exempts that host.
+    per_host_rate: Optional[float] = None
+    per_host_burst: float = 1.0
+    host_rates: Optional[Mapping[str, Optional[float]]] = None
 
-class _HostSemaphores:
+    # Adaptive per-host concurrency (AIMD on latency and errors). When on,
+    # per_host_concurrency is each host's starting limit and the limit moves
+    # between min_per_host_concurrency and max_per_host_concurrency.
+    adaptive_per_host: bool = False
+    min_per_host_concurrency: int = 1
+    max_per_host_concurrency: int = 100
+
+    def rate_limiter(self) -> Optional[KeyedRateLimiter]:
+        if self.per_host_rate is None and not self.host_rates:
+            return None
+        return KeyedRateLimiter(self.per_host_rate, self.per_host_burst, self.host_rates)
+
+
+@dataclass
+class PoolStats:
     """
-    Lazily creates an asyncio.Semaphore per host.
+    Live counters for one pool run. Pass an instance to stream_pool/run_pool
+    to observe them while (or after) the pool runs.
     """
+    hosts_active: int = 0   # hosts with a holder or waiter right now
+    hosts_created: int = 0  # per-host semaphores created (including re-creations)
+    hosts_evicted: int = 0  # per-host semaphores dropped once idle
+
+    # Adaptive mode only: current concurrency limit per host, and how often
+    # limits were raised / cut.
+    host_limits: Dict[str, int] = field(default_factory=dict)
+    limit_increases: int = 0
+    limit_decreases: int = 0
+
+    # Coalescing only: results shared with an identical fetch already in flight.
+    coalesced: int = 0
+
+
+class _HostSlot:
+    __slots__ = ("sem", "refs")
+
     def __init__(self, per_host: int) -> None:
+        self.sem = asyncio.Semaphore(per_host)
+        self.refs = 0  # holders + waiters
+
+
+class _HostSemaphores:
+    """
+    Per-host semaphores, created on first use and dropped as soon as no task
+    holds or waits on them, so memory tracks active hosts rather than every
+    host ever seen.
+
+    No lock: everything runs on the event loop, and the lookup/create/refcount
+    steps never await, so they can't interleave.
+    """
+    def __init__(self, per_host: int, stats: Optional[PoolStats] = None) -> None:
         self._per_host = max(1, int(per_host))
-        self._sems: Dict[str, asyncio.Semaphore] = {}
-        self._lock = asyncio.Lock()
+        self._slots: Dict[str, _HostSlot] = {}
+        self.stats = stats if stats is not None else PoolStats()
 
-    async def get(self, host: str) -> asyncio.Semaphore:
-        async with self._lock:
-            sem = self._sems.get(host)
-            if sem is None:
-                sem = asyncio.Semaphore(self._per_host)
-                self._sems[host] = sem
-            return sem
+    def __len__(self) -> int:
+        return len(self._slots)
 
+    async def acquire(self, host: str) -> None:
+        slot = self._slots.get(host)
+        if slot is None:
+            slot = _HostSlot(self._per_host)
+            self._slots[host] = slot
+            self.stats.hosts_created += 1
+            self.stats.hosts_active = len(self._slots)
+        slot.refs += 1
+        try:
+            await slot.sem.acquire()
+        except BaseException:
+            self._unref(host, slot)
+            raise
 
-async def run_pool(
-    urls: Iterable[str],
+    def release(self, host: str) -> None:
+        slot = self._slots[host]
+        slot.sem.release()
+        self._unref(host, slot)
+
+    def _unref(self, host: str, slot: _HostSlot) -> None:
+        slot.refs -= 1
+        if slot.refs == 0:
+            del self._slots[host]
+            self.stats.hosts_evicted += 1
+            self.stats.hosts_active = len(self._slots)
+
+
+class _AdaptiveHost:
+    __slots__ = ("limit", "in_flight", "waiters", "credit", "min_latency", "avg_latency", "last_cut")
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future[None]] = deque()
+        self.credit = 0  # healthy saturated completions since the last +1
+        self.min_latency = float("inf")
+        self.avg_latency = 0.0  # EWMA
+        self.last_cut = float("-inf")
+
+
+class _AdaptiveHostLimits:
+    """
+    Per-host concurrency limits that adapt (AIMD) to each host's health.
+
+    - additive increase: once a host has run `limit` healthy requests while
+      using its whole limit, the limit grows by 1
+    - multiplicative decrease: a failed result (exception or ok=False), or a
+      smoothed latency over LATENCY_TOLERANCE x the host's best recent
+      latency, cuts the limit by DECREASE_FACTOR, at most once per observed
+      latency so one burst of slow responses counts once
+    - limits stay within [min_limit, max_limit]
+
+    Same acquire/release interface as _HostSemaphores. Learned limits outlive
+    idle periods: idle hosts are only forgotten (oldest first) past
+    MAX_REMEMBERED_HOSTS.
+    """
+
+    LATENCY_TOLERANCE = 2.0
+    EWMA_WEIGHT = 0.2
+    DECREASE_FACTOR = 0.7
+    # The latency baseline creeps up by this factor per sample, so a host
+    # that got permanently slower isn't throttled forever.
+    BASELINE_DRIFT = 1.01
+    MAX_REMEMBERED_HOSTS = 10_000
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, stats: Optional[PoolStats] = None) -> None:
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.initial = min(self.max_limit, max(self.min_limit, int(initial)))
+        self._hosts: "OrderedDict[str, _AdaptiveHost]" = OrderedDict()
+        self.stats = stats if stats is not None else PoolStats()
+        self._busy = 0
+
+    def __len__(self) -> int:
+        return len(self._hosts)
+
+    def limit(self, host: str) -> Optional[int]:
+        st = self._hosts.get(host)
+        return st.limit if st is not None else None
+
+    def _host(self, host: str) -> _AdaptiveHost:
+        st = self._hosts.get(host)
+        if st is None:
+            st = _AdaptiveHost(self.initial)
+            self._hosts[host] = st
+            self.stats.hosts_created += 1
+            self.stats.host_limits[host] = st.limit
+            self._forget_idle()
+        else:
+            self._hosts.move_to_end(host)
+        return st
+
+    def _set_busy(self, st: _AdaptiveHost, delta: int) -> None:
+        before = st.in_flight + len(st.waiters)
+        if before == 0 and delta > 0:
+            self._busy += 1
+        elif before + delta == 0 and delta < 0:
+            self._busy -= 1
+        self.stats.hosts_active = self._busy
+
+    async def acquire(self, host: str) -> None:
+        st = self._host(host)
+        if st.in_flight < st.limit and not st.waiters:
+            self._set_busy(st, 1)
+            st.in_flight += 1
+            return
+        fut: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._set_busy(st, 1)
+        st.waiters.append(fut)
+        try:
+            await fut
+        except BaseException:
+            if fut.done() and not fut.cancelled():
+                # Woken and cancelled in the same step: hand the slot on.
+                self.release(host)
+            else:
+                st.waiters.remove(fut)
+                self._set_busy(st, -1)
+            raise
+
+    def release(self, host: str) -> None:
+        st = self._hosts[host]
+        self._set_busy(st, -1)
+        st.in_flight -= 1
+        self._wake(st)
+
+    def _wake(self, st: _AdaptiveHost) -> None:
+        # Woken waiters already count as in flight (they keep their busy ref).
+        while st.waiters and st.in_flight < st.limit:
+            fut = st.waiters.popleft()
+            st.in_flight += 1
+            fut.set_result(None)
+
+    def record(self, host: str, ok: bool, latency_s: float, now: Optional[float] = None) -> None:
+        """Feed one finished request (call before release())."""
+        st = self._hosts.get(host)
+        if st is None:
+            return
+        t = time.monotonic() if now is None else now
+        st.min_latency = min(latency_s, st.min_latency * self.BASELINE_DRIFT)
+        if st.avg_latency == 0.0:
+            st.avg_latency = latency_s
+        else:
+            st.avg_latency += self.EWMA_WEIGHT * (latency_s - st.avg_latency)
+
+        if not ok or st.avg_latency > st.min_latency * self.LATENCY_TOLERANCE:
+            st.credit = 0
+            if t - st.last_cut >= latency_s and st.limit > self.min_limit:
+                st.last_cut = t
+                self._set_limit(host, st, max(self.min_limit, int(st.limit * self.DECREASE_FACTOR)))
+            return
+
+        # Only grow when the limit is what's holding the host back.
+        if st.in_flight >= st.limit and st.limit < self.max_limit:
+            st.credit += 1
+            if st.credit >= st.limit:
+                st.credit = 0
+                self._set_limit(host, st, st.limit + 1)
+
+    def _set_limit(self, host: str, st: _AdaptiveHost, limit: int) -> None:
+        if limit > st.limit:
+            self.stats.limit_increases += 1
+        elif limit < st.limit:
+            self.stats.limit_decreases += 1
+        else:
+            return
+        log.debug("host_limit", extra={"host": host, "old": st.limit, "new": limit})
+        st.limit = limit
+        self.stats.host_limits[host] = limit
+        self._wake(st)
+
+    def _forget_idle(self) -> None:
+        if len(self._hosts) <= self.MAX_REMEMBERED_HOSTS:
+            return
+        for host in list(self._hosts)[: len(self._hosts) - self.MAX_REMEMBERED_HOSTS]:
+            st = self._hosts[host]
+            if st.in_flight == 0 and not st.waiters:
+                del self._hosts[host]
+                self.stats.host_limits.pop(host, None)
+                self.stats.hosts_evicted += 1
+
+
+class _Failure:
+    __slots__ = ("exc",)
+
+    def __init__(self, exc: BaseException) -> None:
+        self.exc = exc
+
+
+_WORKER_DONE = object()
+
+
+async def stream_pool(
+    urls: Union[Iterable[str], AsyncIterable[str]],
     fetch_one: Callable[[str], Awaitable[T]],
     *,
     limits: PoolLimits = PoolLimits(),
-) -> List[T]:
+    queue_size: Optional[int] = None,
+    with_index: bool = False,
+    stats: Optional[PoolStats] = None,
+    breakers: Optional[HostBreakers] = None,
+    coalesce: Union[bool, Callable[[str], str]] = False,
+    metrics: Optional[PoolMetrics] = POOL_METRICS,
+) -> AsyncIterator[Any]:
     """
-    Run a worker pool that:
-      - caps total in-flight fetches (global semaphore)
-      - caps in-flight fetches per host (per-host semaphore)
+    Streaming worker pool. Same caps (and per-host rate limits) as run_pool, but:
+      - pulls URLs lazily from a sync or async iterable
+      - holds at most `queue_size` pending URLs and `queue_size` finished
+        results (default: 2 * total_concurrency), so memory stays flat no
+        matter how long the input is and a slow consumer stalls the producer
+      - yields results in completion order as soon as they are ready,
+        or (index, result) pairs if with_index=True
 
-    Returns results in the same order as input URLs.
+    Pass a PoolStats to observe live counters (with limits.adaptive_per_host,
+    stats.host_limits shows each host's current concurrency limit).
+
+    breakers: URLs whose host breaker is open skip the concurrency slots and
+    rate tokens and go straight to fetch_one, which must consult the same
+    HostBreakers and fail fast (fetcher.fetch_one(breakers=...) does).
+
+    coalesce: single-flight duplicate URLs. While a URL is in flight, later
+    occurrences take no slot or rate token and don't call fetch_one; they
+    get the same result object when it finishes (stats.coalesced counts
+    them). True matches URLs exactly; pass a key function (e.g.
+    normalize_url) to match equivalent spellings.
+
+    metrics: queue depth, in-flight (total and per host), slot wait time,
+    coalesced and breaker-skipped URLs go to this PoolMetrics (the default
+    registry's unless given; None turns them off).
+
+    If the input iterable or fetch_one raises, the exception is re-raised
+    from the iterator and all outstanding work is cancelled (a CancelledError
+    escaping fetch_one while the pool itself is not cancelled is re-raised as
+    RuntimeError). Breaking out of
+    the loop (or calling aclose()) also cancels outstanding work.
     """
-    urls_list = list(urls)
-    out: List[Optional[T]] = [None] * len(urls_list)
+    n_workers = max(1, int(limits.total_concurrency))
+    maxsize = max(1, int(queue_size)) if queue_size is not None else 2 * n_workers
 
-    total_sem = asyncio.Semaphore(max(1, int(limits.total_concurrency)))
-    host_sems = _HostSemaphores(limits.per_host_concurrency)
+    total_sem = asyncio.Semaphore(n_workers)
+    host_sems: Union[_HostSemaphores, _AdaptiveHostLimits]
+    if limits.adaptive_per_host:
+        host_sems = _AdaptiveHostLimits(
+            limits.per_host_concurrency,
+            limits.min_per_host_concurrency,
+            limits.max_per_host_concurrency,
+            stats,
+        )
+    else:
+        host_sems = _HostSemaphores(limits.per_host_concurrency, stats)
+    adaptive = host_sems if isinstance(host_sems, _AdaptiveHostLimits) else None
+    rate_limiter = limits.rate_limiter()
+    pool_stats = host_sems.stats
 
-    q: asyncio.Queue[Tuple[int, str]] = asyncio.Queue()
-    for i, u in enumerate(urls_list):
-        q.put_nowait((i, u))
+    coalesce_key: Optional[Callable[[str], str]]
+    if callable(coalesce):
+        coalesce_key = coalesce
+    else:
+        coalesce_key = (lambda u: u) if coalesce else None
+    # key -> input indices waiting on the fetch in flight for that key
+    in_flight: Dict[str, List[int]] = {}
+    queued = 0  # URLs in in_q, for the queue depth gauge
+
+    in_q: asyncio.Queue[Optional[Tuple[int, str]]] = asyncio.Queue(maxsize)
+    out_q: asyncio.Queue[Any] = asyncio.Queue(maxsize)
+
+    async def enqueue(i: int, u: str) -> None:
+        nonlocal queued
+        await in_q.put((i, u))
+        if metrics is not None:
+            queued += 1
+            metrics.queue_depth.inc()
+
+    async def producer() -> None:
+        try:
+            i = 0
+            if hasattr(urls, "__aiter__"):
+                async for u in urls:  # type: ignore[union-attr]
+                    await enqueue(i, u)
+                    i += 1
+            else:
+                for u in urls:  # type: ignore[union-attr]
+                    await enqueue(i, u)
+                    i += 1
+        except Exception as e:
+            await out_q.put(_Failure(e))
+            return
+        for _ in range(n_workers):
+            await in_q.put(None)
 
     async def worker() -> None:
+        try:
+            await work()
+        finally:
+            # Unless the pool itself is shutting down (consumer gone), always
+            # tell the consumer this worker is finished, or it waits forever.
+            task = asyncio.current_task()
+            if task is None or not task.cancelling():
+                await out_q.put(_WORKER_DONE)
+
+    async def work() -> None:
+        nonlocal queued
         while True:
-            try:
-                i, u = q.get_nowait()
-            except asyncio.QueueEmpty:
+            item = await in_q.get()
+            if item is None:
                 return
+            i, u = item
+            if metrics is not None:
+                queued -= 1
+                metrics.queue_depth.dec()
 
-            h = host_key(u)
-            host_sem = await host_sems.get(h)
+            key = None
+            if coalesce_key is not None:
+                key = coalesce_key(u)
+                followers = in_flight.get(key)
+                if followers is not None:
+                    followers.append(i)
+                    pool_stats.coalesced += 1
+                    if metrics is not None:
+                        metrics.coalesced.inc()
+                    continue
+                in_flight[key] = []
 
-            # Acquire both limits. Always release in finally.
-            await total_sem.acquire()
-            await host_sem.acquire()
             try:
-                out[i] = await fetch_one(u)
-            finally:
-                host_sem.release()
-                total_sem.release()
-                q.task_done()
-
-    # Worker count: enough to keep the pool busy, but not huge.
-    n_workers = min(len(urls_list), max(1, int(limits.total_concurrency)))
-    tasks = [asyncio.create_task(worker()) for _ in range(n_workers)]
-    await asyncio.gather(*tasks)
+                h = host_key(u)
+
+                if breakers is not None and breakers.rejecting(h):
+                    if metrics is not None:
+                        metrics.circuit_skips.inc()
+                    res = await fetch_one(u)
+                    await _emit(i, key, res)
+                    continue
+
+                # Host slot, then the rate token (so request starts, not queue
+                # entries, follow the rate), then the global slot: a host that
+                # is waiting for its rate never holds global capacity.
+                # Always release in finally.
+                waiting_since = time.monotonic()
+                await host_sems.acquire(h)
+                try:
+                    if rate_limiter is not None:
+                        await rate_limiter.acquire(h)
+                    await total_sem.acquire()
+                except BaseException:
+                    host_sems.release(h)
+                    raise
+                if metrics is not None:
+                    host_gauge = metrics.host_in_flight.labels(h)
+                    host_gauge.inc()
+                    metrics.in_flight.inc()
+                try:
+                    started = time.monotonic()
+                    if metrics is not None:
+                        metrics.slot_wait.observe(started - waiting_since)
+                    ok = False
+                    try:
+                        if rate_limiter is not None:
+                            # Retries inside fetch_one take a rate token too.
+                            gate = retry_gate.set(functools.partial(rate_limiter.acquire, h))
+                            try:
+                                res = await fetch_one(u)
+                            finally:
+                                retry_gate.reset(gate)
+                        else:
+                            res = await fetch_one(u)
+                        ok = bool(getattr(res, "ok", True))
+                    finally:
+                        if adaptive is not None:
+                            adaptive.record(h, ok, time.monotonic() - started)
+                finally:
+                    if metrics is not None:
+                        host_gauge.dec()
+                        metrics.in_flight.dec()
+                    host_sems.release(h)
+                    total_sem.release()
+            except Exception as e:
+                if key is not None:
+                    in_flight.pop(key, None)
+                await out_q.put(_Failure(e))
+                return
+            except asyncio.CancelledError as e:
+                task = asyncio.current_task()
+                if task is not None and task.cancelling():
+                    raise
+                # fetch_one was cancelled from the inside (not this worker):
+                # a failure for this URL, not a reason to hang the pool.
+                if key is not None:
+                    in_flight.pop(key, None)
+                err = RuntimeError(f"fetch of {u!r} was cancelled")
+                err.__cause__ = e
+                await out_q.put(_Failure(err))
+                return
+
+            await _emit(i, key, res)
+
+    async def _emit(i: int, key: Optional[str], res: Any) -> None:
+        await out_q.put((i, res))
+        if key is not None:
+            for j in in_flight.pop(key):
+                await out_q.put((j, res))
+
+    tasks = [asyncio.create_task(producer())]
+    tasks.extend(asyncio.create_task(worker()) for _ in range(n_workers))
+
+    try:
+        done = 0
+        while done < n_workers:
+            item = await out_q.get()
+            if item is _WORKER_DONE:
+                done += 1
+                continue
+            if isinstance(item, _Failure):
+                raise item.exc
+            yield item if with_index else item[1]
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if metrics is not None and queued:
+            metrics.queue_depth.dec(queued)  # left unprocessed
+
+
+async def run_pool(
+    urls: Iterable[str],
+    fetch_one: Callable[[str], Awaitable[T]],
+    *,
+    limits: PoolLimits = PoolLimits(),
+    stats: Optional[PoolStats] = None,
+    breakers: Optional[HostBreakers] = None,
+    coalesce: Union[bool, Callable[[str], str]] = False,
+    metrics: Optional[PoolMetrics] = POOL_METRICS,
+) -> List[T]:
+    """
+    Run a worker pool that:
+      - caps total in-flight fetches (global semaphore)
+      - caps in-flight fetches per host (per-host semaphore)
+      - optionally caps request starts per host per second (limits.per_host_rate,
+        limits.host_rates), woken from one shared deadline heap
+      - optionally lets URLs of hosts with an open circuit breaker skip the
+        queue (see stream_pool)
+      - optionally coalesces duplicate URLs into one fetch (coalesce=True or a
+        key function such as normalize_url; see stream_pool)
+      - records pool metrics (queue depth, in-flight, slot waits) in `metrics`
+
+    Returns results in the same order as input URLs.
+    Built on stream_pool; use that directly for large inputs.
+    """
+    out: List[Optional[T]] = []
+
+    async for i, res in stream_pool(
+        urls,
+        fetch_one,
+        limits=limits,
+        with_index=True,
+        stats=stats,
+        breakers=breakers,
+        coalesce=coalesce,
+        metrics=metrics,
+    ):
+        if i >= len(out):
+            out.extend([None] * (i + 1 - len(out)))
+        out[i] = res
 
     # mypy/typing guard: all should be filled
     return [x for x in out if x is not None]
@@ -1,12 +1,23 @@
 from __future__ import annotations
 
 import asyncio
+import http.client
 import logging
 import time
+import urllib.error
 import urllib.request
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
 
+from ratelimmq.breaker import CIRCUIT_OPEN_ERROR, HostBreakers
+from ratelimmq.cache import ResponseCache
+from ratelimmq.dispatcher import host_key
+from ratelimmq.httpclient import READ_CHUNK_BYTES, ConnectionPool
+from ratelimmq.metrics import FETCH_METRICS, FetchMetrics, fetch_outcome
+from ratelimmq.resolver import DNSCache
+from ratelimmq.retry import RetryPolicy, parse_retry_after, wait_for_retry
+from ratelimmq.sinks import BodySink, BodyTooLarge
 
 log = logging.getLogger("ratelimmq.fetcher")
 
@@ -22,6 +33,13 @@ class FetchResult:
 
     # OPTIONAL (defaults) must come last
     error: Optional[str] = None
+    # "hit" | "revalidated" | "miss" when fetched through a ResponseCache
+    cache: Optional[str] = None
+    attempts: int = 1
+    # True when stop_after_bytes cut the body short
+    truncated: bool = False
+    # The body_sink of the last attempt (e.g. a HashSink to read the digest from)
+    sink: Optional[BodySink] = field(default=None, compare=False, repr=False)
 
     # Backwards-compat aliases (older code/tests may use these)
     @property
@@ -33,46 +51,434 @@ class FetchResult:
         return self.bytes_read
 
 
-def _fetch_blocking(url: str, timeout_s: float) -> tuple[bool, Optional[int], int, Optional[str]]:
+@dataclass
+class _Fetched:
+    ok: bool
+    status_code: Optional[int]
+    bytes_read: int
+    error: Optional[str] = None
+    headers: Dict[str, str] = field(default_factory=dict)
+    # Only collected when the caller wants to cache it
+    body: Optional[bytes] = None
+    # Exception class behind `error` (None for HTTP status failures)
+    exc_type: Optional[type] = None
+    attempts: int = 1
+    truncated: bool = False
+    sink: Optional[BodySink] = None
+
+
+@dataclass(frozen=True)
+class _BodySpec:
+    keep_body: int = 0  # collect bodies up to this size (for the cache)
+    max_body_bytes: Optional[int] = None
+    stop_after_bytes: Optional[int] = None
+    sink: Optional[Callable[[str], BodySink]] = None
+
+
+class _Body:
+    """
+    One attempt's body consumer: applies the size caps, tees chunks into the
+    caller's sink and (up to keep_body bytes) a buffer for the cache.
+    feed() returns False once reading should stop.
+    """
+
+    def __init__(self, spec: _BodySpec, url: str) -> None:
+        self.spec = spec
+        self.sink = spec.sink(url) if spec.sink is not None else None
+        self.nbytes = 0
+        self.too_large = False
+        self.truncated = False
+        self._buf: Optional[bytearray] = bytearray() if spec.keep_body > 0 else None
+
+    def feed(self, chunk: bytes) -> bool:
+        spec = self.spec
+        if spec.stop_after_bytes is not None and self.nbytes + len(chunk) > spec.stop_after_bytes:
+            chunk = chunk[: spec.stop_after_bytes - self.nbytes]
+            self.truncated = True
+        if spec.max_body_bytes is not None and self.nbytes + len(chunk) > spec.max_body_bytes:
+            self.too_large = True
+            return False
+        self.nbytes += len(chunk)
+        if self.sink is not None and chunk:
+            self.sink.write(chunk)
+        if self._buf is not None:
+            if len(self._buf) + len(chunk) > spec.keep_body:
+                self._buf = None
+            else:
+                self._buf += chunk
+        return not self.truncated
+
+    def kept(self) -> Optional[bytes]:
+        """The whole body, if it was complete and small enough to keep."""
+        if self._buf is None or self.truncated or self.too_large:
+            return None
+        return bytes(self._buf)
+
+    def close(self) -> None:
+        if self.sink is not None:
+            self.sink.close()
+
+
+def _pinned(conn_cls: Any, pin_host: str, addr: str) -> Callable[..., http.client.HTTPConnection]:
+    """
+    Connection factory that dials `addr` for `pin_host` (the URL's host[:port])
+    instead of resolving it. Any other host, e.g. a redirect target or a
+    proxy, is connected to normally.
+    """
+
+    def factory(host: str, **kw: Any) -> http.client.HTTPConnection:
+        conn = conn_cls(host, **kw)
+        if host.lower() != pin_host:
+            return conn
+        create = conn._create_connection
+        conn._create_connection = lambda address, *a, **k: create((addr, address[1]), *a, **k)
+        return conn
+
+    return factory
+
+
+class _PinnedHTTPHandler(urllib.request.HTTPHandler):
+    def __init__(self, host: str, addr: str) -> None:
+        super().__init__()
+        self._host = host
+        self._addr = addr
+
+    def http_open(self, req: urllib.request.Request) -> Any:
+        return self.do_open(_pinned(http.client.HTTPConnection, self._host, self._addr), req)
+
+
+class _PinnedHTTPSHandler(urllib.request.HTTPSHandler):
+    def __init__(self, host: str, addr: str) -> None:
+        super().__init__()
+        self._host = host
+        self._addr = addr
+
+    def https_open(self, req: urllib.request.Request) -> Any:
+        # TLS still verifies the certificate against the URL's host name.
+        pinned = _pinned(http.client.HTTPSConnection, self._host, self._addr)
+        return self.do_open(pinned, req, context=self._context)
+
+
+def _fetch_blocking(
+    url: str,
+    timeout_s: float,
+    headers: Optional[Dict[str, str]],
+    body: _Body,
+    addr: Optional[str] = None,
+) -> _Fetched:
     """
     Blocking HTTP GET using urllib (runs in a thread via asyncio.to_thread).
-    Returns: (ok, status_code, bytes_read, error_str)
+    The body is read in READ_CHUNK_BYTES slices and fed to `body`. With
+    `addr` the connection to the URL's own host goes to that (already
+    resolved) address; redirects to other hosts resolve as usual.
     """
     try:
-        req = urllib.request.Request(url, headers={"User-Agent": "ratelimmq/1.0"})
-        with urllib.request.urlopen(req, timeout=timeout_s) as resp:
+        req = urllib.request.Request(url, headers={"User-Agent": "ratelimmq/1.0", **(headers or {})})
+        if addr is None:
+            opener = urllib.request.urlopen
+        else:
+            host = req.host.lower()
+            opener = urllib.request.build_opener(_PinnedHTTPHandler(host, addr), _PinnedHTTPSHandler(host, addr)).open
+        with opener(req, timeout=timeout_s) as resp:
             status_code = getattr(resp, "status", None)
-            body = resp.read()
-            return True, status_code, len(body), None
+            while True:
+                chunk = resp.read(READ_CHUNK_BYTES)
+                if not chunk or not body.feed(chunk):
+                    break
+            return _Fetched(
+                True,
+                status_code,
+                body.nbytes,
+                headers={k.lower(): v for k, v in resp.headers.items()},
+                body=body.kept(),
+            )
+    except urllib.error.HTTPError as e:
+        hdrs = {k.lower(): v for k, v in e.headers.items()} if e.headers is not None else {}
+        if e.code == 304:
+            # Conditional GET: the cached copy is still valid.
+            return _Fetched(True, 304, 0, headers=hdrs)
+        return _Fetched(False, e.code, 0, f"{type(e).__name__}: {e}", headers=hdrs)
+    except urllib.error.URLError as e:
+        # URLError wraps the socket error (refused, reset, timed out, ...).
+        cause = e.reason if isinstance(e.reason, BaseException) else e
+        return _Fetched(False, None, 0, f"{type(e).__name__}: {e}", exc_type=type(cause))
     except Exception as e:
-        return False, None, 0, f"{type(e).__name__}: {e}"
+        return _Fetched(False, None, 0, f"{type(e).__name__}: {e}", exc_type=type(e))
 
 
-async def fetch_one(url: str, *, timeout_s: float = 10.0) -> FetchResult:
+async def _fetch_pooled(
+    pool: ConnectionPool,
+    url: str,
+    timeout_s: float,
+    headers: Optional[Dict[str, str]],
+    body: _Body,
+) -> _Fetched:
     """
-    Async wrapper around a blocking urllib fetch.
+    Native asyncio HTTP/1.1 GET over a keep-alive connection pool.
+    The body is fed to `body` chunk by chunk as it arrives.
+    """
+    try:
+        resp = await pool.request(url, timeout_s=timeout_s, headers=headers, on_chunk=body.feed)
+    except asyncio.TimeoutError:
+        return _Fetched(False, None, 0, f"TimeoutError: timed out after {timeout_s}s", exc_type=TimeoutError)
+    except Exception as e:
+        return _Fetched(False, None, 0, f"{type(e).__name__}: {e}", exc_type=type(e))
+
+    if resp.status >= 400:
+        # Mirror urllib, which raises HTTPError for 4xx/5xx.
+        return _Fetched(
+            False,
+            resp.status,
+            body.nbytes,
+            f"HTTPError: HTTP Error {resp.status}: {resp.reason}",
+            headers=resp.headers,
+        )
+    return _Fetched(True, resp.status, body.nbytes, headers=resp.headers, body=body.kept())
+
+
+async def _attempt(
+    url: str,
+    timeout_s: float,
+    pool: Optional[ConnectionPool],
+    headers: Optional[Dict[str, str]],
+    spec: _BodySpec,
+    resolver: Optional[DNSCache] = None,
+) -> _Fetched:
+    body = _Body(spec, url)
+    try:
+        res = await _transfer(url, timeout_s, pool, headers, body, resolver)
+    finally:
+        body.close()
+    if body.too_large:
+        res = _Fetched(
+            False,
+            res.status_code,
+            body.nbytes,
+            f"{BodyTooLarge.__name__}: body exceeds max_body_bytes={spec.max_body_bytes}",
+            headers=res.headers,
+            exc_type=BodyTooLarge,
+        )
+    res.truncated = body.truncated
+    res.sink = body.sink
+    return res
+
+
+async def _transfer(
+    url: str,
+    timeout_s: float,
+    pool: Optional[ConnectionPool],
+    headers: Optional[Dict[str, str]],
+    body: _Body,
+    resolver: Optional[DNSCache],
+) -> _Fetched:
+    if pool is not None:
+        return await _fetch_pooled(pool, url, timeout_s, headers, body)
+    addr = None
+    # urllib honours proxy settings itself; only pin direct connections.
+    if resolver is not None and not urllib.request.getproxies():
+        host = urlsplit(url).hostname
+        if host:
+            try:
+                addr = await resolver.resolve(host)
+            except Exception as e:
+                return _Fetched(False, None, 0, f"{type(e).__name__}: {e}", exc_type=type(e))
+    return await asyncio.to_thread(_fetch_blocking, url, timeout_s, headers, body, addr)
+
+
+async def _fetch(
+    url: str,
+    timeout_s: float,
+    pool: Optional[ConnectionPool],
+    headers: Optional[Dict[str, str]] = None,
+    spec: _BodySpec = _BodySpec(),
+    retry: Optional[RetryPolicy] = None,
+    resolver: Optional[DNSCache] = None,
+) -> _Fetched:
+    """One attempt, or up to retry.max_attempts while the outcome is transient."""
+    res = await _attempt(url, timeout_s, pool, headers, spec, resolver)
+    if retry is None:
+        return res
+    if retry.budget is not None:
+        retry.budget.record_request()
+
+    attempts = 1
+    while (
+        not res.ok
+        and attempts < retry.max_attempts
+        and retry.retryable(res.status_code, res.exc_type)
+        and await wait_for_retry(retry, attempts, parse_retry_after(res.headers.get("retry-after")))
+    ):
+        attempts += 1
+        log.info("fetch_retry", extra={"url": url, "attempt": attempts, "error": res.error})
+        res = await _attempt(url, timeout_s, pool, headers, spec, resolver)
+    res.attempts = attempts
+    return res
+
+
+async def _fetch_cached(
+    url: str,
+    timeout_s: float,
+    pool: Optional[ConnectionPool],
+    cache: ResponseCache,
+    spec: _BodySpec,
+    retry: Optional[RetryPolicy],
+    resolver: Optional[DNSCache],
+) -> Tuple[_Fetched, str]:
+    """
+    Serve from the cache when fresh, revalidate stale entries with a
+    conditional GET, else fetch and store. Returns (result, cache status).
+    Cached bodies are replayed through the size caps and sink.
+    """
+    entry, fresh = await cache.alookup(url)
+    if entry is not None and fresh:
+        return _replay(url, entry.status, entry.body, spec), "hit"
+
+    validators = entry.validators() if entry is not None else {}
+    spec = replace(spec, keep_body=cache.max_entry_bytes)
+    res = await _fetch(url, timeout_s, pool, validators or None, spec=spec, retry=retry, resolver=resolver)
+    if validators and res.status_code == 304:
+        await cache.arecord_not_modified(entry, res.headers)
+        replayed = _replay(url, entry.status, entry.body, spec)
+        replayed.attempts = res.attempts
+        return replayed, "revalidated"
+    if validators:
+        cache.record_miss()
+    if res.ok and res.body is not None and res.status_code is not None:
+        await cache.astore(url, res.status_code, res.headers, res.body)
+    return res, "miss"
+
+
+def _replay(url: str, status: int, data: bytes, spec: _BodySpec) -> _Fetched:
+    body = _Body(replace(spec, keep_body=0), url)
+    try:
+        for i in range(0, len(data), READ_CHUNK_BYTES):
+            if not body.feed(data[i : i + READ_CHUNK_BYTES]):
+                break
+    finally:
+        body.close()
+    if body.too_large:
+        return _Fetched(
+            False,
+            status,
+            body.nbytes,
+            f"{BodyTooLarge.__name__}: body exceeds max_body_bytes={spec.max_body_bytes}",
+            exc_type=BodyTooLarge,
+            sink=body.sink,
+        )
+    return _Fetched(True, status, body.nbytes, truncated=body.truncated, sink=body.sink)
+
+
+def _host_healthy(res: _Fetched) -> bool:
+    """Breaker outcome: the origin answered sanely (4xx other than 429 is the client's problem)."""
+    if res.exc_type is BodyTooLarge:
+        return True  # our cap, not the origin's fault
+    if res.exc_type is not None or (res.status_code is None and not res.ok):
+        return False
+    return res.status_code is None or (res.status_code < 500 and res.status_code != 429)
+
+
+async def fetch_one(
+    url: str,
+    *,
+    timeout_s: float = 10.0,
+    pool: Optional[ConnectionPool] = None,
+    cache: Optional[ResponseCache] = None,
+    retry: Optional[RetryPolicy] = None,
+    breakers: Optional[HostBreakers] = None,
+    resolver: Optional[DNSCache] = None,
+    max_body_bytes: Optional[int] = None,
+    stop_after_bytes: Optional[int] = None,
+    body_sink: Optional[Callable[[str], BodySink]] = None,
+    metrics: Optional[FetchMetrics] = FETCH_METRICS,
+) -> FetchResult:
+    """
+    Fetch one URL.
+
+    - pool=None: blocking urllib fetch in a worker thread (default)
+    - pool=ConnectionPool(...): native asyncio HTTP/1.1 with keep-alive reuse
+    - cache=ResponseCache(...): fresh entries are served without a request,
+      stale ones revalidated (FetchResult.cache is "hit", "revalidated" or
+      "miss"; bytes_read is the body size either way)
+    - retry=RetryPolicy(...): retry transient errors/statuses with jittered
+      backoff (FetchResult.attempts counts every attempt made)
+    - breakers=HostBreakers(...): while the host's breaker is open, return at
+      once with error "CircuitOpen: ..." and attempts=0 (transport errors,
+      429 and 5xx count as failures)
+    - resolver=DNSCache(...): the thread backend connects to the cached
+      address instead of calling getaddrinfo per request (a ConnectionPool
+      takes its own resolver= at construction)
+
+    Bodies are streamed in chunks, never held whole (except small ones
+    a cache keeps):
+    - max_body_bytes: a larger body fails the fetch with "BodyTooLarge: ..."
+      as soon as the cap is crossed (not retried)
+    - stop_after_bytes: stop reading once this many bytes arrived; the fetch
+      succeeds with FetchResult.truncated=True
+    - body_sink: called with the URL once per attempt to get a BodySink
+      (CountSink, HashSink, FileSink, CallbackSink) that receives the chunks;
+      the last one is returned in FetchResult.sink
+
+    Every fetch is counted in `metrics` (by host and outcome, with latency,
+    body bytes and in-flight); pass metrics=None to skip that.
     """
     t0 = time.perf_counter()
+    # Skip building the log records' fields when INFO is off.
+    logging_on = log.isEnabledFor(logging.INFO)
 
     # A small structured "start" log
-    log.info("fetch_start", extra={"url": url, "timeout_s": timeout_s})
+    if logging_on:
+        log.info("fetch_start", extra={"url": url, "timeout_s": timeout_s})
 
-    ok, status_code, nbytes, err = await asyncio.to_thread(_fetch_blocking, url, timeout_s)
+    cache_status: Optional[str] = None
+    spec = _BodySpec(max_body_bytes=max_body_bytes, stop_after_bytes=stop_after_bytes, sink=body_sink)
+    host = host_key(url) if breakers is not None or metrics is not None else ""
+    if breakers is not None and not breakers.allow(host):
+        res = _Fetched(False, None, 0, f"{CIRCUIT_OPEN_ERROR}: circuit open for {host}", attempts=0)
+    else:
+        if metrics is not None:
+            metrics.in_flight.inc()
+        try:
+            if cache is None:
+                res = await _fetch(url, timeout_s, pool, spec=spec, retry=retry, resolver=resolver)
+            else:
+                res, cache_status = await _fetch_cached(url, timeout_s, pool, cache, spec, retry, resolver)
+        except BaseException:
+            if breakers is not None:
+                breakers.abandon(host)
+            raise
+        finally:
+            if metrics is not None:
+                metrics.in_flight.dec()
+    if breakers is not None and res.attempts > 0:
+        breakers.record(host, _host_healthy(res))
+    ok, status_code, nbytes, err = res.ok, res.status_code, res.bytes_read, res.error
 
     elapsed_ms = (time.perf_counter() - t0) * 1000.0
 
+    if metrics is not None:
+        outcome = fetch_outcome(ok, status_code, err)
+        metrics.requests.labels(host, outcome).inc()
+        metrics.latency.labels(outcome).observe(elapsed_ms / 1000.0)
+        metrics.attempts.inc(res.attempts)
+        if nbytes:
+            metrics.bytes.labels(host).inc(nbytes)
+
     # A small structured "done" log
-    log.info(
-        "fetch_done",
-        extra={
-            "url": url,
-            "ok": ok,
-            "status_code": status_code,
-            "bytes_read": nbytes,
-            "elapsed_ms": round(elapsed_ms, 3),
-            "error": err,
-        },
-    )
+    if logging_on:
+        log.info(
+            "fetch_done",
+            extra={
+                "url": url,
+                "ok": ok,
+                "status_code": status_code,
+                "bytes_read": nbytes,
+                "elapsed_ms": round(elapsed_ms, 3),
+                "error": err,
+                "cache": cache_status,
+                "attempts": res.attempts,
+                "truncated": res.truncated,
+            },
+        )
 
     return FetchResult(
         url=url,
@@ -81,4 +487,8 @@ async def fetch_one(url: str, *, timeout_s: float = 10.0) -> FetchResult:
         bytes_read=nbytes,
         elapsed_ms=elapsed_ms,
         error=err,
+        cache=cache_status,
+        attempts=res.attempts,
+        truncated=res.truncated,
+        sink=res.sink,
     )
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import time
+
 from ratelimmq.context import Context
 from ratelimmq.protocol import Request, Response, pong, bye, err_unknown
 
@@ -20,3 +22,32 @@ async def help_cmd(ctx: Context, req: Request) -> Response:
 
 async def unknown(ctx: Context, req: Request) -> Response:
     return err_unknown()
+
+
+async def stats(ctx: Context, req: Request) -> Response:
+    """
+    One line of live server state:
+    STATS uptime_s=.. cps=.. commands=.. conns=.. conns_total=.. rejected=..
+          tokens=.. clients=.. bytes_in=.. bytes_out=.. lat.<CMD>=p50/p95/p99 (ms)
+    tokens / clients are "-" when that limiter is off.
+    """
+    st = ctx.stats
+    now = time.monotonic()
+    tokens = f"{ctx.limiter.available(now):.2f}" if ctx.limiter is not None else "-"
+    clients = str(len(ctx.client_limiter)) if ctx.client_limiter is not None else "-"
+    parts = [
+        "STATS",
+        f"uptime_s={now - st.started:.1f}",
+        f"cps={st.rate(now):.1f}",
+        f"commands={st.commands}",
+        f"conns={st.connections}",
+        f"conns_total={st.connections_total}",
+        f"rejected={st.rejected}",
+        f"tokens={tokens}",
+        f"clients={clients}",
+        f"bytes_in={st.bytes_in}",
+        f"bytes_out={st.bytes_out}",
+    ]
+    for cmd, (p50, p95, p99) in sorted(st.latency_ms(now).items()):
+        parts.append(f"lat.{cmd}={p50:.3f}/{p95:.3f}/{p99:.3f}")
+    return Response(" ".join(parts) + "\n")
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+from typing import List, Optional
+
+from ratelimmq.context import Context
+from ratelimmq.mq import QueueFull, QueueRegistry, TooManyQueues
+from ratelimmq.protocol import Request, Response
+
+# Cap on one MPOP batch and on one BPOP wait.
+MAX_BATCH = 1000
+MAX_BLOCK_S = 300.0
+
+NIL = Response("NIL\n")
+ERR_FULL = Response("ERR queue full\n")
+ERR_TOO_MANY = Response("ERR too many queues\n")
+
+
+def _queues(ctx: Context) -> QueueRegistry:
+    if ctx.queue is None:
+        ctx.queue = QueueRegistry()
+    return ctx.queue
+
+
+def _args(req: Request) -> List[str]:
+    # Binary frames carry the same arguments as a space-separated payload.
+    if req.payload is not None:
+        return bytes(req.payload).decode("utf-8", errors="replace").split()
+    return req.args
+
+
+def _usage(text: str) -> Response:
+    return Response(f"ERR usage: {text}\n")
+
+
+def _msgs(msgs: List[str]) -> Response:
+    # Multi-line reply: header with the count, then one message per line.
+    return Response("".join([f"MSGS {len(msgs)}\n"] + [f"{m}\n" for m in msgs]))
+
+
+async def push(ctx: Context, req: Request) -> Response:
+    """PUSH <queue> <message...>  ->  OK <depth> | ERR queue full"""
+    args = _args(req)
+    if len(args) < 2:
+        return _usage("PUSH <queue> <message>")
+    reg = _queues(ctx)
+    msg = " ".join(args[1:])
+    try:
+        q = reg.get_or_create(args[0])
+        depth = q.push(msg)
+    except QueueFull:
+        return ERR_FULL
+    except TooManyQueues:
+        return ERR_TOO_MANY
+    await reg.log_push(args[0], q, [msg])
+    return Response(f"OK {depth}\n")
+
+
+async def mpush(ctx: Context, req: Request) -> Response:
+    """
+    MPUSH <queue> <m1> <m2> ...  ->  OK <accepted> | ERR queue full
+    Accepts as many as fit, in order; the producer resends the rest.
+    """
+    args = _args(req)
+    if len(args) < 2:
+        return _usage("MPUSH <queue> <m1> [m2 ...]")
+    reg = _queues(ctx)
+    try:
+        q = reg.get_or_create(args[0])
+    except TooManyQueues:
+        return ERR_TOO_MANY
+    accepted = q.push_many(args[1:])
+    if accepted == 0:
+        return ERR_FULL
+    await reg.log_push(args[0], q, args[1:1 + accepted])
+    return Response(f"OK {accepted}\n")
+
+
+async def pop(ctx: Context, req: Request) -> Response:
+    """POP <queue>  ->  MSG <message> | NIL"""
+    args = _args(req)
+    if len(args) != 1:
+        return _usage("POP <queue>")
+    reg = _queues(ctx)
+    q = reg.get(args[0])
+    msg = q.pop() if q is not None else None
+    if msg is None:
+        return NIL
+    await reg.log_pop(args[0], q)
+    return Response(f"MSG {msg}\n")
+
+
+async def mpop(ctx: Context, req: Request) -> Response:
+    """MPOP <queue> <n>  ->  MSGS <k> followed by k message lines"""
+    args = _args(req)
+    if len(args) != 2 or not args[1].isdigit():
+        return _usage("MPOP <queue> <n>")
+    reg = _queues(ctx)
+    q = reg.get(args[0])
+    msgs = q.pop_many(min(int(args[1]), MAX_BATCH)) if q is not None else []
+    if msgs:
+        await reg.log_pop(args[0], q)
+    return _msgs(msgs)
+
+
+async def bpop(ctx: Context, req: Request) -> Response:
+    """
+    BPOP <queue> <timeout_s>  ->  MSG <message> | NIL
+    Parks this connection until a message arrives, the timeout passes, or
+    the server shuts down.
+    """
+    args = _args(req)
+    if len(args) != 2:
+        return _usage("BPOP <queue> <timeout_s>")
+    try:
+        timeout_s = min(max(0.0, float(args[1])), MAX_BLOCK_S)
+    except ValueError:
+        return _usage("BPOP <queue> <timeout_s>")
+    reg = _queues(ctx)
+    try:
+        q = reg.get_or_create(args[0])
+    except TooManyQueues:
+        return ERR_TOO_MANY
+
+    pop_task = asyncio.ensure_future(q.pop_wait(timeout_s))
+    stop_task = asyncio.ensure_future(ctx.stop_event.wait())
+    try:
+        await asyncio.wait({pop_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+    except BaseException:
+        # Cancelled after the pop completed: the message never reaches the client.
+        if pop_task.done() and not pop_task.cancelled() and pop_task.exception() is None:
+            msg = pop_task.result()
+            if msg is not None:
+                q.unpop(msg)
+        raise
+    finally:
+        stop_task.cancel()
+        if not pop_task.done():
+            pop_task.cancel()
+            await asyncio.gather(pop_task, return_exceptions=True)
+
+    msg: Optional[str] = pop_task.result() if not pop_task.cancelled() else None
+    if msg is None:
+        return NIL
+    await reg.log_pop(args[0], q)
+    return Response(f"MSG {msg}\n")
+
+
+async def qlen(ctx: Context, req: Request) -> Response:
+    """QLEN <queue>  ->  LEN <depth>"""
+    args = _args(req)
+    if len(args) != 1:
+        return _usage("QLEN <queue>")
+    q = _queues(ctx).get(args[0])
+    return Response(f"LEN {len(q) if q is not None else 0}\n")
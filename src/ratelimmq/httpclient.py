@@ -0,0 +1,468 @@
+from __future__ import annotations
+
+import asyncio
+import ssl
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from ratelimmq.resolver import DNSCache
+
+USER_AGENT = "ratelimmq/1.0"
+
+# Read the body in slices of this size so a single fetch never buffers
+# more than one chunk at a time.
+READ_CHUNK_BYTES = 64 * 1024
+
+# Body consumer: gets each chunk as it arrives; returning False stops
+# reading (the rest of the body is abandoned with the connection).
+OnChunk = Callable[[bytes], Optional[bool]]
+
+
+class HTTPError(Exception):
+    """Raised for protocol-level problems (malformed status line, bad chunk size, ...)."""
+
+
+@dataclass(frozen=True)
+class HTTPResponse:
+    status: int
+    reason: str
+    headers: Dict[str, str]
+    bytes_read: int
+
+
+@dataclass
+class _Conn:
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+    idle_since: float = 0.0
+    uses: int = 0
+
+    def usable(self, now: float, idle_timeout_s: float) -> bool:
+        if self.reader.at_eof() or self.writer.is_closing():
+            return False
+        return (now - self.idle_since) < idle_timeout_s
+
+    def close(self) -> None:
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+
+@dataclass
+class _HostPool:
+    sem: asyncio.Semaphore
+    idle: List[_Conn] = field(default_factory=list)
+    active: int = 0  # requests using or waiting for this origin's slots
+
+
+Origin = Tuple[str, str, int]
+
+
+def split_url(url: str) -> Tuple[Origin, str]:
+    """
+    Split a URL into ((scheme, host, port), request_target).
+    Only http and https are supported.
+    """
+    p = urlsplit(url)
+    scheme = (p.scheme or "").lower()
+    if scheme not in ("http", "https"):
+        raise HTTPError(f"unsupported scheme: {scheme!r}")
+    host = (p.hostname or "").lower()
+    if not host:
+        raise HTTPError(f"missing host in url: {url!r}")
+    port = p.port or (443 if scheme == "https" else 80)
+    target = p.path or "/"
+    if p.query:
+        target = f"{target}?{p.query}"
+    return (scheme, host, port), target
+
+
+def _host_header(origin: Origin) -> str:
+    scheme, host, port = origin
+    if ":" in host:
+        host = f"[{host}]"  # IPv6 literal
+    default = 443 if scheme == "https" else 80
+    return host if port == default else f"{host}:{port}"
+
+
+class ConnectionPool:
+    """
+    Event-loop-native HTTP/1.1 client with a keep-alive connection pool per origin.
+
+    - at most `per_host` connections are open to one (scheme, host, port) at a time
+    - idle connections are reused until they are closed by the peer or sit idle
+      longer than `idle_timeout_s`; expired ones are closed whenever a
+      connection is returned to the pool, and at most `max_idle` stay open
+      across all origins (the least recently used is closed first)
+    - per-origin state is dropped once an origin has no requests and no idle
+      connections, so a crawl over many hosts doesn't accumulate it
+    - a request on a reused connection that fails before any response bytes arrive
+      is retried once on a fresh connection (the peer may have closed it meanwhile)
+    - new connections resolve the host through `resolver` (a DNSCache) if given
+
+    A pool is bound to the event loop it is first used on; close it with `aclose()`
+    (or use it as an async context manager).
+    """
+
+    def __init__(
+        self,
+        per_host: int = 10,
+        *,
+        idle_timeout_s: float = 30.0,
+        max_idle: int = 100,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        resolver: Optional[DNSCache] = None,
+    ) -> None:
+        self._per_host = max(1, int(per_host))
+        self._max_idle = max(0, int(max_idle))
+        self._resolver = resolver
+        self._idle_timeout_s = float(idle_timeout_s)
+        self._ssl_context = ssl_context
+        self._hosts: Dict[Origin, _HostPool] = {}
+        # Every idle connection, oldest first: id(conn) -> (origin, conn)
+        self._idle_lru: "OrderedDict[int, Tuple[Origin, _Conn]]" = OrderedDict()
+        self._closed = False
+
+        # Counters (useful for tests/benchmarks)
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self.idle_closed = 0  # idle connections closed for age or the max_idle cap
+
+    async def __aenter__(self) -> "ConnectionPool":
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        await self.aclose()
+
+    def _ssl(self) -> ssl.SSLContext:
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    def _host_pool(self, origin: Origin) -> _HostPool:
+        hp = self._hosts.get(origin)
+        if hp is None:
+            hp = _HostPool(sem=asyncio.Semaphore(self._per_host))
+            self._hosts[origin] = hp
+        return hp
+
+    def idle_count(self) -> int:
+        return len(self._idle_lru)
+
+    def host_count(self) -> int:
+        """Origins with live state (in-flight requests or idle connections)."""
+        return len(self._hosts)
+
+    def _drop_if_unused(self, origin: Origin, hp: _HostPool) -> None:
+        if hp.active == 0 and not hp.idle and self._hosts.get(origin) is hp:
+            del self._hosts[origin]
+
+    def _checkin(self, origin: Origin, hp: _HostPool, conn: _Conn) -> None:
+        now = time.monotonic()
+        conn.idle_since = now
+        hp.idle.append(conn)
+        self._idle_lru[id(conn)] = (origin, conn)
+        # The LRU is in idle_since order: close what has expired, then
+        # whatever is over the cap, oldest first.
+        while self._idle_lru:
+            o, oldest = next(iter(self._idle_lru.values()))
+            if len(self._idle_lru) <= self._max_idle and oldest.usable(now, self._idle_timeout_s):
+                break
+            self._idle_lru.popitem(last=False)
+            ohp = self._hosts.get(o)
+            if ohp is not None and oldest in ohp.idle:
+                ohp.idle.remove(oldest)
+                self._drop_if_unused(o, ohp)
+            oldest.close()
+            self.idle_closed += 1
+
+    async def _open(self, origin: Origin) -> _Conn:
+        scheme, host, port = origin
+        addr = await self._resolver.resolve(host, port) if self._resolver is not None else host
+        if scheme == "https":
+            reader, writer = await asyncio.open_connection(
+                addr, port, ssl=self._ssl(), server_hostname=host
+            )
+        else:
+            reader, writer = await asyncio.open_connection(addr, port)
+        self.connections_opened += 1
+        return _Conn(reader=reader, writer=writer)
+
+    def _checkout_idle(self, hp: _HostPool) -> Optional[_Conn]:
+        now = time.monotonic()
+        while hp.idle:
+            conn = hp.idle.pop()  # LIFO: the most recently used socket is the warmest
+            self._idle_lru.pop(id(conn), None)
+            if conn.usable(now, self._idle_timeout_s):
+                return conn
+            conn.close()
+        return None
+
+    async def request(
+        self,
+        url: str,
+        *,
+        timeout_s: float = 10.0,
+        method: str = "GET",
+        headers: Optional[Dict[str, str]] = None,
+        on_chunk: Optional[OnChunk] = None,
+    ) -> HTTPResponse:
+        """
+        Issue one request and read the whole response body.
+
+        The body is not buffered: each chunk is passed to `on_chunk` (if given)
+        and only its length is kept. If `on_chunk` returns False, reading stops
+        there and the connection is closed instead of reused. `timeout_s`
+        bounds the whole exchange, including waiting for a free connection slot.
+        """
+        if self._closed:
+            raise RuntimeError("ConnectionPool is closed")
+
+        origin, target = split_url(url)
+        return await asyncio.wait_for(
+            self._request(origin, target, method.upper(), headers or {}, on_chunk),
+            timeout=timeout_s,
+        )
+
+    async def _request(
+        self,
+        origin: Origin,
+        target: str,
+        method: str,
+        headers: Dict[str, str],
+        on_chunk: Optional[OnChunk],
+    ) -> HTTPResponse:
+        hp = self._host_pool(origin)
+        payload = self._encode_request(origin, target, method, headers)
+        hp.active += 1
+        try:
+            return await self._request_on(hp, origin, payload, method, on_chunk)
+        finally:
+            hp.active -= 1
+            self._drop_if_unused(origin, hp)
+
+    async def _request_on(
+        self,
+        hp: _HostPool,
+        origin: Origin,
+        payload: bytes,
+        method: str,
+        on_chunk: Optional[OnChunk],
+    ) -> HTTPResponse:
+        async with hp.sem:
+            conn = self._checkout_idle(hp)
+            reused = conn is not None
+            if conn is None:
+                conn = await self._open(origin)
+            else:
+                self.connections_reused += 1
+
+            while True:
+                keep = False
+                try:
+                    resp, keep = await self._exchange(conn, payload, method, on_chunk)
+                except _StaleConnection as e:
+                    conn.close()
+                    if not reused:
+                        raise e.__cause__ or ConnectionResetError("connection closed before the response")
+                    # The idle socket was closed under us before any response
+                    # bytes arrived; try once more on a fresh one. Failures after
+                    # that are not retried: the body may already be in on_chunk.
+                    reused = False
+                    conn = await self._open(origin)
+                    continue
+                except BaseException:
+                    conn.close()
+                    raise
+
+                if keep and not self._closed:
+                    conn.uses += 1
+                    self._checkin(origin, hp, conn)
+                else:
+                    conn.close()
+                return resp
+
+    @staticmethod
+    def _encode_request(origin: Origin, target: str, method: str, headers: Dict[str, str]) -> bytes:
+        lines = [
+            f"{method} {target} HTTP/1.1",
+            f"Host: {_host_header(origin)}",
+        ]
+        base = {
+            "user-agent": USER_AGENT,
+            "accept-encoding": "identity",
+            "connection": "keep-alive",
+        }
+        for k, v in headers.items():
+            base[k.lower()] = v
+        for k, v in base.items():
+            lines.append(f"{k}: {v}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _exchange(
+        self,
+        conn: _Conn,
+        payload: bytes,
+        method: str,
+        on_chunk: Optional[OnChunk],
+    ) -> Tuple[HTTPResponse, bool]:
+        try:
+            conn.writer.write(payload)
+            await conn.writer.drain()
+            status_line = await conn.reader.readline()
+        except ConnectionError as e:
+            raise _StaleConnection() from e
+        if not status_line:
+            raise _StaleConnection()
+
+        version, status, reason = _parse_status_line(status_line)
+        headers = await _read_headers(conn.reader)
+
+        # Interim 1xx responses (except 101) are skipped.
+        while 100 <= status < 200 and status != 101:
+            status_line = await conn.reader.readline()
+            version, status, reason = _parse_status_line(status_line)
+            headers = await _read_headers(conn.reader)
+
+        conn_hdr = headers.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            keep = "keep-alive" in conn_hdr
+        else:
+            keep = "close" not in conn_hdr
+
+        try:
+            if method == "HEAD" or status in (204, 304):
+                nbytes = 0
+            elif "chunked" in headers.get("transfer-encoding", "").lower():
+                nbytes = await _read_chunked(conn.reader, on_chunk)
+            elif "content-length" in headers:
+                try:
+                    length = int(headers["content-length"])
+                except ValueError:
+                    raise HTTPError(f"bad content-length: {headers['content-length']!r}")
+                nbytes = await _read_exact(conn.reader, length, on_chunk)
+            else:
+                # No framing: body runs until the peer closes the connection.
+                nbytes = await _read_to_eof(conn.reader, on_chunk)
+                keep = False
+        except _BodyAborted as e:
+            # Unread body bytes are still on the socket: don't reuse it.
+            nbytes = e.nbytes
+            keep = False
+
+        return HTTPResponse(status=status, reason=reason, headers=headers, bytes_read=nbytes), keep
+
+    async def aclose(self) -> None:
+        self._closed = True
+        writers = []
+        for hp in self._hosts.values():
+            for conn in hp.idle:
+                conn.close()
+                writers.append(conn.writer)
+            hp.idle.clear()
+        self._idle_lru.clear()
+        self._hosts.clear()
+        for w in writers:
+            try:
+                await w.wait_closed()
+            except Exception:
+                pass
+
+
+class _BodyAborted(Exception):
+    """on_chunk asked to stop reading after `nbytes` body bytes."""
+
+    def __init__(self, nbytes: int) -> None:
+        super().__init__(nbytes)
+        self.nbytes = nbytes
+
+
+class _StaleConnection(Exception):
+    """The connection failed before any response bytes arrived."""
+
+
+def _parse_status_line(raw: bytes) -> Tuple[str, int, str]:
+    parts = raw.decode("latin-1").rstrip("\r\n").split(" ", 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+        raise HTTPError(f"bad status line: {raw[:100]!r}")
+    try:
+        status = int(parts[1])
+    except ValueError:
+        raise HTTPError(f"bad status line: {raw[:100]!r}")
+    reason = parts[2] if len(parts) > 2 else ""
+    return parts[0], status, reason
+
+
+async def _read_headers(reader: asyncio.StreamReader) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise asyncio.IncompleteReadError(b"", None)
+        if line in (b"\r\n", b"\n"):
+            return headers
+        name, sep, value = line.decode("latin-1").partition(":")
+        if not sep:
+            raise HTTPError(f"bad header line: {line[:100]!r}")
+        key = name.strip().lower()
+        value = value.strip()
+        if key in headers:
+            headers[key] = f"{headers[key]}, {value}"
+        else:
+            headers[key] = value
+
+
+async def _read_exact(
+    reader: asyncio.StreamReader,
+    length: int,
+    on_chunk: Optional[OnChunk],
+) -> int:
+    remaining = length
+    while remaining > 0:
+        chunk = await reader.readexactly(min(remaining, READ_CHUNK_BYTES))
+        remaining -= len(chunk)
+        if on_chunk is not None and on_chunk(chunk) is False:
+            raise _BodyAborted(length - remaining)
+    return length
+
+
+async def _read_chunked(
+    reader: asyncio.StreamReader,
+    on_chunk: Optional[OnChunk],
+) -> int:
+    total = 0
+    while True:
+        size_line = await reader.readline()
+        if not size_line:
+            raise asyncio.IncompleteReadError(b"", None)
+        try:
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+        except ValueError:
+            raise HTTPError(f"bad chunk size: {size_line[:100]!r}")
+        if size == 0:
+            # Trailers (if any) end with an empty line.
+            await _read_headers(reader)
+            return total
+        try:
+            total += await _read_exact(reader, size, on_chunk)
+        except _BodyAborted as e:
+            raise _BodyAborted(total + e.nbytes)
+        await reader.readexactly(2)  # CRLF after each chunk
+
+
+async def _read_to_eof(
+    reader: asyncio.StreamReader,
+    on_chunk: Optional[OnChunk],
+) -> int:
+    total = 0
+    while True:
+        chunk = await reader.read(READ_CHUNK_BYTES)
+        if not chunk:
+            return total
+        total += len(chunk)
+        if on_chunk is not None and on_chunk(chunk) is False:
+            raise _BodyAborted(total)
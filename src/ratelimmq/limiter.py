@@ -1,7 +1,15 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import asyncio
+import heapq
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
 import time
+from typing import Deque, Dict, List, Mapping, Optional, Tuple
+
+# Float rounding in refill (and timers firing a tick early) can leave a bucket
+# a hair short of the tokens a waiter needs.
+_TOKEN_EPS = 1e-6
 
 
 @dataclass
@@ -11,12 +19,23 @@ class TokenBucket:
 
     capacity: max tokens in the bucket
     refill_rate: tokens per second
+
+    allow() is the non-blocking check. acquire()/try_acquire() wait for
+    tokens instead: waiters are served FIFO and woken by one loop timer set
+    for the exact moment the head waiter's tokens have refilled.
     """
     capacity: float
     refill_rate: float
     tokens: float | None = None
     last_ts: float | None = None
 
+    # Async waiters: (future, cost), served in arrival order.
+    _waiters: Deque[Tuple[asyncio.Future[None], float]] = field(
+        default_factory=deque, init=False, repr=False, compare=False
+    )
+    _queued_cost: float = field(default=0.0, init=False, repr=False, compare=False)
+    _timer: Optional[asyncio.TimerHandle] = field(default=None, init=False, repr=False, compare=False)
+
     def __post_init__(self) -> None:
         if self.capacity <= 0:
             raise ValueError("capacity must be > 0")
@@ -48,8 +67,416 @@ class TokenBucket:
         t = time.monotonic() if now is None else float(now)
         self._refill(t)
 
+        # Don't jump the queue ahead of async waiters.
+        if self._waiters:
+            return False
+
         assert self.tokens is not None
         if self.tokens >= cost:
             self.tokens -= cost
             return True
         return False
+
+    def available(self, now: float | None = None) -> float:
+        """Tokens in the bucket right now (after refill)."""
+        self._refill(time.monotonic() if now is None else float(now))
+        assert self.tokens is not None
+        return self.tokens
+
+    def wait_time(self, cost: float = 1.0, now: float | None = None) -> float:
+        """
+        Seconds until `cost` tokens would be available to a new caller,
+        counting everything already queued ahead of it. inf if never.
+        """
+        t = time.monotonic() if now is None else float(now)
+        self._refill(t)
+        assert self.tokens is not None
+
+        deficit = self._queued_cost + cost - self.tokens
+        if deficit <= 0:
+            return 0.0
+        if self.refill_rate <= 0:
+            return float("inf")
+        return deficit / float(self.refill_rate)
+
+    async def acquire(self, cost: float = 1.0) -> None:
+        """Wait (FIFO) until `cost` tokens are available, then consume them."""
+        await self.try_acquire(cost, max_wait=None)
+
+    async def try_acquire(self, cost: float = 1.0, max_wait: float | None = None) -> bool:
+        """
+        Like acquire(), but give up if the wait would exceed `max_wait` seconds.
+
+        The decision is made up front from the exact refill time (including
+        waiters ahead of us), so a caller that can't make the deadline is
+        told so immediately instead of sleeping first.
+
+        Cancellation-safe: if the caller is cancelled after its tokens were
+        granted but before it resumed, the tokens go back into the bucket.
+        """
+        if cost <= 0:
+            raise ValueError("cost must be > 0")
+        if cost > self.capacity:
+            raise ValueError("cost must be <= capacity")
+
+        wait_s = self.wait_time(cost)
+        assert self.tokens is not None
+        if wait_s == 0.0 and not self._waiters:
+            self.tokens -= cost
+            return True
+        if max_wait is not None and wait_s > max_wait:
+            return False
+
+        fut: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        entry = (fut, cost)
+        self._waiters.append(entry)
+        self._queued_cost += cost
+        if len(self._waiters) == 1:
+            self._arm()
+
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Tokens were already handed to us; give them back.
+                self.tokens = min(float(self.capacity), self.tokens + cost)
+            else:
+                self._drop_waiter(entry)
+            self._wake()
+            raise
+        return True
+
+    def _drop_waiter(self, entry: Tuple[asyncio.Future[None], float]) -> None:
+        try:
+            self._waiters.remove(entry)
+        except ValueError:
+            return
+        self._queued_cost = max(0.0, self._queued_cost - entry[1])
+
+    def _arm(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._waiters:
+            return
+        assert self.tokens is not None
+        deficit = self._waiters[0][1] - self.tokens
+        if self.refill_rate <= 0:
+            return  # only a refund can satisfy the head waiter now
+        delay = max(0.0, deficit / float(self.refill_rate))
+        self._timer = asyncio.get_running_loop().call_later(delay, self._wake)
+
+    def _wake(self) -> None:
+        self._timer = None
+        self._refill(time.monotonic())
+        assert self.tokens is not None
+
+        waiters = self._waiters
+        while waiters:
+            fut, cost = waiters[0]
+            if fut.done():
+                waiters.popleft()
+                self._queued_cost = max(0.0, self._queued_cost - cost)
+                continue
+            if self.tokens < cost - _TOKEN_EPS:
+                break
+            waiters.popleft()
+            self._queued_cost = max(0.0, self._queued_cost - cost)
+            self.tokens = max(0.0, self.tokens - cost)
+            fut.set_result(None)
+
+        self._arm()
+
+
+class _KeyState:
+    __slots__ = ("rate", "burst", "tokens", "last_ts", "waiters", "scheduled")
+
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last_ts = now
+        self.waiters: Deque[asyncio.Future[None]] = deque()
+        self.scheduled = False
+
+    def refill(self, now: float) -> None:
+        elapsed = now - self.last_ts
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.last_ts = now
+
+    def idle(self, now: float) -> bool:
+        # Full bucket, nobody parked: same as a freshly created state.
+        if self.waiters or self.scheduled:
+            return False
+        return self.tokens + max(0.0, now - self.last_ts) * self.rate >= self.burst - _TOKEN_EPS
+
+
+class KeyedRateLimiter:
+    """
+    Token bucket per key (e.g. per host), enforced for async callers.
+
+    rate: tokens per second for every key (None = unlimited unless overridden)
+    burst: bucket capacity per key
+    overrides: per-key rate; a value of None exempts that key
+
+    Callers that cannot proceed are parked FIFO per key. All keys share one
+    deadline heap and a single loop timer armed for the earliest deadline,
+    so waiting costs no polling and no per-task sleeps: each timer firing
+    wakes exactly the callers whose tokens are now available.
+
+    Keys are kept in LRU order; a couple of the oldest are checked on every
+    acquire() and dropped once their bucket has refilled and nobody waits on
+    them, so memory follows the set of recently active keys.
+    """
+
+    # Idle keys checked per acquire (amortized cleanup, O(1) per call).
+    SWEEP_PER_CALL = 2
+
+    def __init__(
+        self,
+        rate: Optional[float],
+        burst: float = 1.0,
+        overrides: Optional[Mapping[str, Optional[float]]] = None,
+    ) -> None:
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be > 0 (or None for unlimited)")
+        if burst < 1:
+            raise ValueError("burst must be >= 1")
+        for k, r in (overrides or {}).items():
+            if r is not None and r <= 0:
+                raise ValueError(f"override rate for {k!r} must be > 0 (or None)")
+
+        self._rate = rate
+        self._burst = float(burst)
+        self._overrides: Dict[str, Optional[float]] = dict(overrides or {})
+        self._states: "OrderedDict[str, _KeyState]" = OrderedDict()
+        self._heap: List[Tuple[float, int, str]] = []
+        self._seq = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_at = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Counters
+        self.immediate = 0
+        self.delayed = 0
+        self.timer_fires = 0
+        self.expired = 0
+
+    def rate_for(self, key: str) -> Optional[float]:
+        if key in self._overrides:
+            return self._overrides[key]
+        return self._rate
+
+    def key_count(self) -> int:
+        return len(self._states)
+
+    def waiting(self) -> int:
+        # Every key with waiters has exactly one heap entry.
+        states = self._states
+        return sum(len(states[key].waiters) for _, _, key in self._heap)
+
+    async def acquire(self, key: str) -> None:
+        """Wait until `key` has a token, then consume it."""
+        rate = self.rate_for(key)
+        if rate is None:
+            return
+
+        loop = self._loop
+        if loop is None:
+            loop = self._loop = asyncio.get_running_loop()
+        now = loop.time()
+        self._sweep(now)
+
+        st = self._states.get(key)
+        if st is None:
+            st = _KeyState(float(rate), self._burst, now)
+            self._states[key] = st
+        else:
+            self._states.move_to_end(key)
+            st.refill(now)
+
+        # Fast path: nobody queued ahead of us and a token is available.
+        if not st.waiters and st.tokens >= 1.0 - _TOKEN_EPS:
+            st.tokens = max(0.0, st.tokens - 1.0)
+            self.immediate += 1
+            return
+
+        fut: asyncio.Future[None] = loop.create_future()
+        st.waiters.append(fut)
+        if not st.scheduled:
+            self._schedule(key, st, now)
+        self.delayed += 1
+        await fut
+
+    def _sweep(self, now: float) -> None:
+        states = self._states
+        for _ in range(self.SWEEP_PER_CALL):
+            if not states:
+                return
+            key, st = next(iter(states.items()))
+            if not st.idle(now):
+                return
+            del states[key]
+            self.expired += 1
+
+    def _schedule(self, key: str, st: _KeyState, now: float) -> None:
+        deadline = now + max(0.0, 1.0 - st.tokens) / st.rate
+        self._seq += 1
+        heapq.heappush(self._heap, (deadline, self._seq, key))
+        st.scheduled = True
+        self._arm()
+
+    def _arm(self) -> None:
+        if not self._heap:
+            return
+        when = self._heap[0][0]
+        if self._timer is not None:
+            if self._timer_at <= when:
+                return
+            self._timer.cancel()
+        assert self._loop is not None
+        self._timer = self._loop.call_at(when, self._on_timer)
+        self._timer_at = when
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self.timer_fires += 1
+        assert self._loop is not None
+        now = self._loop.time()
+
+        heap = self._heap
+        again: List[str] = []
+        while heap and heap[0][0] <= now:
+            _, _, key = heapq.heappop(heap)
+            st = self._states[key]
+            st.scheduled = False
+            st.refill(now)
+
+            waiters = st.waiters
+            while waiters and st.tokens >= 1.0 - _TOKEN_EPS:
+                fut = waiters.popleft()
+                if fut.done():
+                    continue  # cancelled while waiting; its token stays in the bucket
+                st.tokens = max(0.0, st.tokens - 1.0)
+                fut.set_result(None)
+            # Drop cancelled waiters at the head so they don't hold a heap slot.
+            while waiters and waiters[0].done():
+                waiters.popleft()
+            if waiters:
+                again.append(key)
+
+        # Reschedule after draining so a key is handled at most once per firing.
+        for key in again:
+            st = self._states[key]
+            self._seq += 1
+            deadline = now + max(0.0, 1.0 - st.tokens) / st.rate
+            heapq.heappush(heap, (deadline, self._seq, key))
+            st.scheduled = True
+
+        self._arm()
+
+
+class KeyedTokenBuckets:
+    """
+    Non-blocking token buckets per key (e.g. per client), with bounded memory.
+
+    reserve() either grants `cost` now, grants it after a short delay (the
+    bucket goes into debt, so later callers queue behind it), or rejects with
+    the exact retry-after time.
+
+    A bucket that has refilled to capacity is indistinguishable from a new
+    one, so it is dropped; keys are kept in LRU order and a couple of the
+    oldest are checked on every call. Past `max_keys`, the least recently
+    used key is dropped even if not idle.
+    """
+
+    # Idle keys checked per call (amortized cleanup, O(1) per decision).
+    SWEEP_PER_CALL = 2
+
+    def __init__(self, capacity: float, refill_rate: float, *, max_keys: int = 100_000) -> None:
+        if capacity <= 0:
+            raise ValueError("capacity must be > 0")
+        if refill_rate < 0:
+            raise ValueError("refill_rate must be >= 0")
+        if max_keys < 1:
+            raise ValueError("max_keys must be >= 1")
+        self.capacity = float(capacity)
+        self.refill_rate = float(refill_rate)
+        self.max_keys = int(max_keys)
+        # key -> [tokens, last_ts]
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+        # Counters
+        self.rejected = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _level(self, b: List[float], now: float) -> float:
+        return min(self.capacity, b[0] + max(0.0, now - b[1]) * self.refill_rate)
+
+    def _sweep(self, now: float) -> None:
+        buckets = self._buckets
+        for _ in range(self.SWEEP_PER_CALL):
+            if not buckets:
+                return
+            key, b = next(iter(buckets.items()))
+            if self._level(b, now) >= self.capacity or len(buckets) > self.max_keys:
+                del buckets[key]
+                self.expired += 1
+            else:
+                return
+
+    def reserve(
+        self,
+        key: str,
+        cost: float = 1.0,
+        *,
+        max_wait: float = 0.0,
+        now: float | None = None,
+    ) -> Tuple[bool, float]:
+        """
+        Returns (granted, seconds):
+          - (True, 0.0): go now
+          - (True, d): go after sleeping d seconds (d <= max_wait); already paid for
+          - (False, r): rejected; retry after r seconds (inf if never, e.g.
+            cost > capacity)
+        If now is provided, it is used for deterministic testing.
+        """
+        if cost <= 0:
+            raise ValueError("cost must be > 0")
+        if cost > self.capacity:
+            # Never fits in the bucket, so no wait would help.
+            self.rejected += 1
+            return False, float("inf")
+        t = time.monotonic() if now is None else float(now)
+
+        b = self._buckets.get(key)
+        if b is None:
+            b = [self.capacity, t]
+            self._buckets[key] = b
+        else:
+            self._buckets.move_to_end(key)
+        b[0] = self._level(b, t)
+        b[1] = t
+
+        if b[0] >= cost:
+            b[0] -= cost
+            granted, wait = True, 0.0
+        else:
+            deficit = cost - b[0]
+            wait = deficit / self.refill_rate if self.refill_rate > 0 else float("inf")
+            if wait <= max_wait:
+                b[0] -= cost  # borrow against future refill
+                granted = True
+            else:
+                self.rejected += 1
+                granted = False
+
+        self._sweep(t)
+        return granted, wait
+
+    def allow(self, key: str, cost: float = 1.0, now: float | None = None) -> bool:
+        return self.reserve(key, cost, now=now)[0]
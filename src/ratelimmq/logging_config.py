@@ -3,9 +3,20 @@ from __future__ import annotations
 import json
 import logging
 import os
+import queue
+import random
 import sys
+import threading
 import time
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Mapping, Optional, TextIO
+
+# Attributes every LogRecord has; anything else was passed via `extra=`.
+_STANDARD_ATTRS = frozenset({
+    "name", "msg", "args", "levelname", "levelno", "pathname", "filename",
+    "module", "exc_info", "exc_text", "stack_info", "lineno", "funcName",
+    "created", "msecs", "relativeCreated", "thread", "threadName",
+    "processName", "process", "taskName", "message",
+})
 
 
 class _JsonFormatter(logging.Formatter):
@@ -20,32 +31,208 @@ class _JsonFormatter(logging.Formatter):
         }
 
         # Include extra fields safely (anything not in the standard LogRecord set)
-        standard = {
-            "name", "msg", "args", "levelname", "levelno", "pathname", "filename",
-            "module", "exc_info", "exc_text", "stack_info", "lineno", "funcName",
-            "created", "msecs", "relativeCreated", "thread", "threadName",
-            "processName", "process",
-        }
         for k, v in record.__dict__.items():
-            if k not in standard and not k.startswith("_"):
+            if k not in _STANDARD_ATTRS and not k.startswith("_"):
                 base[k] = v
 
         if record.exc_info:
             base["exc"] = self.formatException(record.exc_info)
 
-        return json.dumps(base, ensure_ascii=False)
+        return json.dumps(base, ensure_ascii=False, default=str)
+
+
+def parse_event_map(spec: str, *, name: str = "RATELIMMQ_LOG_SAMPLE") -> Dict[str, float]:
+    """Parse "fetch_done=0.01,fetch_start=0" into {"fetch_done": 0.01, ...}."""
+    out: Dict[str, float] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        event, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"bad {name} entry: {item!r}")
+        v = float(value)
+        if v < 0:
+            raise ValueError(f"{name} values must be >= 0: {item!r}")
+        out[event.strip()] = v
+    return out
+
+
+def _is_failure(record: logging.LogRecord) -> bool:
+    if record.levelno >= logging.WARNING:
+        return True
+    d = record.__dict__
+    return d.get("ok") is False or d.get("error") is not None
+
+
+class LogSampler(logging.Filter):
+    """
+    Per-event sampling and rate caps, keyed by the record's message (the
+    event name, e.g. "fetch_done").
+
+    - rates: event -> fraction of records kept (0.01 keeps 1%); events not
+      listed are all kept. Failures (WARNING and above, or records with
+      ok=False or an error) are never sampled out.
+    - max_per_s: event -> at most this many records per second (burst of
+      one second's worth); applies to failures too, as a flood guard
+
+    Counters: sampled_out, rate_limited.
+    """
+
+    def __init__(
+        self,
+        rates: Optional[Mapping[str, float]] = None,
+        max_per_s: Optional[Mapping[str, float]] = None,
+    ) -> None:
+        super().__init__()
+        self.rates = {k: min(1.0, float(v)) for k, v in (rates or {}).items()}
+        self.max_per_s = {k: float(v) for k, v in (max_per_s or {}).items()}
+        self._buckets: Dict[str, List[float]] = {}  # event -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+        # Counters
+        self.sampled_out = 0
+        self.rate_limited = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = record.msg if isinstance(record.msg, str) else ""
+        rate = self.rates.get(event)
+        if rate is not None and rate < 1.0 and random.random() >= rate and not _is_failure(record):
+            self.sampled_out += 1
+            return False
+        cap = self.max_per_s.get(event)
+        if cap is not None and not self._take(event, cap, record.created):
+            self.rate_limited += 1
+            return False
+        return True
+
+    def _take(self, event: str, cap: float, now: float) -> bool:
+        with self._lock:
+            b = self._buckets.get(event)
+            if b is None:
+                b = self._buckets[event] = [cap, now]
+            b[0] = min(cap, b[0] + max(0.0, now - b[1]) * cap)
+            b[1] = now
+            if b[0] >= 1.0:
+                b[0] -= 1.0
+                return True
+            return False
+
+
+_STOP = object()
+
+
+class QueuedHandler(logging.Handler):
+    """
+    Hands records to a background thread that formats them and writes them
+    to `stream` in batches (one write + flush per batch), so the calling
+    thread (usually the event loop) only pays for an enqueue.
+
+    The queue holds at most `queue_size` records; when it is full new
+    records are dropped and counted (dropped) rather than blocking the
+    caller. Counters: emitted, dropped, batches, format_errors.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, *, queue_size: int = 10_000, batch_size: int = 512) -> None:
+        super().__init__()
+        if queue_size < 1 or batch_size < 1:
+            raise ValueError("queue_size and batch_size must be >= 1")
+        self.stream = stream if stream is not None else sys.stdout
+        self.batch_size = int(batch_size)
+        self._q: "queue.Queue[Any]" = queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._run, name="ratelimmq-log", daemon=True)
+        self._thread.start()
+
+        # Counters
+        self.emitted = 0
+        self.dropped = 0
+        self.batches = 0
+        self.format_errors = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self._q.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._q.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            stop = False
+            for record in batch:
+                if record is _STOP:
+                    stop = True
+                    continue
+                try:
+                    lines.append(self.format(record))
+                except Exception:
+                    self.format_errors += 1
+            if lines:
+                try:
+                    self.stream.write("\n".join(lines) + "\n")
+                    self.stream.flush()
+                except Exception:
+                    self.format_errors += len(lines)
+                self.emitted += len(lines)
+                self.batches += 1
+            if stop:
+                return
+
+    def close(self) -> None:
+        """Write out everything queued so far, then stop the thread."""
+        if self._thread.is_alive():
+            self._q.put(_STOP)
+            self._thread.join(timeout=5.0)
+        super().close()
+
+
+# The handler and sampler installed by configure_logging(queued=True / sample=...).
+_pipeline: Dict[str, Any] = {}
+
+
+def logging_stats() -> Dict[str, int]:
+    """Counters of the configured pipeline (zeros for parts not in use)."""
+    handler = _pipeline.get("handler")
+    sampler = _pipeline.get("sampler")
+    return {
+        "emitted": getattr(handler, "emitted", 0),
+        "dropped": getattr(handler, "dropped", 0),
+        "batches": getattr(handler, "batches", 0),
+        "format_errors": getattr(handler, "format_errors", 0),
+        "sampled_out": getattr(sampler, "sampled_out", 0),
+        "rate_limited": getattr(sampler, "rate_limited", 0),
+    }
 
 
 def configure_logging(
     *,
     level: Optional[str] = None,
     fmt: Optional[str] = None,
+    queued: Optional[bool] = None,
+    queue_size: Optional[int] = None,
+    sample: Optional[Mapping[str, float]] = None,
+    max_per_s: Optional[Mapping[str, float]] = None,
+    stream: Optional[TextIO] = None,
 ) -> None:
     """
     Configure logging ONCE for the whole process.
 
     - level: "DEBUG", "INFO", ...
     - fmt: "json" or "plain"
+    - queued: format and write from a background thread in batches
+      (RATELIMMQ_LOG_QUEUE=1); queue_size caps buffered records
+      (RATELIMMQ_LOG_QUEUE_SIZE), beyond it records are dropped and counted
+    - sample: event -> fraction kept, e.g. {"fetch_done": 0.01}
+      (RATELIMMQ_LOG_SAMPLE="fetch_done=0.01"); failures are always kept
+    - max_per_s: event -> records per second cap (RATELIMMQ_LOG_MAX_PER_S)
+
+    logging_stats() reports the dropped/sampled counters.
     """
     # If logging is already configured, don't add duplicate handlers.
     root = logging.getLogger()
@@ -54,13 +241,31 @@ def configure_logging(
 
     level = (level or os.environ.get("RATELIMMQ_LOG_LEVEL", "INFO")).upper()
     fmt = (fmt or os.environ.get("RATELIMMQ_LOG_FORMAT", "json")).lower()
+    if queued is None:
+        queued = os.environ.get("RATELIMMQ_LOG_QUEUE", "0") == "1"
+    if sample is None:
+        sample = parse_event_map(os.environ.get("RATELIMMQ_LOG_SAMPLE", ""))
+    if max_per_s is None:
+        max_per_s = parse_event_map(os.environ.get("RATELIMMQ_LOG_MAX_PER_S", ""), name="RATELIMMQ_LOG_MAX_PER_S")
 
-    handler = logging.StreamHandler(sys.stdout)
+    handler: logging.Handler
+    if queued:
+        size = queue_size if queue_size is not None else int(os.environ.get("RATELIMMQ_LOG_QUEUE_SIZE", "10000"))
+        handler = QueuedHandler(stream, queue_size=size)
+    else:
+        handler = logging.StreamHandler(stream if stream is not None else sys.stdout)
 
     if fmt == "plain":
         handler.setFormatter(logging.Formatter("%(levelname)s %(name)s: %(message)s"))
     else:
         handler.setFormatter(_JsonFormatter())
 
+    _pipeline.clear()
+    _pipeline["handler"] = handler
+    if sample or max_per_s:
+        sampler = LogSampler(sample, max_per_s)
+        handler.addFilter(sampler)
+        _pipeline["sampler"] = sampler
+
     root.setLevel(level)
     root.addHandler(handler)
@@ -15,11 +15,13 @@ def _ts_iso() -> str:
     return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
 
 
-def log_event(event: str, **fields: Any) -> None:
+def log_event(event: str, *, flush: bool = False, **fields: Any) -> None:
     """
-    Print a structured JSON log line to stdout.
+    Write a structured JSON log line to stdout.
     - event: name of the event (string)
     - **fields: any additional structured data (url, latency, etc.)
+    - flush: force the line out now; by default stdout's buffer batches
+      lines into few writes (it is still flushed at exit)
     """
     record: Dict[str, Any] = {
         "timestamp": _ts_iso(),
@@ -33,7 +35,9 @@ def log_event(event: str, **fields: Any) -> None:
         # fallback to plain text if serialization fails
         line = f'{{"timestamp":"{_ts_iso()}","event":"error","error":"{e}"}}'
 
-    print(line, file=sys.stdout, flush=True)
+    sys.stdout.write(line + "\n")
+    if flush:
+        sys.stdout.flush()
 
 
 def log_fetch_result(
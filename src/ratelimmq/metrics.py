@@ -1,8 +1,13 @@
 from __future__ import annotations
 
+import asyncio
+import bisect
 import math
+import socket
+import threading
+import time
 from dataclasses import dataclass
-from typing import Iterable, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 
 @dataclass(frozen=True)
@@ -105,60 +110,618 @@ def summarize_latencies(
 
 
 # -------------------------------
-# Optional Prometheus integration
+# Streaming quantile sketch
 # -------------------------------
-# CI should NOT require prometheus_client. If it's missing, these become no-ops.
 
-_HAS_PROM = False
-try:
-    from prometheus_client import Counter, Histogram, start_http_server  # type: ignore
+class LatencySketch:
+    """
+    Mergeable streaming quantile sketch (DDSketch-style log buckets).
+
+    Every quantile it reports is within `relative_accuracy` of the true value
+    (e.g. 0.01 -> within 1%), using memory proportional to the log of the
+    value range, not the sample count. At most `max_buckets` buckets are kept;
+    past that, the lowest buckets are folded together (low quantiles lose
+    accuracy first, the tail keeps it).
+
+    Sketches with the same relative_accuracy merge exactly, so workers or
+    processes can ship `to_dict()` instead of raw samples.
+    """
+
+    __slots__ = ("relative_accuracy", "max_buckets", "_gamma", "_log_gamma",
+                 "_bins", "_zero", "count", "sum", "min", "max")
+
+    # Values at or below this (seconds) land in a single zero bucket.
+    MIN_VALUE = 1e-9
+
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048) -> None:
+        if not (0.0 < relative_accuracy < 1.0):
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        if max_buckets < 2:
+            raise ValueError("max_buckets must be >= 2")
+        self.relative_accuracy = float(relative_accuracy)
+        self.max_buckets = int(max_buckets)
+        self._gamma = (1.0 + relative_accuracy) / (1.0 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._bins: Dict[int, int] = {}
+        self._zero = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value_s: float, n: int = 1) -> None:
+        v = float(value_s)
+        if v < 0.0 or v != v:
+            return
+        if v <= self.MIN_VALUE:
+            self._zero += n
+        else:
+            k = math.ceil(math.log(v) / self._log_gamma)
+            bins = self._bins
+            bins[k] = bins.get(k, 0) + n
+            if len(bins) > self.max_buckets:
+                self._collapse()
+        self.count += n
+        self.sum += v * n
+        if v < self.min:
+            self.min = v
+        if v > self.max:
+            self.max = v
+
+    def _collapse(self) -> None:
+        keys = sorted(self._bins)
+        extra = len(keys) - self.max_buckets
+        if extra <= 0:
+            return
+        target = keys[extra]
+        moved = sum(self._bins.pop(k) for k in keys[:extra])
+        self._bins[target] += moved
+
+    def merge(self, other: "LatencySketch") -> None:
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("can only merge sketches with the same relative_accuracy")
+        for k, c in other._bins.items():
+            self._bins[k] = self._bins.get(k, 0) + c
+        if len(self._bins) > self.max_buckets:
+            self._collapse()
+        self._zero += other._zero
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """Approximate q-quantile in seconds (0.0 if empty)."""
+        if self.count == 0:
+            return 0.0
+        q = min(1.0, max(0.0, float(q)))
+        rank = q * (self.count - 1)
+
+        seen = self._zero
+        if seen > rank:
+            return max(0.0, self.min)
+        for k in sorted(self._bins):
+            seen += self._bins[k]
+            if seen > rank:
+                v = 2.0 * (self._gamma ** k) / (self._gamma + 1.0)
+                return min(self.max, max(self.min, v))
+        return self.max
+
+    def summary(self, total_time_s: Optional[float] = None) -> LatencySummary:
+        """Build a LatencySummary (same shape as summarize_latencies)."""
+        count = self.count
+        if total_time_s is None:
+            total_time_s = self.sum if count else 0.0
+        total_time_s = float(total_time_s) if total_time_s and total_time_s > 0 else 0.0
+        rps = (count / total_time_s) if total_time_s > 0 else 0.0
+
+        if count == 0:
+            return LatencySummary(
+                count=0, total_s=total_time_s, rps=rps, mean_ms=0.0,
+                p50_ms=0.0, p95_ms=0.0, p99_ms=0.0, min_ms=0.0, max_ms=0.0,
+            )
+
+        return LatencySummary(
+            count=count,
+            total_s=total_time_s,
+            rps=rps,
+            mean_ms=(self.sum / count) * 1000.0,
+            p50_ms=self.quantile(0.50) * 1000.0,
+            p95_ms=self.quantile(0.95) * 1000.0,
+            p99_ms=self.quantile(0.99) * 1000.0,
+            min_ms=self.min * 1000.0,
+            max_ms=self.max * 1000.0,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly state, for shipping between processes."""
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "max_buckets": self.max_buckets,
+            "bins": {str(k): c for k, c in self._bins.items()},
+            "zero": self._zero,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "LatencySketch":
+        sk = cls(float(d["relative_accuracy"]), int(d.get("max_buckets", 2048)))
+        sk._bins = {int(k): int(c) for k, c in d.get("bins", {}).items()}
+        sk._zero = int(d.get("zero", 0))
+        sk.count = int(d.get("count", 0))
+        sk.sum = float(d.get("sum", 0.0))
+        if sk.count:
+            sk.min = float(d["min"])
+            sk.max = float(d["max"])
+        return sk
+
+
+class RollingLatency:
+    """
+    Sliding-window latency stats for live p50/p95/p99 and rps.
+
+    The window is split into `slices` sub-sketches; observations go into the
+    current slice and whole slices expire as time moves on, so memory is
+    `slices` sketches regardless of traffic. `now` can be injected for
+    deterministic tests (same convention as TokenBucket.allow).
+    """
+
+    def __init__(
+        self,
+        window_s: float = 60.0,
+        slices: int = 12,
+        *,
+        relative_accuracy: float = 0.01,
+    ) -> None:
+        if window_s <= 0:
+            raise ValueError("window_s must be > 0")
+        if slices < 1:
+            raise ValueError("slices must be >= 1")
+        self.window_s = float(window_s)
+        self.slices = int(slices)
+        self._slice_s = self.window_s / self.slices
+        self._accuracy = relative_accuracy
+        # ring of (slice_index, sketch)
+        self._ring: List[Tuple[int, LatencySketch]] = [
+            (-1, LatencySketch(relative_accuracy)) for _ in range(self.slices)
+        ]
+        self._started: Optional[float] = None
+
+    def _slot(self, now: float) -> LatencySketch:
+        idx = int(now // self._slice_s)
+        pos = idx % self.slices
+        cur_idx, sk = self._ring[pos]
+        if cur_idx != idx:
+            sk = LatencySketch(self._accuracy)
+            self._ring[pos] = (idx, sk)
+        return sk
+
+    def add(self, latency_s: float, now: Optional[float] = None) -> None:
+        t = time.monotonic() if now is None else float(now)
+        if self._started is None:
+            self._started = t
+        self._slot(t).add(latency_s)
+
+    def snapshot(self, now: Optional[float] = None) -> LatencySketch:
+        """Merged sketch of everything still inside the window."""
+        t = time.monotonic() if now is None else float(now)
+        oldest = int(t // self._slice_s) - self.slices + 1
+        out = LatencySketch(self._accuracy)
+        for idx, sk in self._ring:
+            if idx >= oldest and sk.count:
+                out.merge(sk)
+        return out
+
+    def summary(self, now: Optional[float] = None) -> LatencySummary:
+        """LatencySummary for the window; rps is over the covered span."""
+        t = time.monotonic() if now is None else float(now)
+        span = self.window_s
+        if self._started is not None:
+            span = min(span, max(t - self._started, self._slice_s))
+        return self.snapshot(t).summary(total_time_s=span)
+
+
+# ---------------------------------------------
+# Metrics registry + Prometheus text exposition
+# ---------------------------------------------
+# No dependencies. Updates are plain attribute/dict operations with no locks:
+# they are meant to happen on the event loop thread (fetch_one, run_pool).
+
+# Latency buckets in seconds (same as the old prometheus_client histogram).
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+# Label value that absorbs new series once a metric hits max_series.
+OVERFLOW_LABEL = "__other__"
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)  # non-cumulative; rendered cumulative
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.bounds, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...],
+        max_series: Optional[int],
+        overflow: Optional[Tuple[str, ...]] = None,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        # Labels replaced by OVERFLOW_LABEL past max_series (default: all of them)
+        fold = self.labelnames if overflow is None else tuple(overflow)
+        unknown = set(fold) - set(self.labelnames)
+        if unknown:
+            raise ValueError(f"{name}: overflow labels {sorted(unknown)} are not in {self.labelnames}")
+        self._fold = tuple(n in fold for n in self.labelnames)
+        self._series: Dict[Tuple[str, ...], Any] = {}
+        self.overflowed = 0  # observations folded into the OVERFLOW_LABEL series
+
+    def _new(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: str) -> Any:
+        """The child series for these label values (positional, in labelnames order)."""
+        child = self._series.get(values)
+        if child is not None:
+            return child
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values!r}")
+        if self.max_series is not None and len(self._series) >= self.max_series:
+            self.overflowed += 1
+            values = tuple(OVERFLOW_LABEL if f else v for f, v in zip(self._fold, values))
+            child = self._series.get(values)
+            if child is not None:
+                return child
+        child = self._series[values] = self._new()
+        return child
+
+
+class Counter(_Metric):
+    kind = "counter"
 
-    _HAS_PROM = True
-except Exception:
-    Counter = None  # type: ignore
-    Histogram = None  # type: ignore
-    start_http_server = None  # type: ignore
+    def _new(self) -> _Value:
+        return _Value()
 
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
 
-_REQ_TOTAL = None
-_REQ_LATENCY_S = None
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...],
+        max_series: Optional[int],
+        overflow: Optional[Tuple[str, ...]] = None,
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labelnames, max_series, overflow)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+
+    def _new(self) -> _Buckets:
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+
+def _fmt(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    if v == int(v) and abs(v) < 1e15:
+        return str(int(v))
+    return repr(float(v))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms, rendered in the Prometheus text format
+    (version 0.0.4) by render().
+
+    Metrics are registered once by name (registering the same name again
+    returns the existing metric). max_series caps each metric's label
+    combinations; past it, new ones share a series whose `overflow` labels
+    (all labels unless given, e.g. just ("host",)) are OVERFLOW_LABEL, so an
+    unbounded label such as the host can't grow memory while bounded ones
+    such as the outcome keep their breakdown.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get(self, cls: type, name: str, *args: Any, **kw: Any) -> Any:
+        m = self._metrics.get(name)
+        if m is None:
+            m = self._metrics[name] = cls(name, *args, **kw)
+        elif not isinstance(m, cls):
+            raise ValueError(f"metric {name!r} already registered as a {m.kind}")
+        return m
+
+    def counter(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...] = (),
+        max_series: Optional[int] = None,
+        overflow: Optional[Tuple[str, ...]] = None,
+    ) -> Counter:
+        return self._get(Counter, name, help, labelnames, max_series, overflow)
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...] = (),
+        max_series: Optional[int] = None,
+        overflow: Optional[Tuple[str, ...]] = None,
+    ) -> Gauge:
+        return self._get(Gauge, name, help, labelnames, max_series, overflow)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...] = (),
+        max_series: Optional[int] = None,
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+        overflow: Optional[Tuple[str, ...]] = None,
+    ) -> Histogram:
+        return self._get(Histogram, name, help, labelnames, max_series, overflow, buckets)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        out: List[str] = []
+        for m in list(self._metrics.values()):
+            out.append(f"# HELP {m.name} {m.help}")
+            out.append(f"# TYPE {m.name} {m.kind}")
+            for values, child in list(m._series.items()):
+                if isinstance(child, _Buckets):
+                    cum = 0
+                    for bound, n in zip(child.bounds, child.counts):
+                        cum += n
+                        le = _labels_text(m.labelnames, values, f'le="{_fmt(bound)}"')
+                        out.append(f"{m.name}_bucket{le} {cum}")
+                    le = _labels_text(m.labelnames, values, 'le="+Inf"')
+                    out.append(f"{m.name}_bucket{le} {child.count}")
+                    lbl = _labels_text(m.labelnames, values)
+                    out.append(f"{m.name}_sum{lbl} {_fmt(child.sum)}")
+                    out.append(f"{m.name}_count{lbl} {child.count}")
+                else:
+                    out.append(f"{m.name}{_labels_text(m.labelnames, values)} {_fmt(child.value)}")
+        return "\n".join(out) + "\n"
+
+
+# Process-wide default registry (what serve_metrics exports by default).
+REGISTRY = MetricsRegistry()
+
+# Per-host series per metric before hosts share the OVERFLOW_LABEL series.
+MAX_HOST_SERIES = 200
+
+
+def fetch_outcome(ok: bool, status_code: Optional[int], error: Optional[str]) -> str:
+    """Outcome label for one fetch: ok | http_4xx | http_5xx | circuit_open | error."""
+    if ok:
+        return "ok"
+    if status_code is not None and status_code >= 400:
+        return "http_5xx" if status_code >= 500 else "http_4xx"
+    if error and error.startswith("CircuitOpen"):
+        return "circuit_open"
+    return "error"
+
+
+class FetchMetrics:
+    """Metrics fetch_one records: requests by host and outcome, latency, bytes, in-flight."""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, *, max_hosts: int = MAX_HOST_SERIES) -> None:
+        self.requests = registry.counter(
+            "ratelimmq_fetch_requests_total",
+            "Finished fetches",
+            ("host", "outcome"),
+            max_series=max_hosts * 5,
+            overflow=("host",),
+        )
+        self.latency = registry.histogram(
+            "ratelimmq_fetch_latency_seconds", "Fetch latency in seconds, all attempts included", ("outcome",)
+        )
+        self.bytes = registry.counter(
+            "ratelimmq_fetch_body_bytes_total", "Response body bytes read", ("host",), max_series=max_hosts
+        )
+        self.attempts = registry.counter("ratelimmq_fetch_attempts_total", "HTTP attempts, retries included")
+        self.in_flight = registry.gauge("ratelimmq_fetch_in_flight", "Fetches in progress")
+
+
+class PoolMetrics:
+    """Metrics stream_pool/run_pool record: queue depth, in-flight, slot waits, coalescing."""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, *, max_hosts: int = MAX_HOST_SERIES) -> None:
+        self.queue_depth = registry.gauge("ratelimmq_pool_queue_depth", "URLs queued for a worker")
+        self.in_flight = registry.gauge("ratelimmq_pool_in_flight", "Fetches holding pool slots")
+        self.host_in_flight = registry.gauge(
+            "ratelimmq_pool_host_in_flight", "Fetches holding a slot, by host", ("host",), max_series=max_hosts
+        )
+        self.slot_wait = registry.histogram(
+            "ratelimmq_pool_slot_wait_seconds",
+            "Time from dequeue to start: global + per-host semaphores and rate token",
+            buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+        )
+        self.coalesced = registry.counter("ratelimmq_pool_coalesced_total", "Duplicate URLs served by an in-flight fetch")
+        self.circuit_skips = registry.counter(
+            "ratelimmq_pool_circuit_skips_total", "URLs that skipped the queue because their host breaker was open"
+        )
+
+
+# Default instrumentation on REGISTRY, used unless callers pass metrics=None.
+FETCH_METRICS = FetchMetrics()
+POOL_METRICS = PoolMetrics()
+
+
+async def _handle_scrape(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, registry: MetricsRegistry) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5.0)
+        while True:
+            line = await asyncio.wait_for(reader.readline(), 5.0)
+            if line in (b"\r\n", b"\n", b""):
+                break
+        parts = request_line.decode("latin-1").split()
+        path = parts[1].split("?", 1)[0] if len(parts) >= 2 else ""
+        if len(parts) >= 2 and parts[0] in ("GET", "HEAD") and path in ("/metrics", "/"):
+            status, ctype, body = "200 OK", "text/plain; version=0.0.4; charset=utf-8", registry.render().encode()
+        else:
+            status, ctype, body = "404 Not Found", "text/plain; charset=utf-8", b"not found\n"
+        body_out = b"" if parts and parts[0] == "HEAD" else body
+        head = (
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: {ctype}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body_out)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(
+    host: str = "127.0.0.1", port: int = 9100, *, registry: MetricsRegistry = REGISTRY
+) -> asyncio.AbstractServer:
+    """
+    Serve `registry` as Prometheus text on http://host:port/metrics from the
+    running event loop (one request per connection). Close the returned
+    server to stop it.
+    """
+    return await asyncio.start_server(lambda r, w: _handle_scrape(r, w, registry), host, port)
+
+
+# Back-compat with the old optional prometheus_client integration.
+_LEGACY_REQUESTS = REGISTRY.counter("ratelimmq_requests_total", "Total HTTP fetch requests", ("outcome",))
+_LEGACY_LATENCY = REGISTRY.histogram("ratelimmq_request_latency_seconds", "HTTP fetch request latency in seconds")
 _PROM_STARTED = False
+_PROM_TASK: Optional["asyncio.Task[asyncio.AbstractServer]"] = None
 
 
 def start_prometheus(port: int = 8000) -> bool:
-    """Start /metrics endpoint. Returns False if prometheus_client isn't installed."""
-    global _PROM_STARTED, _REQ_TOTAL, _REQ_LATENCY_S
-
-    if not _HAS_PROM or start_http_server is None:
-        return False
+    """
+    Start the /metrics endpoint for REGISTRY: on the running event loop if
+    called from one, else on a background thread's loop. Returns True once
+    listening (or if already started), False if the port can't be bound
+    (kept for callers of the old prometheus_client-based version).
+    """
+    global _PROM_STARTED, _PROM_TASK
     if _PROM_STARTED:
         return True
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None:
+        # Bind now so a busy port is reported here, not lost in a task.
+        try:
+            sock = socket.create_server(("0.0.0.0", int(port)))
+        except OSError:
+            return False
+        _PROM_TASK = loop.create_task(
+            asyncio.start_server(lambda r, w: _handle_scrape(r, w, REGISTRY), sock=sock)
+        )
+        _PROM_STARTED = True
+        return True
 
-    _REQ_TOTAL = Counter(
-        "ratelimmq_requests_total",
-        "Total HTTP fetch requests",
-        ["outcome"],
-    )
-    _REQ_LATENCY_S = Histogram(
-        "ratelimmq_request_latency_seconds",
-        "HTTP fetch request latency in seconds",
-        buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0),
-    )
-
-    start_http_server(int(port))
+    ready = threading.Event()
+    failed: List[BaseException] = []
+
+    def _run() -> None:
+        async def _main() -> None:
+            try:
+                server = await serve_metrics("0.0.0.0", int(port))
+            except BaseException as e:
+                failed.append(e)
+                ready.set()
+                return
+            ready.set()
+            async with server:
+                await server.serve_forever()
+
+        asyncio.run(_main())
+
+    threading.Thread(target=_run, name="ratelimmq-metrics", daemon=True).start()
+    if not ready.wait(5.0) or failed:
+        return False
     _PROM_STARTED = True
     return True
 
 
 def prom_observe(outcome: str, elapsed_s: float) -> None:
-    """Record metrics if Prometheus is enabled; otherwise no-op."""
-    if not _HAS_PROM:
-        return
-    if _REQ_TOTAL is None or _REQ_LATENCY_S is None:
-        return
-
-    try:
-        _REQ_TOTAL.labels(outcome=outcome).inc()
-        _REQ_LATENCY_S.observe(float(elapsed_s))
-    except Exception:
-        return
+    """Record one request in the legacy ratelimmq_requests_total / latency metrics."""
+    _LEGACY_REQUESTS.labels(outcome).inc()
+    _LEGACY_LATENCY.labels().observe(float(elapsed_s))
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from typing import TYPE_CHECKING, Deque, Dict, Iterable, List, Optional
+
+if TYPE_CHECKING:
+    from ratelimmq.wal import WriteAheadLog
+
+
+class QueueFull(Exception):
+    """The queue is at capacity; the producer should back off and retry."""
+
+
+class TooManyQueues(Exception):
+    """Creating another named queue would exceed the registry limit."""
+
+
+class MessageQueue:
+    """
+    Bounded FIFO of messages with async blocking pops.
+
+    - push/pop are O(1) (collections.deque) regardless of depth
+    - a push while consumers are parked hands the message straight to the
+      oldest waiter instead of going through the deque
+    - pushes beyond `capacity` raise QueueFull (explicit backpressure)
+    """
+
+    def __init__(self, capacity: int) -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be >= 1")
+        self.capacity = int(capacity)
+        self._items: Deque[str] = deque()
+        self._waiters: Deque[asyncio.Future[Optional[str]]] = deque()
+
+        # Counters
+        self.pushed = 0
+        self.popped = 0
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def free(self) -> int:
+        return self.capacity - len(self._items)
+
+    def _handoff(self, msg: str) -> bool:
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(msg)
+                self.popped += 1
+                return True
+        return False
+
+    def push(self, msg: str) -> int:
+        """Append one message. Returns the new depth; raises QueueFull."""
+        self.pushed += 1
+        if self._handoff(msg):
+            return len(self._items)
+        if len(self._items) >= self.capacity:
+            self.pushed -= 1
+            self.rejected += 1
+            raise QueueFull()
+        self._items.append(msg)
+        return len(self._items)
+
+    def push_many(self, msgs: Iterable[str]) -> int:
+        """
+        Append as many messages as fit, in order. Returns how many were
+        accepted; the caller should resend the rest later.
+        """
+        accepted = 0
+        for msg in msgs:
+            try:
+                self.push(msg)
+            except QueueFull:
+                break
+            accepted += 1
+        return accepted
+
+    def pop(self) -> Optional[str]:
+        if not self._items:
+            return None
+        self.popped += 1
+        return self._items.popleft()
+
+    def pop_many(self, n: int) -> List[str]:
+        items = self._items
+        k = min(max(0, int(n)), len(items))
+        out = [items.popleft() for _ in range(k)]
+        self.popped += k
+        return out
+
+    def unpop(self, msg: str) -> None:
+        """Give back a popped message that was never delivered: it is next in line again."""
+        self.popped -= 1
+        if not self._handoff(msg):
+            self._items.appendleft(msg)
+
+    async def pop_wait(self, timeout_s: Optional[float]) -> Optional[str]:
+        """
+        Pop, or park until a message arrives or `timeout_s` passes (None
+        means wait forever). Returns None on timeout.
+
+        Cancellation-safe: a message handed to a waiter that is cancelled
+        before it resumes goes back to the front of the queue.
+        """
+        msg = self.pop()
+        if msg is not None or (timeout_s is not None and timeout_s <= 0):
+            return msg
+
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future[Optional[str]] = loop.create_future()
+        self._waiters.append(fut)
+
+        def _expire() -> None:
+            if not fut.done():
+                fut.set_result(None)
+
+        timer = loop.call_later(timeout_s, _expire) if timeout_s is not None else None
+        try:
+            return await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled() and fut.result() is not None:
+                self.unpop(fut.result())
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+
+class QueueRegistry:
+    """
+    Named queues, created on first push, each bounded at `capacity`.
+
+    With a WriteAheadLog, restore() reloads the queues from disk and handlers
+    call log_push()/log_pop() after each successful operation; the awaitable
+    completes once the record is durable (per the log's durability mode).
+    A queue's `pushed`/`popped` counters double as the log's message indexes.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 10_000,
+        max_queues: int = 1_000,
+        *,
+        wal: Optional["WriteAheadLog"] = None,
+    ) -> None:
+        if max_queues < 1:
+            raise ValueError("max_queues must be >= 1")
+        self.capacity = int(capacity)
+        self.max_queues = int(max_queues)
+        self.wal = wal
+        self._queues: Dict[str, MessageQueue] = {}
+
+    def restore(self) -> int:
+        """Replay the write-ahead log into empty queues. Returns messages restored."""
+        if self.wal is None:
+            return 0
+        restored = 0
+        for name, state in self.wal.replay().items():
+            q = self._queues.get(name) or MessageQueue(self.capacity)
+            q._items.extend(state.messages)
+            q.pushed = state.pushed
+            q.popped = state.consumed
+            self._queues[name] = q
+            restored += len(state.messages)
+        return restored
+
+    async def log_push(self, name: str, q: MessageQueue, msgs: List[str]) -> None:
+        """Record that `msgs` (the last len(msgs) accepted) were pushed to `name`."""
+        if self.wal is not None and msgs:
+            await self.wal.append_push(name, q.pushed - len(msgs), msgs)
+
+    async def log_pop(self, name: str, q: MessageQueue) -> None:
+        if self.wal is not None:
+            await self.wal.append_pop(name, q.popped)
+
+    def __len__(self) -> int:
+        return len(self._queues)
+
+    def get(self, name: str) -> Optional[MessageQueue]:
+        return self._queues.get(name)
+
+    def get_or_create(self, name: str) -> MessageQueue:
+        q = self._queues.get(name)
+        if q is None:
+            if len(self._queues) >= self.max_queues:
+                raise TooManyQueues()
+            q = MessageQueue(self.capacity)
+            self._queues[name] = q
+        return q
@@ -1,12 +1,18 @@
 from __future__ import annotations
 
+import struct
 from dataclasses import dataclass
+from typing import Dict, Union
+
+Payload = Union[bytes, memoryview]
 
 
 @dataclass(frozen=True)
 class Request:
     cmd: str
     args: list[str]
+    # Raw frame payload in binary mode (never decoded); None for text lines.
+    payload: Payload | None = None
 
 
 @dataclass(frozen=True)
@@ -32,3 +38,43 @@ def bye() -> Response:
 
 def err_unknown() -> Response:
     return Response("ERR unknown command\n")
+
+
+# -------------------------------
+# Binary framing (opt-in per connection)
+# -------------------------------
+# A client switches its connection to binary mode by sending BINARY_MAGIC as
+# its very first bytes; the server echoes it back. After that:
+#
+#   request:  u32 length (big-endian) | u8 opcode | payload (length - 1 bytes)
+#   response: u32 length (big-endian) | payload   (the text response, no "\n")
+#
+# Opcodes are mapped onto command names in router.OPCODES.
+
+BINARY_MAGIC = b"\x00RMQ\x01"
+REQUEST_HEADER = struct.Struct(">IB")
+LENGTH_PREFIX = struct.Struct(">I")
+
+_FRAME_CACHE: Dict[str, bytes] = {}
+_CONSTANT_LINES = {"PONG\n", "BYE\n", "OK\n", "ERR unknown command\n"}
+
+
+def encode_frame(payload: bytes) -> bytes:
+    return LENGTH_PREFIX.pack(len(payload)) + payload
+
+
+def encode_request(opcode: int, payload: bytes = b"") -> bytes:
+    return REQUEST_HEADER.pack(len(payload) + 1, opcode) + payload
+
+
+def response_frame(resp: Response) -> bytes:
+    """
+    Binary frame for a Response. Frames for the fixed responses (PONG, BYE,
+    ERR ...) are built once and reused; other lines are encoded per call.
+    """
+    frame = _FRAME_CACHE.get(resp.line)
+    if frame is None:
+        frame = encode_frame(resp.line.rstrip("\n").encode("utf-8"))
+        if resp.line in _CONSTANT_LINES:
+            _FRAME_CACHE[resp.line] = frame
+    return frame
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+import socket
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Mapping, Optional, Sequence
+
+# resolve(host, port) -> addresses; the default uses loop.getaddrinfo
+Lookup = Callable[[str, int], Awaitable[List[str]]]
+
+
+async def _getaddrinfo(host: str, port: int) -> List[str]:
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    out: List[str] = []
+    for _family, _type, _proto, _canon, sockaddr in infos:
+        addr = str(sockaddr[0])
+        if addr not in out:
+            out.append(addr)
+    return out
+
+
+def _retrieve(task: "asyncio.Task[List[str]]") -> None:
+    # Waiters re-raise a failed lookup; don't warn if they all gave up.
+    if not task.cancelled():
+        task.exception()
+
+
+class _Entry:
+    __slots__ = ("addrs", "expires_at", "next", "error")
+
+    def __init__(self, addrs: List[str], expires_at: float, error: Optional[BaseException] = None) -> None:
+        self.addrs = addrs
+        self.expires_at = expires_at
+        self.next = 0  # round-robin cursor
+        self.error = error
+
+
+class DNSCache:
+    """
+    Async, TTL- and size-bounded host name cache for the fetch path.
+
+    - resolve(host) returns one address; successive calls rotate through
+      every address the name resolved to (round-robin)
+    - concurrent lookups of the same name share one resolver call
+    - negative_ttl_s > 0 caches failures (the same error is raised again
+      until it expires); 0 disables negative caching
+    - static_hosts maps names to fixed addresses (never expire, never hit
+      the resolver), e.g. for tests or pinned origins
+    - IP literals are returned as-is
+
+    The resolver call runs in the loop's default executor (getaddrinfo), so
+    a slow name server never blocks the event loop.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl_s: float = 60.0,
+        negative_ttl_s: float = 0.0,
+        max_hosts: int = 10_000,
+        static_hosts: Optional[Mapping[str, Sequence[str]]] = None,
+        lookup: Optional[Lookup] = None,
+    ) -> None:
+        if ttl_s < 0 or negative_ttl_s < 0:
+            raise ValueError("ttl_s and negative_ttl_s must be >= 0")
+        if max_hosts < 1:
+            raise ValueError("max_hosts must be >= 1")
+        self.ttl_s = float(ttl_s)
+        self.negative_ttl_s = float(negative_ttl_s)
+        self.max_hosts = int(max_hosts)
+        self._lookup = lookup or _getaddrinfo
+        self._static: Dict[str, _Entry] = {
+            h.lower(): _Entry(list(addrs), float("inf")) for h, addrs in (static_hosts or {}).items() if addrs
+        }
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Task[List[str]]"] = {}
+
+        # Counters
+        self.hits = 0
+        self.misses = 0  # resolver calls
+        self.negative_hits = 0
+        self.coalesced = 0  # lookups that joined one already in flight
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _pick(entry: _Entry) -> str:
+        addr = entry.addrs[entry.next % len(entry.addrs)]
+        entry.next += 1
+        return addr
+
+    async def resolve(self, host: str, port: int = 0) -> str:
+        """One address for `host` (raises the resolver's error, e.g. socket.gaierror)."""
+        name = host.lower()
+        try:
+            ipaddress.ip_address(name)
+            return host
+        except ValueError:
+            pass
+        static = self._static.get(name)
+        if static is not None:
+            self.hits += 1
+            return self._pick(static)
+
+        now = time.monotonic()
+        entry = self._entries.get(name)
+        if entry is not None and now < entry.expires_at:
+            self._entries.move_to_end(name)
+            if entry.error is not None:
+                self.negative_hits += 1
+                raise entry.error
+            self.hits += 1
+            return self._pick(entry)
+
+        # The lookup runs in its own task: a caller that gives up (timeout,
+        # cancellation) stops waiting without cancelling it for the others.
+        task = self._inflight.get(name)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.get_running_loop().create_task(self._resolve(name, port))
+            task.add_done_callback(_retrieve)
+            self._inflight[name] = task
+        addrs = await asyncio.shield(task)
+        entry = self._entries.get(name)
+        return self._pick(entry) if entry is not None and entry.addrs else addrs[0]
+
+    async def _resolve(self, name: str, port: int) -> List[str]:
+        self.misses += 1
+        try:
+            addrs = await self._lookup(name, port)
+            if not addrs:
+                raise socket.gaierror(socket.EAI_NONAME, f"no addresses for {name}")
+        except Exception as e:
+            if self.negative_ttl_s > 0:
+                self._store(name, _Entry([], time.monotonic() + self.negative_ttl_s, e))
+            raise
+        finally:
+            self._inflight.pop(name, None)
+        if self.ttl_s > 0:
+            self._store(name, _Entry(addrs, time.monotonic() + self.ttl_s))
+        return addrs
+
+    def _store(self, name: str, entry: _Entry) -> None:
+        self._entries[name] = entry
+        self._entries.move_to_end(name)
+        while len(self._entries) > self.max_hosts:
+            self._entries.popitem(last=False)
+            self.evictions += 1
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import random
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, FrozenSet, Optional, Tuple, Type
+
+# Transient failures worth another attempt by default.
+RETRY_STATUSES: FrozenSet[int] = frozenset({408, 429, 500, 502, 503, 504})
+RETRY_ERRORS: Tuple[Type[BaseException], ...] = (
+    ConnectionError,  # resets, refused, aborted
+    TimeoutError,  # includes asyncio.TimeoutError and socket.timeout
+    EOFError,  # asyncio.IncompleteReadError: peer closed mid-response
+)
+
+# Set by the dispatcher around each fetch: awaited before every retry so
+# retries take a per-host rate token like first attempts do.
+retry_gate: contextvars.ContextVar[Optional[Callable[[], Awaitable[None]]]] = contextvars.ContextVar(
+    "ratelimmq_retry_gate", default=None
+)
+
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of overall traffic, so retries can't multiply
+    the load on an origin that is already failing.
+
+    Every first attempt deposits `ratio` tokens (capped at `max_tokens`);
+    every retry withdraws one. `min_per_s` tokens accrue per second on top,
+    so low-traffic callers can still retry occasionally.
+    """
+
+    def __init__(self, ratio: float = 0.1, *, min_per_s: float = 1.0, max_tokens: float = 100.0) -> None:
+        if ratio < 0:
+            raise ValueError("ratio must be >= 0")
+        if min_per_s < 0:
+            raise ValueError("min_per_s must be >= 0")
+        if max_tokens < 1:
+            raise ValueError("max_tokens must be >= 1")
+        self.ratio = float(ratio)
+        self.min_per_s = float(min_per_s)
+        self.max_tokens = float(max_tokens)
+        self._tokens = 0.0
+        self._last = time.monotonic()
+
+        # Counters
+        self.requests = 0
+        self.retries = 0
+        self.exhausted = 0
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self._last)
+        self._last = now
+        self._tokens = min(self.max_tokens, self._tokens + elapsed * self.min_per_s)
+
+    def record_request(self, now: Optional[float] = None) -> None:
+        self._refill(time.monotonic() if now is None else float(now))
+        self.requests += 1
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self, now: Optional[float] = None) -> bool:
+        """Take one retry token. False means the budget is exhausted: don't retry."""
+        self._refill(time.monotonic() if now is None else float(now))
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            self.retries += 1
+            return True
+        self.exhausted += 1
+        return False
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    When and how fetch_one retries.
+
+    - max_attempts: total attempts, including the first
+    - backoff: "full jitter", uniform(0, min(max_delay_s, base_delay_s * 2**n))
+      before retry n+1; a numeric Retry-After raises the wait (up to max_delay_s)
+    - retry_statuses / retry_errors: which outcomes are transient
+    - budget: optional RetryBudget shared by every fetch using this policy
+    """
+
+    max_attempts: int = 3
+    base_delay_s: float = 0.1
+    max_delay_s: float = 5.0
+    retry_statuses: FrozenSet[int] = RETRY_STATUSES
+    retry_errors: Tuple[Type[BaseException], ...] = RETRY_ERRORS
+    budget: Optional[RetryBudget] = None
+
+    def __post_init__(self) -> None:
+        if self.max_attempts < 1:
+            raise ValueError("max_attempts must be >= 1")
+        if self.base_delay_s < 0 or self.max_delay_s < 0:
+            raise ValueError("delays must be >= 0")
+
+    def retryable(self, status_code: Optional[int], exc_type: Optional[type]) -> bool:
+        if exc_type is not None:
+            return issubclass(exc_type, self.retry_errors)
+        return status_code is not None and status_code in self.retry_statuses
+
+    def backoff(self, retry: int, retry_after_s: Optional[float] = None, rng: Optional[random.Random] = None) -> float:
+        """Seconds to wait before retry number `retry` (1-based)."""
+        cap = min(self.max_delay_s, self.base_delay_s * (2 ** (retry - 1)))
+        delay = (rng or random).uniform(0.0, cap)
+        if retry_after_s is not None:
+            delay = max(delay, min(self.max_delay_s, retry_after_s))
+        return delay
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After in seconds (the HTTP-date form is ignored)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value.strip()))
+    except ValueError:
+        return None
+
+
+async def wait_for_retry(policy: RetryPolicy, retry: int, retry_after_s: Optional[float] = None) -> bool:
+    """
+    Sleep before retry `retry`, then take the dispatcher's per-host rate token
+    (if any). Returns False without sleeping when the retry budget is spent.
+    """
+    if policy.budget is not None and not policy.budget.try_spend():
+        return False
+    await asyncio.sleep(policy.backoff(retry, retry_after_s))
+    gate = retry_gate.get()
+    if gate is not None:
+        await gate()
+    return True
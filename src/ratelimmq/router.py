@@ -4,7 +4,8 @@ from typing import Awaitable, Callable
 
 from ratelimmq.context import Context
 from ratelimmq.protocol import Request, Response
-from ratelimmq.handlers.core import ping, shutdown, help_cmd, unknown
+from ratelimmq.handlers.core import ping, shutdown, help_cmd, stats, unknown
+from ratelimmq.handlers import queue
 
 Handler = Callable[[Context, Request], Awaitable[Response]]
 
@@ -12,6 +13,29 @@ ROUTES: dict[str, Handler] = {
     "PING": ping,
     "SHUTDOWN": shutdown,
     "HELP": help_cmd,
+    "PUSH": queue.push,
+    "POP": queue.pop,
+    "MPUSH": queue.mpush,
+    "MPOP": queue.mpop,
+    "BPOP": queue.bpop,
+    "QLEN": queue.qlen,
+    "STATS": stats,
+}
+
+# Binary-mode opcodes (see protocol.BINARY_MAGIC). Never renumber; only append.
+OPCODES: dict[int, str] = {
+    1: "PING",
+    2: "SHUTDOWN",
+    3: "HELP",
+    4: "AUTH",  # handled by the server session, payload = client id
+    # Queue commands: payload = the text-mode arguments, space-separated
+    5: "PUSH",
+    6: "POP",
+    7: "MPUSH",
+    8: "MPOP",
+    9: "BPOP",
+    10: "QLEN",
+    11: "STATS",
 }
 
 
@@ -1,15 +1,333 @@
 from __future__ import annotations
 
 import asyncio
+import math
 import os
 import signal
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional
 
 from ratelimmq.context import Context
-from ratelimmq.protocol import parse_line
-from ratelimmq.router import dispatch
+from ratelimmq.mq import QueueRegistry
+from ratelimmq.protocol import (
+    BINARY_MAGIC,
+    LENGTH_PREFIX,
+    Request,
+    Response,
+    encode_frame,
+    parse_line,
+    response_frame,
+)
+from ratelimmq.router import OPCODES, ROUTES, dispatch
 
 RATE_LIMIT_ERR = "ERR rate limited\n"
 LINE_TOO_LONG_ERR = "ERR line too long\n"
+FRAME_TOO_LONG_ERR = "ERR frame too long\n"
+EMPTY_FRAME_ERR = "ERR empty frame\n"
+RATE_LIMIT_ERR_B = RATE_LIMIT_ERR.encode("utf-8")
+LINE_TOO_LONG_ERR_B = LINE_TOO_LONG_ERR.encode("utf-8")
+
+# Pre-encoded binary-mode frames for the server's own errors
+RATE_LIMIT_ERR_FRAME = encode_frame(RATE_LIMIT_ERR_B.rstrip(b"\n"))
+FRAME_TOO_LONG_ERR_FRAME = encode_frame(FRAME_TOO_LONG_ERR.encode("utf-8").rstrip(b"\n"))
+EMPTY_FRAME_ERR_FRAME = encode_frame(EMPTY_FRAME_ERR.encode("utf-8").rstrip(b"\n"))
+
+AUTH_OK = "OK\n"
+AUTH_USAGE_ERR = "ERR usage: AUTH <client_id>\n"
+
+# Never rate limited: stopping the server, identifying yourself, and looking at it.
+UNLIMITED_CMDS = frozenset({"SHUTDOWN", "AUTH", "STATS"})
+# May park for a long time: replies queued ahead of them are sent first.
+BLOCKING_CMDS = frozenset({"BPOP"})
+
+
+# Pipelining knobs: how much to read per syscall, and how much response data
+# to buffer before forcing a write + drain mid-batch.
+READ_CHUNK_BYTES = 64 * 1024
+WRITE_HIGH_WATER = 64 * 1024
+
+
+@dataclass
+class _Session:
+    """Per-connection state."""
+    peer: str
+    client_id: Optional[str] = None
+    # Sends the replies batched so far; set by the session loop.
+    flush: Optional[Callable[[], Awaitable[None]]] = field(default=None, repr=False)
+
+    def limit_key(self, limit_by: str) -> str:
+        # "client" falls back to the peer address until the client sends AUTH.
+        if limit_by == "client" and self.client_id is not None:
+            return f"id:{self.client_id}"
+        return f"peer:{self.peer}"
+
+    async def flush_before_wait(self) -> None:
+        # Don't hold earlier pipelined replies back while this command waits.
+        if self.flush is not None:
+            await self.flush()
+
+
+def _rate_limited_line(retry_after_s: float) -> str:
+    if math.isinf(retry_after_s):
+        return RATE_LIMIT_ERR
+    return f"ERR rate limited retry_after_ms={max(1, math.ceil(retry_after_s * 1000.0))}\n"
+
+
+async def _limited(ctx: Context, session: _Session, cmd: str) -> Optional[float]:
+    """
+    Apply the optional limiters. Returns None if the command may run, else
+    the number of seconds the client should wait before retrying.
+
+    - ctx.client_limiter: one bucket per peer address / AUTH client id
+    - ctx.limiter: one global bucket
+    Commands cost ctx.command_costs.get(cmd, 1); a cost of 0 is free.
+    """
+    if cmd in UNLIMITED_CMDS:
+        return None
+    cost = ctx.command_costs.get(cmd, 1.0)
+    if cost <= 0:
+        return None
+
+    if ctx.client_limiter is not None:
+        ok, wait_s = ctx.client_limiter.reserve(
+            session.limit_key(ctx.limit_by), cost, max_wait=ctx.limiter_max_wait_s
+        )
+        if not ok:
+            return wait_s
+        if wait_s > 0:
+            await session.flush_before_wait()
+            await asyncio.sleep(wait_s)
+
+    if ctx.limiter is not None:
+        if ctx.limiter_max_wait_s > 0:
+            if 0 < ctx.limiter.wait_time(cost) <= ctx.limiter_max_wait_s:
+                await session.flush_before_wait()
+            ok = await ctx.limiter.try_acquire(cost, max_wait=ctx.limiter_max_wait_s)
+        else:
+            ok = ctx.limiter.allow(cost)
+        if not ok:
+            return ctx.limiter.wait_time(cost)
+    return None
+
+
+def _auth(session: _Session, client_id: str) -> str:
+    client_id = client_id.strip()
+    if not client_id or any(c.isspace() for c in client_id):
+        return AUTH_USAGE_ERR
+    session.client_id = client_id
+    return AUTH_OK
+
+
+def _record(ctx: Context, cmd: str, started: float) -> None:
+    # Unknown names share one entry, so clients can't grow the stats table.
+    now = time.monotonic()
+    ctx.stats.record(cmd if cmd in ROUTES else "OTHER", now - started, now)
+
+
+async def _handle_line(ctx: Context, session: _Session, raw: bytes) -> bytes:
+    """Run one complete command line and return the encoded response."""
+    started = time.monotonic()
+    line = raw.decode("utf-8", errors="replace")
+    req = parse_line(line)
+
+    cmd = (getattr(req, "cmd", "") or "").upper()
+    if cmd == "AUTH":
+        return _auth(session, req.args[0] if len(req.args) == 1 else "").encode("utf-8")
+
+    retry_after = await _limited(ctx, session, cmd)
+    if retry_after is not None:
+        ctx.stats.rejected += 1
+        return _rate_limited_line(retry_after).encode("utf-8")
+
+    if cmd in BLOCKING_CMDS:
+        await session.flush_before_wait()
+    resp = await dispatch(ctx, req)
+    _record(ctx, cmd, started)
+    return resp.line.encode("utf-8")
+
+
+async def _handle_frame(ctx: Context, session: _Session, opcode: int, payload: memoryview) -> bytes:
+    """Run one binary-mode request and return the response frame."""
+    started = time.monotonic()
+    # Unknown opcodes fall through to the router's unknown handler.
+    cmd = OPCODES.get(opcode, "")
+    if cmd == "AUTH":
+        return response_frame(Response(_auth(session, bytes(payload).decode("utf-8", errors="replace"))))
+
+    retry_after = await _limited(ctx, session, cmd)
+    if retry_after is not None:
+        ctx.stats.rejected += 1
+        if math.isinf(retry_after):
+            return RATE_LIMIT_ERR_FRAME
+        return encode_frame(_rate_limited_line(retry_after).rstrip("\n").encode("utf-8"))
+
+    if cmd in BLOCKING_CMDS:
+        await session.flush_before_wait()
+    resp: Response = await dispatch(ctx, Request(cmd=cmd, args=[], payload=payload))
+    _record(ctx, cmd, started)
+    return response_frame(resp)
+
+
+async def _serve_binary(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    ctx: Context,
+    session: _Session,
+    max_frame_bytes: int,
+    buf: bytearray,
+    read_chunk: int,
+    high_water: int,
+) -> None:
+    """
+    Binary-mode session loop (see protocol.BINARY_MAGIC for the frame layout).
+
+    Same batching as the text loop: parse every complete frame in the buffer,
+    coalesce the response frames, one write + drain per batch. Payloads are
+    handed to handlers as memoryview slices, never decoded.
+    """
+    out = bytearray()
+    stats = ctx.stats
+    prefix = LENGTH_PREFIX.size
+    skip = 0  # bytes left of an oversized frame being discarded
+
+    async def flush() -> None:
+        if out:
+            stats.bytes_out += len(out)
+            writer.write(bytes(out))
+            out.clear()
+            await writer.drain()
+
+    session.flush = flush
+
+    while True:
+        if skip:
+            n = min(skip, len(buf))
+            del buf[:n]
+            skip -= n
+
+        # Parse straight out of buf; every view is released before buf is trimmed.
+        view = memoryview(buf)
+        size = len(view)
+        pos = 0
+        stop = False
+        try:
+            while not skip and size - pos >= prefix:
+                (length,) = LENGTH_PREFIX.unpack_from(view, pos)
+                if length < 1:
+                    # Just the 4-byte length, no opcode.
+                    out += EMPTY_FRAME_ERR_FRAME
+                    pos += prefix
+                    continue
+                if length > max_frame_bytes:
+                    out += FRAME_TOO_LONG_ERR_FRAME
+                    pos += prefix
+                    n = min(length, size - pos)
+                    pos += n
+                    skip = length - n
+                    continue
+                end = pos + prefix + length
+                if end > size:
+                    break
+                payload = view[pos + prefix + 1:end]
+                try:
+                    out += await _handle_frame(ctx, session, view[pos + prefix], payload)
+                finally:
+                    payload.release()
+                pos = end
+
+                if len(out) >= high_water:
+                    await flush()
+                if ctx.stop_event.is_set():
+                    stop = True
+                    break
+        finally:
+            view.release()
+
+        del buf[:pos]
+        await flush()
+        if stop:
+            return
+
+        chunk = await reader.read(read_chunk)
+        if not chunk:
+            return
+        stats.bytes_in += len(chunk)
+        buf += chunk
+
+
+async def _serve_text(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    ctx: Context,
+    session: _Session,
+    max_line_bytes: int,
+    buf: bytearray,
+    read_chunk: int,
+    high_water: int,
+) -> None:
+    """Text-mode session loop (newline-delimited commands)."""
+    out = bytearray()
+    # True while skipping the rest of an oversized line (ERR already queued)
+    discarding = False
+
+    stats = ctx.stats
+
+    async def flush() -> None:
+        if out:
+            stats.bytes_out += len(out)
+            writer.write(bytes(out))
+            out.clear()
+            await writer.drain()
+
+    session.flush = flush
+
+    while True:
+        start = 0
+        stop = False
+        while True:
+            nl = buf.find(b"\n", start)
+            if nl < 0:
+                break
+            end = nl + 1
+
+            if discarding:
+                discarding = False
+            elif end - start > max_line_bytes:
+                # Oversized line guard (bytes, includes newline)
+                out += LINE_TOO_LONG_ERR_B
+            else:
+                out += await _handle_line(ctx, session, bytes(buf[start:end]))
+            start = end
+
+            if len(out) >= high_water:
+                await flush()
+            if ctx.stop_event.is_set():
+                stop = True
+                break
+
+        del buf[:start]
+        if discarding:
+            buf.clear()
+        elif not stop and len(buf) > max_line_bytes:
+            # Partial line already too long: answer now, skip to its newline.
+            out += LINE_TOO_LONG_ERR_B
+            discarding = True
+            buf.clear()
+
+        await flush()
+        if stop:
+            return
+
+        data = await reader.read(read_chunk)
+        if not data:
+            # Client closed; a final line without "\n" still counts.
+            if buf and not discarding:
+                out += await _handle_line(ctx, session, bytes(buf))
+                await flush()
+            return
+        stats.bytes_in += len(data)
+        buf += data
 
 
 async def handle_client(
@@ -17,44 +335,56 @@ async def handle_client(
     writer: asyncio.StreamWriter,
     ctx: Context,
     max_line_bytes: int,
+    *,
+    read_chunk: int = READ_CHUNK_BYTES,
+    high_water: int = WRITE_HIGH_WATER,
 ) -> None:
     """
     Handle one TCP client session.
 
-    - Read one newline-terminated line at a time
+    - Read large chunks and split complete lines at the byte level, so a
+      client that pipelines many commands is served from one read
+    - Run the lines in order and coalesce their responses: one write + drain
+      per batch, or sooner once `high_water` bytes are pending
     - Reject oversized lines with a clean ERR response
-    - Optionally enforce rate limiting (but always allow SHUTDOWN)
+    - Optionally enforce rate limiting (but always allow SHUTDOWN), globally
+      and/or per client (peer address, or the id sent with AUTH <client_id>);
+      with ctx.limiter_max_wait_s > 0 a limited command waits its turn for a
+      token and is only rejected if that wait would exceed the limit.
+      Rejections carry a retry_after_ms hint
+    - Stop after the command that set ctx.stop_event (SHUTDOWN); any lines
+      pipelined behind it are dropped
+    - A connection that opens with protocol.BINARY_MAGIC switches to
+      length-prefixed binary frames (max_line_bytes then caps frame size)
+    - Keep ctx.stats current (connections, bytes in/out, per-command counts
+      and latency, rejections) for the STATS command
     """
+    buf = bytearray()
+    peer = writer.get_extra_info("peername")
+    session = _Session(peer=str(peer[0]) if isinstance(peer, tuple) and peer else str(peer))
+    stats = ctx.stats
+    stats.connections += 1
+    stats.connections_total += 1
+
     try:
+        # Sniff the first bytes: text commands never start with NUL.
         while True:
-            raw = await reader.readline()
-            if not raw:
-                break  # client closed
-
-            # Oversized line guard (bytes, includes newline)
-            if len(raw) > max_line_bytes:
-                writer.write(LINE_TOO_LONG_ERR.encode("utf-8"))
-                await writer.drain()
-                continue
-
-            line = raw.decode("utf-8", errors="replace")
-            req = parse_line(line)
-
-            # Optional limiter: allow SHUTDOWN even when limited
-            cmd = (getattr(req, "cmd", "") or "").upper()
-            if ctx.limiter is not None and cmd != "SHUTDOWN":
-                if not ctx.limiter.allow():
-                    writer.write(RATE_LIMIT_ERR.encode("utf-8"))
-                    await writer.drain()
-                    continue
-
-            resp = await dispatch(ctx, req)
-            writer.write(resp.line.encode("utf-8"))
-            await writer.drain()
-
-            if ctx.stop_event.is_set():
+            data = await reader.read(read_chunk)
+            if not data:
+                break
+            stats.bytes_in += len(data)
+            buf += data
+            if buf[:1] != BINARY_MAGIC[:1] or len(buf) >= len(BINARY_MAGIC):
                 break
 
+        if buf.startswith(BINARY_MAGIC):
+            del buf[:len(BINARY_MAGIC)]
+            stats.bytes_out += len(BINARY_MAGIC)
+            writer.write(BINARY_MAGIC)
+            await _serve_binary(reader, writer, ctx, session, max_line_bytes, buf, read_chunk, high_water)
+        elif buf:
+            await _serve_text(reader, writer, ctx, session, max_line_bytes, buf, read_chunk, high_water)
+
     except Exception:
         # If something unexpected happens, avoid hanging the client:
         # close the connection cleanly.
@@ -65,6 +395,7 @@ async def handle_client(
             pass
         raise
     finally:
+        stats.connections -= 1
         try:
             writer.close()
             await writer.wait_closed()
@@ -72,7 +403,28 @@ async def handle_client(
             pass
 
 
-async def main() -> None:
+def parse_command_costs(spec: str) -> Dict[str, float]:
+    """
+    Parse "PING=1,HELP=0.5,PUSH=2" into {"PING": 1.0, ...}.
+    Commands not listed cost 1 token; 0 makes a command free.
+    """
+    costs: Dict[str, float] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"bad RATELIMMQ_COMMAND_COSTS entry: {item!r}")
+        cost = float(value)
+        if cost < 0:
+            raise ValueError(f"command cost must be >= 0: {item!r}")
+        costs[name.strip().upper()] = cost
+    return costs
+
+
+async def main(*, reuse_port: bool = False) -> bool:
+    """Serve until SHUTDOWN or SIGINT/SIGTERM; returns True if it was SHUTDOWN."""
     host = os.environ.get("RATELIMMQ_HOST", "127.0.0.1")
     port = int(os.environ.get("RATELIMMQ_PORT", "5555"))
 
@@ -90,12 +442,73 @@ async def main() -> None:
 
         capacity = float(os.environ.get("RATELIMMQ_CAPACITY", "5"))
         refill_rate = float(os.environ.get("RATELIMMQ_REFILL_RATE", "1"))
-        ctx.limiter = TokenBucket(capacity=capacity, refill_rate=refill_rate)
+        if os.environ.get("RATELIMMQ_LIMITER_SHARED", "0") == "1":
+            # One bucket for all processes on this host (e.g. RATELIMMQ_WORKERS>1)
+            from ratelimmq.shared_limiter import SharedTokenBucket, default_path
+
+            path = os.environ.get("RATELIMMQ_LIMITER_SHM_PATH") or default_path(f"ratelimmq-{port}")
+            ctx.limiter = SharedTokenBucket(path, capacity=capacity, refill_rate=refill_rate)
+        else:
+            ctx.limiter = TokenBucket(capacity=capacity, refill_rate=refill_rate)
+        ctx.limiter_max_wait_s = max(
+            0.0, float(os.environ.get("RATELIMMQ_LIMITER_MAX_WAIT_MS", "0")) / 1000.0
+        )
+
+    # Per-client limiting: RATELIMMQ_LIMIT_BY=peer|client (default: off)
+    limit_by = os.environ.get("RATELIMMQ_LIMIT_BY", "").strip().lower()
+    if limit_by in ("peer", "client"):
+        from ratelimmq.limiter import KeyedTokenBuckets
+
+        ctx.limit_by = limit_by
+        ctx.client_limiter = KeyedTokenBuckets(
+            capacity=float(os.environ.get("RATELIMMQ_CLIENT_CAPACITY", os.environ.get("RATELIMMQ_CAPACITY", "5"))),
+            refill_rate=float(
+                os.environ.get("RATELIMMQ_CLIENT_REFILL_RATE", os.environ.get("RATELIMMQ_REFILL_RATE", "1"))
+            ),
+            max_keys=int(os.environ.get("RATELIMMQ_CLIENT_MAX_KEYS", "100000")),
+        )
+        ctx.limiter_max_wait_s = max(
+            0.0, float(os.environ.get("RATELIMMQ_LIMITER_MAX_WAIT_MS", "0")) / 1000.0
+        )
+    elif limit_by not in ("", "global"):
+        raise ValueError(f"RATELIMMQ_LIMIT_BY must be global, peer or client (got {limit_by!r})")
+
+    ctx.command_costs = parse_command_costs(os.environ.get("RATELIMMQ_COMMAND_COSTS", ""))
+
+    # Named in-memory queues (PUSH/POP/MPUSH/MPOP/BPOP/QLEN)
+    # RATELIMMQ_WAL_DIR: persist queues in a write-ahead log (one per worker)
+    wal = None
+    wal_dir = os.environ.get("RATELIMMQ_WAL_DIR", "").strip()
+    if wal_dir:
+        from ratelimmq.wal import WriteAheadLog
+
+        worker_id = os.environ.get("RATELIMMQ_WORKER_ID")
+        wal = WriteAheadLog(
+            os.path.join(wal_dir, f"worker-{worker_id}") if worker_id else wal_dir,
+            durability=os.environ.get("RATELIMMQ_WAL_DURABILITY", "batch").strip().lower(),
+            group_commit_ms=float(os.environ.get("RATELIMMQ_WAL_GROUP_COMMIT_MS", "2")),
+            segment_bytes=int(os.environ.get("RATELIMMQ_WAL_SEGMENT_BYTES", str(64 * 1024 * 1024))),
+        )
+    ctx.queue = QueueRegistry(
+        capacity=int(os.environ.get("RATELIMMQ_QUEUE_CAPACITY", "10000")),
+        max_queues=int(os.environ.get("RATELIMMQ_MAX_QUEUES", "1000")),
+        wal=wal,
+    )
+    if wal is not None:
+        restored = ctx.queue.restore()
+        print(f"wal: restored {restored} messages from {wal.directory} (durability={wal.durability})", flush=True)
+
+    signalled = False
+
+    def _on_signal() -> None:
+        nonlocal signalled
+        signalled = True
+        stop_event.set()
 
     loop = asyncio.get_running_loop()
     for sig in (signal.SIGINT, signal.SIGTERM):
         try:
-            loop.add_signal_handler(sig, stop_event.set)
+            loop.add_signal_handler(sig, _on_signal)
         except NotImplementedError:
             pass
 
@@ -103,6 +516,7 @@ async def main() -> None:
         lambda r, w: handle_client(r, w, ctx, max_line_bytes),
         host,
         port,
+        reuse_port=reuse_port or None,
     )
 
     addrs = ", ".join(str(s.getsockname()) for s in (server.sockets or []))
@@ -111,10 +525,19 @@ async def main() -> None:
     async with server:
         await stop_event.wait()
 
+    if wal is not None:
+        await wal.aclose()
     print("shutdown complete", flush=True)
+    return not signalled
 
 
 def run() -> None:
+    # RATELIMMQ_WORKERS>1: one SO_REUSEPORT worker process per core (see supervisor.py)
+    workers = int(os.environ.get("RATELIMMQ_WORKERS", "1"))
+    if workers > 1:
+        from ratelimmq.supervisor import run_supervisor
+
+        raise SystemExit(run_supervisor(workers))
     asyncio.run(main())
 
 
@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# fcntl is POSIX-only. Without it the table still works inside one process,
+# but is NOT safe to share between processes.
+try:
+    import fcntl  # type: ignore
+
+    _HAS_FCNTL = True
+except Exception:
+    fcntl = None  # type: ignore
+    _HAS_FCNTL = False
+
+
+_MAGIC = b"RLMQSB01"
+# magic | nslots | capacity | refill_rate
+_HEADER = struct.Struct("<8sIdd")
+_HEADER_SIZE = 64
+# key_hash | tokens | last_ts  (padded to 32 bytes)
+_SLOT = struct.Struct("<Qdd8x")
+
+# How many neighbouring slots to try before sharing a slot with another key.
+_MAX_PROBES = 8
+
+
+# One lock per open file (by device + inode), shared by every table on it in
+# this process. POSIX record locks don't exclude threads of the same process,
+# and closing *any* fd on the file drops all of the process's locks on it, so
+# every lockf section and close() also holds this lock.
+_FILE_LOCKS: Dict[Tuple[int, int], threading.Lock] = {}
+_FILE_LOCKS_GUARD = threading.Lock()
+
+
+def _file_lock(fd: int) -> threading.Lock:
+    st = os.fstat(fd)
+    with _FILE_LOCKS_GUARD:
+        return _FILE_LOCKS.setdefault((st.st_dev, st.st_ino), threading.Lock())
+
+
+def default_path(name: str = "ratelimmq-buckets") -> str:
+    """A path on tmpfs when available (/dev/shm), else the temp dir."""
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, name)
+
+
+def _key_hash(key: str) -> int:
+    # Stable across processes (unlike hash()); 0 is reserved for "empty".
+    h = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+    return h or 1
+
+
+class SharedBucketTable:
+    """
+    Keyed token buckets stored in an mmap'd file, shared by every process
+    that opens the same path.
+
+    Same semantics as TokenBucket.allow(cost, now): refill by elapsed time,
+    consume `cost` if available. Each refill-and-consume runs under a POSIX
+    byte-range lock on that key's 32-byte slot, so decisions are atomic across
+    processes and different keys don't contend. `now` defaults to
+    time.monotonic(), which is system-wide on Linux, so all processes agree.
+
+    The table has a fixed number of slots. A key takes the first free (or
+    idle, i.e. fully refilled) slot within a few probes of its hash; if all
+    of those are busy it shares a slot with another key, which can only make
+    the limit stricter, never looser.
+
+    Opening an existing table with a different capacity or refill_rate
+    raises ValueError: the processes sharing it must agree on the limit.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        capacity: float,
+        refill_rate: float,
+        *,
+        slots: int = 4096,
+    ) -> None:
+        if capacity <= 0:
+            raise ValueError("capacity must be > 0")
+        if refill_rate < 0:
+            raise ValueError("refill_rate must be >= 0")
+        if slots < 1:
+            raise ValueError("slots must be >= 1")
+
+        self.path = path
+        self.capacity = float(capacity)
+        self.refill_rate = float(refill_rate)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self._local_lock = _file_lock(self._fd)
+            self._lock(0, _HEADER_SIZE)
+            try:
+                size = os.fstat(self._fd).st_size
+                if size >= _HEADER_SIZE:
+                    hdr = os.pread(self._fd, _HEADER.size, 0)
+                    magic, nslots, capacity, refill_rate = _HEADER.unpack(hdr)
+                    if magic != _MAGIC:
+                        raise ValueError(f"{path} is not a ratelimmq bucket table")
+                    if (capacity, refill_rate) != (self.capacity, self.refill_rate):
+                        raise ValueError(
+                            f"{path} was created with capacity={capacity} refill_rate={refill_rate}, "
+                            f"not capacity={self.capacity} refill_rate={self.refill_rate}"
+                        )
+                    self.slots = int(nslots)
+                else:
+                    self.slots = int(slots)
+                    os.ftruncate(self._fd, _HEADER_SIZE + self.slots * _SLOT.size)
+                    os.pwrite(self._fd, _HEADER.pack(_MAGIC, self.slots, self.capacity, self.refill_rate), 0)
+            finally:
+                self._unlock(0, _HEADER_SIZE)
+            self._mm = mmap.mmap(self._fd, _HEADER_SIZE + self.slots * _SLOT.size)
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+    # --- locking ---
+
+    def _lock(self, offset: int, length: int) -> None:
+        # Threads first (lockf doesn't exclude them), then other processes.
+        self._local_lock.acquire()
+        if _HAS_FCNTL:
+            try:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX, length, offset)
+            except BaseException:
+                self._local_lock.release()
+                raise
+
+    def _unlock(self, offset: int, length: int) -> None:
+        try:
+            if _HAS_FCNTL:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+        finally:
+            self._local_lock.release()
+
+    # --- API ---
+
+    def allow(self, key: str, cost: float = 1.0, now: float | None = None) -> bool:
+        """
+        Returns True if `key` has >= cost tokens; consumes cost tokens.
+        If now is provided, it is used for deterministic testing.
+        """
+        if cost <= 0:
+            raise ValueError("cost must be > 0")
+        t = time.monotonic() if now is None else float(now)
+        return self._update(_key_hash(key), t, cost)
+
+    def wait_time(self, key: str, cost: float = 1.0, now: float | None = None) -> float:
+        """Seconds until `cost` tokens would be available for `key` (inf if never)."""
+        t = time.monotonic() if now is None else float(now)
+        tokens = self._peek(_key_hash(key), t)  # unlocked read; a hint, not a promise
+        deficit = cost - tokens
+        if deficit <= 0:
+            return 0.0
+        if self.refill_rate <= 0:
+            return float("inf")
+        return deficit / self.refill_rate
+
+    def level(self, key: str, now: float | None = None) -> float:
+        """Tokens `key` has right now (unlocked read; a hint, not a promise)."""
+        t = time.monotonic() if now is None else float(now)
+        return self._peek(_key_hash(key), t)
+
+    def _refilled(self, kh_slot: int, tokens: float, last_ts: float, now: float) -> float:
+        if kh_slot == 0:
+            return self.capacity
+        return min(self.capacity, tokens + max(0.0, now - last_ts) * self.refill_rate)
+
+    def _peek(self, kh: int, now: float) -> float:
+        n = self.slots
+        base = kh % n
+        for i in range(_MAX_PROBES if n > 1 else 1):
+            off = _HEADER_SIZE + ((base + i) % n) * _SLOT.size
+            slot_kh, tokens, last_ts = _SLOT.unpack_from(self._mm, off)
+            if slot_kh == kh or slot_kh == 0:
+                return self._refilled(slot_kh, tokens, last_ts, now)
+        return self.capacity
+
+    def _slot_offset(self, idx: int) -> int:
+        return _HEADER_SIZE + (idx % self.slots) * _SLOT.size
+
+    def _update(self, kh: int, now: float, cost: float) -> bool:
+        """Refill + consume under the slot lock. True if `cost` was consumed."""
+        n = self.slots
+        base = kh % n
+        probes = min(_MAX_PROBES, n)
+
+        # 1) The key's own slot, if it has one (verified again under the lock).
+        for i in range(probes):
+            off = self._slot_offset(base + i)
+            if _SLOT.unpack_from(self._mm, off)[0] == kh:
+                done = self._consume(off, kh, now, cost, claim=False)
+                if done is not None:
+                    return done
+                break  # slot was taken over meanwhile; claim a new one
+
+        # 2) Claim the first empty or idle (fully refilled) slot.
+        for i in range(probes):
+            done = self._consume(self._slot_offset(base + i), kh, now, cost, claim=True)
+            if done is not None:
+                return done
+
+        # 3) Every probed slot is busy: share the home slot with its owner.
+        done = self._consume(self._slot_offset(base), kh, now, cost, claim=True, share=True)
+        assert done is not None
+        return done
+
+    def _consume(
+        self, off: int, kh: int, now: float, cost: float, *, claim: bool, share: bool = False
+    ) -> Optional[bool]:
+        """
+        Lock one slot and, if it belongs to `kh` (or may be claimed/shared),
+        refill and try to consume. None means "not usable, try elsewhere".
+        """
+        self._lock(off, _SLOT.size)
+        try:
+            slot_kh, tokens, last_ts = _SLOT.unpack_from(self._mm, off)
+            cur = self._refilled(slot_kh, tokens, last_ts, now)
+            if slot_kh == kh:
+                owner = kh
+            elif share:
+                owner = slot_kh
+            elif claim and (slot_kh == 0 or cur >= self.capacity):
+                owner = kh
+                cur = self.capacity
+            else:
+                return None
+
+            if cur >= cost:
+                _SLOT.pack_into(self._mm, off, owner, cur - cost, now)
+                return True
+            _SLOT.pack_into(self._mm, off, owner, cur, now)
+            return False
+        finally:
+            self._unlock(off, _SLOT.size)
+
+    def close(self) -> None:
+        # Under the file lock: closing the fd would drop another table's lockf.
+        with self._local_lock:
+            try:
+                self._mm.close()
+            finally:
+                os.close(self._fd)
+
+    def __enter__(self) -> "SharedBucketTable":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+class SharedTokenBucket:
+    """
+    A single TokenBucket whose state lives in an mmap'd file, so several
+    processes (e.g. RATELIMMQ_WORKERS) enforce one aggregate limit.
+
+    Drop-in for the server's ctx.limiter: allow(), wait_time() and an async
+    try_acquire() (which sleeps for the computed refill time, since waiters in
+    other processes can't share one FIFO).
+    """
+
+    KEY = "__global__"
+
+    def __init__(self, path: str, capacity: float, refill_rate: float) -> None:
+        self.capacity = float(capacity)
+        self.refill_rate = float(refill_rate)
+        self._table = SharedBucketTable(path, capacity, refill_rate, slots=1)
+
+    def allow(self, cost: float = 1.0, now: float | None = None) -> bool:
+        return self._table.allow(self.KEY, cost, now)
+
+    def wait_time(self, cost: float = 1.0, now: float | None = None) -> float:
+        return self._table.wait_time(self.KEY, cost, now)
+
+    def available(self, now: float | None = None) -> float:
+        return self._table.level(self.KEY, now)
+
+    async def try_acquire(self, cost: float = 1.0, max_wait: Optional[float] = None) -> bool:
+        loop = asyncio.get_running_loop()
+        deadline = None if max_wait is None else loop.time() + max_wait
+        while True:
+            if self.allow(cost):
+                return True
+            w = self.wait_time(cost)
+            if w == float("inf") or (deadline is not None and loop.time() + w > deadline):
+                return False
+            await asyncio.sleep(w)
+
+    async def acquire(self, cost: float = 1.0) -> None:
+        await self.try_acquire(cost, max_wait=None)
+
+    def close(self) -> None:
+        self._table.close()
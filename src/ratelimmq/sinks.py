@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import BinaryIO, Callable, Optional, Union
+
+
+class BodyTooLarge(Exception):
+    """A response body went over max_body_bytes (FetchResult.error starts with this name)."""
+
+
+class BodySink:
+    """
+    Receives a response body chunk by chunk; the base class discards the
+    data and counts it (nbytes).
+
+    fetch_one creates one sink per attempt, writes every chunk to it (from a
+    worker thread on the thread backend) and calls close() when the attempt
+    ends, whatever the outcome. Peak memory is one chunk, not the body.
+    """
+
+    def __init__(self) -> None:
+        self.nbytes = 0
+
+    def write(self, chunk: bytes) -> None:
+        self.nbytes += len(chunk)
+
+    def close(self) -> None:
+        pass
+
+
+# Discard-and-count is the base behaviour.
+CountSink = BodySink
+
+
+class HashSink(BodySink):
+    """Hashes the body (any hashlib algorithm); read hexdigest() afterwards."""
+
+    def __init__(self, algorithm: str = "sha256") -> None:
+        super().__init__()
+        self._hash = hashlib.new(algorithm)
+
+    def write(self, chunk: bytes) -> None:
+        super().write(chunk)
+        self._hash.update(chunk)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+class FileSink(BodySink):
+    """
+    Spills the body to `path` (created on the first chunk, truncated if it
+    exists, so a retry overwrites the previous attempt's partial body).
+    """
+
+    def __init__(self, path: Union[str, "os.PathLike[str]"]) -> None:
+        super().__init__()
+        self.path = os.fspath(path)
+        self._f: Optional[BinaryIO] = None
+
+    def write(self, chunk: bytes) -> None:
+        if self._f is None:
+            self._f = open(self.path, "wb")
+        super().write(chunk)
+        self._f.write(chunk)
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+class CallbackSink(BodySink):
+    """Passes every chunk to `on_chunk`."""
+
+    def __init__(self, on_chunk: Callable[[bytes], None]) -> None:
+        super().__init__()
+        self._on_chunk = on_chunk
+
+    def write(self, chunk: bytes) -> None:
+        super().write(chunk)
+        self._on_chunk(chunk)
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import time
+from typing import Dict, List, Optional
+
+from ratelimmq.metrics import RollingLatency
+
+
+class ServerStats:
+    """
+    Live counters for one server process, updated incrementally by
+    handle_client and read by the STATS command.
+
+    Every update is O(1): plain integer counters, a ring of per-second
+    command counts (commands/s over the last RATE_WINDOW_S seconds) and one
+    RollingLatency per command name. Reading is bounded by the number of
+    command names, not by traffic.
+    """
+
+    RATE_WINDOW_S = 10
+    LATENCY_WINDOW_S = 60.0
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.commands = 0
+        self.rejected = 0  # commands refused by a rate limiter
+        self.connections = 0  # open right now
+        self.connections_total = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._latency: Dict[str, RollingLatency] = {}
+        self._counts: List[int] = [0] * self.RATE_WINDOW_S
+        self._seconds: List[int] = [-1] * self.RATE_WINDOW_S
+
+    def record(self, cmd: str, elapsed_s: float, now: float) -> None:
+        """One command finished (`now` is time.monotonic() at the end)."""
+        self.commands += 1
+        sec = int(now)
+        i = sec % self.RATE_WINDOW_S
+        if self._seconds[i] != sec:
+            self._seconds[i] = sec
+            self._counts[i] = 0
+        self._counts[i] += 1
+        lat = self._latency.get(cmd)
+        if lat is None:
+            lat = self._latency[cmd] = RollingLatency(self.LATENCY_WINDOW_S, 6, relative_accuracy=0.02)
+        lat.add(elapsed_s, now)
+
+    def rate(self, now: Optional[float] = None) -> float:
+        """Commands per second over the last RATE_WINDOW_S seconds."""
+        t = time.monotonic() if now is None else float(now)
+        oldest = int(t) - self.RATE_WINDOW_S + 1
+        total = sum(c for s, c in zip(self._seconds, self._counts) if s >= oldest)
+        span = min(float(self.RATE_WINDOW_S), t - self.started)
+        return total / span if span > 0 else 0.0
+
+    def latency_ms(self, now: Optional[float] = None) -> Dict[str, tuple]:
+        """command -> (p50, p95, p99) in ms over the last LATENCY_WINDOW_S."""
+        t = time.monotonic() if now is None else float(now)
+        out = {}
+        for cmd, lat in self._latency.items():
+            sk = lat.snapshot(t)
+            if sk.count:
+                out[cmd] = tuple(sk.quantile(q) * 1000.0 for q in (0.5, 0.95, 0.99))
+        return out
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing as mp
+import os
+import signal
+import socket
+import time
+from multiprocessing.connection import wait
+from typing import Dict, Optional
+
+# Restart backoff for workers that keep dying right after start.
+RESTART_BACKOFF_MIN_S = 0.1
+RESTART_BACKOFF_MAX_S = 5.0
+# A worker that stayed up this long resets its backoff.
+HEALTHY_AFTER_S = 5.0
+
+
+def _worker_main(worker_id: int, supervisor_pid: int) -> None:
+    # Fresh signal dispositions: the worker's event loop installs its own.
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    os.environ["RATELIMMQ_WORKER_ID"] = str(worker_id)
+
+    from ratelimmq.server import main
+
+    if asyncio.run(main(reuse_port=True)) and os.getppid() == supervisor_pid:
+        # SHUTDOWN command (not a signal): ask the supervisor to stop everyone.
+        os.kill(supervisor_pid, signal.SIGTERM)
+
+
+class Supervisor:
+    """
+    Run N server workers on the same RATELIMMQ_HOST/RATELIMMQ_PORT.
+
+    Each worker is a forked process with its own event loop and its own
+    SO_REUSEPORT listening socket, so the kernel spreads connections across
+    cores. The supervisor:
+      - on SIGINT/SIGTERM (its own, or sent by a worker that got SHUTDOWN)
+        stops every worker and waits for them
+      - restarts any worker that exits while it is not stopping, whatever
+        the exit status (with backoff)
+    """
+
+    def __init__(self, workers: int) -> None:
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise RuntimeError("multi-worker mode needs SO_REUSEPORT (Linux/BSD/macOS)")
+        self.workers = int(workers)
+        self._ctx = mp.get_context("fork")
+        self._procs: Dict[int, mp.process.BaseProcess] = {}
+        self._started_at: Dict[int, float] = {}
+        self._backoff: Dict[int, float] = {}
+        self._stopping = False
+        self.restarts = 0
+
+    def _start(self, worker_id: int) -> None:
+        p = self._ctx.Process(target=_worker_main, args=(worker_id, os.getpid()), name=f"ratelimmq-worker-{worker_id}")
+        p.start()
+        self._procs[worker_id] = p
+        self._started_at[worker_id] = time.monotonic()
+        print(f"worker {worker_id} started pid={p.pid}", flush=True)
+
+    def _on_signal(self, signum: int, frame: object) -> None:
+        self._stopping = True
+
+    def _stop_all(self, timeout_s: float = 5.0) -> None:
+        for p in self._procs.values():
+            if p.is_alive():
+                p.terminate()  # SIGTERM -> worker sets its stop_event
+        deadline = time.monotonic() + timeout_s
+        for p in self._procs.values():
+            p.join(max(0.0, deadline - time.monotonic()))
+            if p.is_alive():
+                p.kill()
+                p.join()
+
+    def run(self) -> int:
+        signal.signal(signal.SIGINT, self._on_signal)
+        signal.signal(signal.SIGTERM, self._on_signal)
+
+        for i in range(self.workers):
+            self._start(i)
+
+        pending: Dict[int, float] = {}  # worker_id -> restart time
+        while not self._stopping:
+            timeout: Optional[float] = 0.5
+            if pending:
+                timeout = max(0.0, min(min(pending.values()) - time.monotonic(), 0.5))
+            sentinels = [p.sentinel for i, p in self._procs.items() if i not in pending]
+            wait(sentinels, timeout=timeout)
+
+            now = time.monotonic()
+            for i, p in list(self._procs.items()):
+                if self._stopping:
+                    break
+                if i in pending or p.is_alive():
+                    continue
+                p.join()
+
+                uptime = now - self._started_at.get(i, now)
+                prev = self._backoff.get(i, 0.0)
+                delay = 0.0 if uptime >= HEALTHY_AFTER_S else min(
+                    RESTART_BACKOFF_MAX_S, max(RESTART_BACKOFF_MIN_S, prev * 2)
+                )
+                self._backoff[i] = delay
+                pending[i] = now + delay
+                print(f"worker {i} exited (exitcode={p.exitcode}); restarting in {delay:.1f}s", flush=True)
+
+            for i, at in list(pending.items()):
+                if not self._stopping and at <= time.monotonic():
+                    del pending[i]
+                    self.restarts += 1
+                    self._start(i)
+
+        self._stop_all()
+        print("supervisor shutdown complete", flush=True)
+        return 0
+
+
+def run_supervisor(workers: int) -> int:
+    return Supervisor(workers).run()
@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import struct
+import zlib
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+# Durability modes:
+#   none   - records are written to the OS in batches, never fsync'd
+#   batch  - group commit: one fsync per batch of concurrent writers; a write
+#            is acknowledged once the fsync covering it returns
+#   always - write + fsync for every append (all records of one PUSH/MPUSH
+#            together) before it is acknowledged
+DURABILITY_MODES = ("none", "batch", "always")
+
+# Record: u32 body length | u8 type | u32 crc32(type + body) | body
+_RECORD = struct.Struct("<IBI")
+# push body: u16 queue name length | u64 per-queue index | name | message
+# pop  body: u16 queue name length | u64 consumed total   | name
+_BODY = struct.Struct("<HQ")
+_PUSH = 1
+_POP = 2
+
+_SEGMENT_SUFFIX = ".log"
+
+log = logging.getLogger("ratelimmq.wal")
+
+
+@dataclass
+class _Segment:
+    seq: int
+    path: str
+    fd: int = -1
+    size: int = 0
+    # queue -> one past the highest message index pushed in this segment
+    pushes: Dict[str, int] = field(default_factory=dict)
+    # directory entry fsync'd (done by the first synced write, off the loop)
+    dir_synced: bool = False
+
+
+@dataclass
+class QueueState:
+    """What replay recovered for one queue."""
+
+    pushed: int  # next message index
+    consumed: int  # messages popped so far
+    messages: List[str]
+
+
+def _encode(kind: int, name: str, n: int, msg: str = "") -> bytes:
+    qb = name.encode("utf-8")
+    body = _BODY.pack(len(qb), n) + qb + msg.encode("utf-8")
+    crc = zlib.crc32(body, zlib.crc32(bytes((kind,))))
+    return _RECORD.pack(len(body), kind, crc) + body
+
+
+class WriteAheadLog:
+    """
+    Append-only, segmented log of queue pushes and pops.
+
+    Every accepted message gets a per-queue index (0, 1, 2, ...); a push
+    record stores (queue, index, message) and a pop record stores how many
+    messages of that queue have been consumed in total. Replay keeps the
+    pushes whose index is >= the last consumed count, so records never need
+    rewriting and whole segments can simply be deleted once every message in
+    them has been consumed (oldest first, never the active one).
+
+    append_push()/append_pop() add the record synchronously (so the log
+    order is the order the event loop applied the operations) and return an
+    awaitable that completes once the record is as durable as the chosen
+    mode promises. In "batch" mode records from concurrent producers within
+    `group_commit_ms` share one write + fsync; in "always" mode each append
+    gets its own. Either way the I/O runs in a worker thread, in log order.
+
+    A failed write fails its waiters and every later append, flush() and
+    aclose() with the same error; in "none" mode, where nobody waits for
+    the write itself, that is where the error surfaces (it is also logged).
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        *,
+        durability: str = "batch",
+        group_commit_ms: float = 2.0,
+        segment_bytes: int = 64 * 1024 * 1024,
+    ) -> None:
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability must be one of {DURABILITY_MODES} (got {durability!r})")
+        if group_commit_ms < 0:
+            raise ValueError("group_commit_ms must be >= 0")
+        if segment_bytes < 1024:
+            raise ValueError("segment_bytes must be >= 1024")
+
+        self.directory = directory
+        self.durability = durability
+        self.group_commit_s = group_commit_ms / 1000.0
+        self.segment_bytes = int(segment_bytes)
+        os.makedirs(directory, exist_ok=True)
+
+        self._segments: List[_Segment] = []
+        self._active: Optional[_Segment] = None
+        self._consumed: Dict[str, int] = {}
+
+        # Group commit state: buffered records, the future their writers wait
+        # on, the window timer and the flush task.
+        self._pending: List[Tuple[_Segment, bytearray]] = []
+        self._batch: Optional[asyncio.Future[None]] = None
+        # "always" mode: one (records, waiter) entry per append, written in order
+        self._syncs: Deque[Tuple[List[Tuple[_Segment, bytearray]], asyncio.Future[None]]] = deque()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task[None]] = None
+        # First write error; later records would land after the lost ones.
+        self._error: Optional[BaseException] = None
+
+        # Counters
+        self.records = 0
+        self.bytes_written = 0
+        self.fsyncs = 0
+        self.segments_deleted = 0
+
+    # --- replay ---
+
+    def replay(self) -> Dict[str, QueueState]:
+        """
+        Read every segment (one bulk read each) and rebuild queue contents.
+        A torn or corrupt record ends its segment; the rest of that file is
+        truncated away. Call once, before the first append.
+        """
+        # queue -> ([next index, consumed, oldest surviving push index], messages)
+        states: Dict[str, Tuple[List[int], Deque[Tuple[int, str]]]] = {}
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(_SEGMENT_SUFFIX))
+
+        for name in names:
+            seg = _Segment(seq=int(name[: -len(_SEGMENT_SUFFIX)]), path=os.path.join(self.directory, name))
+            with open(seg.path, "rb") as f:
+                data = f.read()
+            view = memoryview(data)
+            pos, end = 0, len(data)
+            hdr = _RECORD.size
+            while pos + hdr <= end:
+                length, kind, crc = _RECORD.unpack_from(view, pos)
+                stop = pos + hdr + length
+                if stop > end or length < _BODY.size:
+                    break
+                body = view[pos + hdr:stop]
+                if zlib.crc32(body, zlib.crc32(bytes((kind,)))) != crc:
+                    break
+                qlen, n = _BODY.unpack_from(body)
+                queue = bytes(body[_BODY.size:_BODY.size + qlen]).decode("utf-8")
+                counters, msgs = states.setdefault(queue, ([0, 0, -1], deque()))
+                if kind == _PUSH:
+                    msgs.append((n, bytes(body[_BODY.size + qlen:]).decode("utf-8")))
+                    counters[0] = max(counters[0], n + 1)
+                    if counters[2] < 0:
+                        counters[2] = n
+                    seg.pushes[queue] = max(seg.pushes.get(queue, 0), n + 1)
+                elif kind == _POP:
+                    counters[1] = n
+                    while msgs and msgs[0][0] < n:
+                        msgs.popleft()
+                pos = stop
+            if pos < end:
+                os.truncate(seg.path, pos)
+            seg.size = pos
+            self._segments.append(seg)
+
+        out: Dict[str, QueueState] = {}
+        for queue, (counters, msgs) in states.items():
+            pushed, consumed, oldest = counters
+            # Segments are only deleted once every push in them was consumed,
+            # so anything below the oldest surviving push was popped, even if
+            # the pop records went with the deleted segments.
+            consumed = max(consumed, oldest)
+            self._consumed[queue] = consumed
+            out[queue] = QueueState(
+                pushed=max(pushed, consumed),
+                consumed=consumed,
+                messages=[m for i, m in msgs if i >= consumed],
+            )
+        self._compact()
+        return out
+
+    # --- appends ---
+
+    def append_push(self, queue: str, first_index: int, msgs: List[str]) -> "asyncio.Future[None]":
+        """Log messages pushed to `queue` with indexes first_index, first_index+1, ..."""
+        if self._error is not None:
+            return self._failed()
+        seg = self._segment()
+        for i, msg in enumerate(msgs):
+            self._write(seg, _encode(_PUSH, queue, first_index + i, msg))
+        if msgs:
+            seg.pushes[queue] = max(seg.pushes.get(queue, 0), first_index + len(msgs))
+        return self._commit()
+
+    def append_pop(self, queue: str, consumed: int) -> "asyncio.Future[None]":
+        """Log that `consumed` messages of `queue` have been popped in total."""
+        if self._error is not None:
+            return self._failed()
+        self._write(self._segment(), _encode(_POP, queue, consumed))
+        self._consumed[queue] = consumed
+        # Segments this makes obsolete are deleted once the record is written.
+        return self._commit()
+
+    def _segment(self) -> _Segment:
+        seg = self._active
+        if seg is None or seg.size >= self.segment_bytes:
+            seq = self._segments[-1].seq + 1 if self._segments else 1
+            seg = _Segment(seq=seq, path=os.path.join(self.directory, f"{seq:020d}{_SEGMENT_SUFFIX}"))
+            seg.fd = os.open(seg.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+            self._segments.append(seg)
+            self._active = seg
+        return seg
+
+    def _write(self, seg: _Segment, rec: bytes) -> None:
+        self.records += 1
+        seg.size += len(rec)
+        if self._pending and self._pending[-1][0] is seg:
+            self._pending[-1][1].extend(rec)
+        else:
+            self._pending.append((seg, bytearray(rec)))
+
+    # --- group commit ---
+
+    def _failed(self) -> "asyncio.Future[None]":
+        assert self._error is not None
+        fut: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        fut.set_exception(self._error)
+        return fut
+
+    def _commit(self) -> "asyncio.Future[None]":
+        loop = asyncio.get_running_loop()
+        if not self._pending:
+            fut: asyncio.Future[None] = loop.create_future()
+            fut.set_result(None)
+            return fut
+        if self.durability == "always":
+            # This append's records form their own write + fsync.
+            fut = loop.create_future()
+            self._syncs.append((self._pending, fut))
+            self._pending = []
+            if self._task is None:
+                self._task = loop.create_task(self._flush())
+            return fut
+        if self._task is None and self._timer is None:
+            self._timer = loop.call_later(self.group_commit_s, self._start_flush)
+        if self.durability == "none":
+            # Buffered for the next batch write; nobody waits for it.
+            fut = loop.create_future()
+            fut.set_result(None)
+            return fut
+        if self._batch is None:
+            self._batch = loop.create_future()
+        return self._batch
+
+    def _start_flush(self) -> None:
+        self._timer = None
+        if self._task is None and self._pending:
+            self._task = asyncio.get_running_loop().create_task(self._flush())
+
+    async def _flush(self) -> None:
+        try:
+            # Records appended while a batch is being fsync'd form the next batch.
+            while self._syncs or self._pending:
+                if self._syncs:
+                    chunks, batch = self._syncs.popleft()
+                else:
+                    chunks, self._pending = self._pending, []
+                    batch, self._batch = self._batch, None
+                try:
+                    await asyncio.to_thread(self._write_batch, chunks, self.durability != "none")
+                except Exception as e:
+                    self._fail(e, batch)
+                    return
+                if batch is not None and not batch.done():
+                    batch.set_result(None)
+            self._compact()
+        finally:
+            self._task = None
+
+    def _fail(self, e: Exception, batch: Optional[asyncio.Future[None]]) -> None:
+        self._error = e
+        log.error("wal_write_failed", extra={"directory": self.directory, "error": repr(e)})
+        # Later appends would land after a failed write: fail them too.
+        waiters = [batch, self._batch] + [w for _, w in self._syncs]
+        self._pending, self._batch = [], None
+        self._syncs.clear()
+        for waiter in waiters:
+            if waiter is not None and not waiter.done():
+                waiter.set_exception(e)
+
+    def _write_batch(self, chunks: List[Tuple[_Segment, bytearray]], sync: bool) -> None:
+        # Runs in a worker thread; segments are only closed by the event loop
+        # thread while no flush is in progress.
+        for seg, data in chunks:
+            os.write(seg.fd, data)
+            self.bytes_written += len(data)
+        if sync:
+            for seg in {seg.seq: seg for seg, _ in chunks}.values():
+                os.fsync(seg.fd)
+                self.fsyncs += 1
+                if not seg.dir_synced:
+                    self._fsync_dir()
+                    seg.dir_synced = True
+
+    def _fsync_dir(self) -> None:
+        # Make the new segment's directory entry durable too.
+        try:
+            dfd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dfd)
+        except OSError:
+            pass
+        finally:
+            os.close(dfd)
+
+    # --- compaction ---
+
+    def _compact(self) -> None:
+        """Delete the oldest segments whose messages have all been consumed."""
+        while len(self._segments) > 1 and self._segments[0] is not self._active:
+            seg = self._segments[0]
+            if any(self._consumed.get(q, 0) < n for q, n in seg.pushes.items()):
+                return
+            if seg.fd >= 0:
+                os.close(seg.fd)
+            try:
+                os.unlink(seg.path)
+            except FileNotFoundError:
+                pass
+            self._segments.pop(0)
+            self.segments_deleted += 1
+
+    def segment_count(self) -> int:
+        return len(self._segments)
+
+    async def flush(self) -> None:
+        """Write (and, unless durability is "none", fsync) everything appended so far."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._task is not None or self._pending or self._syncs:
+            if self._task is None:
+                self._task = asyncio.get_running_loop().create_task(self._flush())
+            await asyncio.shield(self._task)
+        if self._error is not None:
+            raise self._error
+
+    async def aclose(self) -> None:
+        try:
+            await self.flush()
+        finally:
+            for seg in self._segments:
+                if seg.fd >= 0:
+                    os.close(seg.fd)
+                    seg.fd = -1
+            self._active = None
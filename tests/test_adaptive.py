@@ -0,0 +1,96 @@
+import asyncio
+from dataclasses import dataclass
+
+from ratelimmq.dispatcher import PoolLimits, PoolStats, _AdaptiveHostLimits, run_pool
+
+
+def test_aimd_grows_when_saturated_and_cuts_on_trouble():
+    async def _run():
+        lim = _AdaptiveHostLimits(initial=2, min_limit=1, max_limit=4)
+        await lim.acquire("h")
+        await lim.acquire("h")
+        # saturated + healthy: +1 after `limit` completions
+        lim.record("h", True, 0.010, now=0.0)
+        assert lim.limit("h") == 2
+        lim.record("h", True, 0.010, now=0.0)
+        assert lim.limit("h") == 3
+
+        # not saturated: no growth
+        lim.release("h")
+        for _ in range(10):
+            lim.record("h", True, 0.010, now=0.0)
+        assert lim.limit("h") == 3
+
+        # an error cuts by 30%, once per observed latency
+        lim.record("h", False, 0.010, now=1.0)
+        lim.record("h", False, 0.010, now=1.001)
+        assert lim.limit("h") == 2
+        # latency far above the baseline counts as trouble too
+        lim.record("h", True, 1.0, now=2.0)
+        assert lim.limit("h") == 1
+        lim.record("h", False, 0.010, now=3.0)
+        assert lim.limit("h") == 1  # min bound
+        lim.release("h")
+        return lim.stats
+
+    stats = asyncio.run(_run())
+    assert stats.host_limits == {"h": 1}
+    assert stats.limit_increases == 1 and stats.limit_decreases == 2
+    assert stats.hosts_active == 0
+
+
+def test_lower_limit_queues_new_requests():
+    async def _run():
+        lim = _AdaptiveHostLimits(initial=2, min_limit=1, max_limit=4)
+        await lim.acquire("h")
+        await lim.acquire("h")
+        lim.record("h", False, 0.01, now=0.0)  # limit -> 1, 2 still in flight
+        waiter = asyncio.ensure_future(lim.acquire("h"))
+        await asyncio.sleep(0)
+        lim.release("h")
+        await asyncio.sleep(0)
+        blocked = not waiter.done()  # 1 in flight == limit
+        lim.release("h")
+        await asyncio.wait_for(waiter, 1.0)
+        lim.release("h")
+        return blocked
+
+    assert asyncio.run(_run()) is True
+
+
+@dataclass
+class _Res:
+    ok: bool
+
+
+def test_run_pool_adapts_per_host():
+    """A fragile host that fails above 3 concurrent requests settles low; a fast one grows."""
+    in_flight = {"fragile": 0, "fast": 0}
+
+    async def fetch(url: str) -> _Res:
+        host = url.split("/")[2]
+        in_flight[host] += 1
+        try:
+            await asyncio.sleep(0.005)
+            return _Res(ok=not (host == "fragile" and in_flight[host] > 3))
+        finally:
+            in_flight[host] -= 1
+
+    urls = [f"http://{h}/{i}" for i in range(300) for h in ("fragile", "fast")]
+    stats = PoolStats()
+    limits = PoolLimits(
+        total_concurrency=40,
+        per_host_concurrency=8,
+        adaptive_per_host=True,
+        min_per_host_concurrency=1,
+        max_per_host_concurrency=20,
+    )
+    results = asyncio.run(run_pool(urls, fetch, limits=limits, stats=stats))
+
+    assert len(results) == 600
+    assert 1 <= stats.host_limits["fragile"] <= 4
+    assert stats.host_limits["fast"] > 8
+    assert stats.host_limits["fast"] <= 20
+    # most of the fragile host's later requests succeed once the limit settled
+    fragile_tail = [r.ok for r in results[-200:][::2]]
+    assert sum(fragile_tail) > 0.8 * len(fragile_tail)
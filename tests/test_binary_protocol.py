@@ -0,0 +1,73 @@
+import asyncio
+import struct
+
+from ratelimmq.context import Context
+from ratelimmq.limiter import TokenBucket
+from ratelimmq.protocol import BINARY_MAGIC, encode_request
+from ratelimmq.server import handle_client
+
+PING, SHUTDOWN, HELP = 1, 2, 3
+
+
+async def _roundtrip(payload: bytes, *, ctx: Context | None = None, max_line_bytes: int = 64, **kw) -> bytes:
+    ctx = ctx or Context(stop_event=asyncio.Event())
+    server = await asyncio.start_server(
+        lambda r, w: handle_client(r, w, ctx, max_line_bytes, **kw), "127.0.0.1", 0
+    )
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(payload)
+        await writer.drain()
+        writer.write_eof()
+        data = await asyncio.wait_for(reader.read(), timeout=3.0)
+        writer.close()
+        return data
+
+
+def _frames(data: bytes) -> list[bytes]:
+    assert data.startswith(BINARY_MAGIC)
+    data = data[len(BINARY_MAGIC):]
+    out = []
+    while data:
+        (n,) = struct.unpack(">I", data[:4])
+        out.append(data[4:4 + n])
+        data = data[4 + n:]
+    return out
+
+
+def test_binary_mode_ping_help_unknown():
+    reqs = encode_request(PING) * 1000 + encode_request(HELP) + encode_request(99, b"\x00\xffraw")
+    frames = _frames(asyncio.run(_roundtrip(BINARY_MAGIC + reqs)))
+    assert frames[:1000] == [b"PONG"] * 1000
+    assert frames[1000:] == [b"OK", b"ERR unknown command"]
+
+
+def test_binary_mode_frames_split_across_reads_and_shutdown():
+    reqs = encode_request(PING) + encode_request(SHUTDOWN) + encode_request(PING)
+    # read_chunk=3 splits the magic, headers and payloads across reads
+    frames = _frames(asyncio.run(_roundtrip(BINARY_MAGIC + reqs, read_chunk=3)))
+    assert frames == [b"PONG", b"BYE"]
+
+
+def test_binary_mode_oversized_frame_is_skipped():
+    reqs = encode_request(PING, b"x" * 500) + encode_request(PING)
+    frames = _frames(asyncio.run(_roundtrip(BINARY_MAGIC + reqs, max_line_bytes=64, read_chunk=50)))
+    assert frames == [b"ERR frame too long", b"PONG"]
+
+
+def test_binary_mode_empty_frame_keeps_the_stream_in_sync():
+    reqs = struct.pack(">I", 0) + encode_request(PING) + struct.pack(">I", 0) + encode_request(HELP)
+    frames = _frames(asyncio.run(_roundtrip(BINARY_MAGIC + reqs, read_chunk=3)))
+    assert frames == [b"ERR empty frame", b"PONG", b"ERR empty frame", b"OK"]
+
+
+def test_binary_mode_limiter():
+    ctx = Context(stop_event=asyncio.Event(), limiter=TokenBucket(capacity=1, refill_rate=0))
+    reqs = encode_request(PING) * 2 + encode_request(SHUTDOWN)
+    frames = _frames(asyncio.run(_roundtrip(BINARY_MAGIC + reqs, ctx=ctx)))
+    assert frames == [b"PONG", b"ERR rate limited", b"BYE"]
+
+
+def test_text_mode_is_still_default():
+    assert asyncio.run(_roundtrip(b"PING\n")) == b"PONG\n"
@@ -0,0 +1,55 @@
+import asyncio
+
+from ratelimmq.breaker import CLOSED, HALF_OPEN, OPEN, HostBreakers
+from ratelimmq.client import fetch_all
+from ratelimmq.dispatcher import PoolLimits
+
+
+def test_consecutive_failures_open_then_half_open_probe_closes():
+    b = HostBreakers(failure_threshold=3, reset_timeout_s=5.0)
+    for _ in range(2):
+        assert b.allow("h", now=0.0)
+        b.record("h", False, now=0.0)
+    assert b.state("h") == CLOSED
+    b.record("h", False, now=1.0)
+    assert b.state("h") == OPEN
+    assert b.rejecting("h", now=2.0)
+    assert not b.allow("h", now=2.0)
+
+    # after the cooldown one probe goes through, the rest are refused
+    assert not b.rejecting("h", now=6.0)
+    assert b.allow("h", now=6.0)
+    assert b.state("h") == HALF_OPEN
+    assert not b.allow("h", now=6.0)
+    b.record("h", False, now=6.5)  # failed probe re-opens
+    assert b.state("h") == OPEN and not b.allow("h", now=7.0)
+
+    assert b.allow("h", now=12.0)
+    b.record("h", True, now=12.1)
+    assert b.state("h") == CLOSED and b.states() == {}
+    assert (b.opened, b.half_opened, b.closed, b.rejected) == (2, 2, 1, 3)
+
+
+def test_error_rate_opens_without_a_failure_streak():
+    b = HostBreakers(failure_threshold=100, error_rate=0.5, window=10, min_requests=10)
+    for i in range(11):
+        b.record("h", i % 2 == 1, now=0.0)  # alternate: never 2 failures in a row
+    assert b.state("h") == OPEN
+    # healthy hosts aren't tracked at all
+    b.record("ok", True)
+    assert b.state("ok") == CLOSED and "ok" not in b._hosts
+
+
+def test_dead_host_fails_fast_in_fetch_all():
+    breakers = HostBreakers(failure_threshold=2, reset_timeout_s=60.0)
+    # 127.0.0.1:1 refuses connections; "localhost" keeps its own breaker.
+    urls = ["http://127.0.0.1:1/x"] * 20
+    limits = PoolLimits(total_concurrency=2, per_host_concurrency=1)
+    results = asyncio.run(fetch_all(urls, limits=limits, timeout_s=2.0, backend="asyncio", breakers=breakers))
+
+    assert all(not r.ok for r in results)
+    fast = [r for r in results if r.error and r.error.startswith("CircuitOpen:")]
+    assert len(fast) == 18
+    assert all(r.attempts == 0 for r in fast)
+    assert breakers.state("127.0.0.1") == OPEN
+    assert breakers.opened == 1
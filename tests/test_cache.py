@@ -0,0 +1,162 @@
+import asyncio
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ratelimmq.cache import ResponseCache, freshness
+from ratelimmq.fetcher import fetch_one
+from ratelimmq.httpclient import ConnectionPool
+
+BODY = b"cached body"
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    full = 0
+    not_modified = 0
+
+    def do_GET(self):
+        if self.path == "/etag" and self.headers.get("If-None-Match") == '"v1"':
+            type(self).not_modified += 1
+            self.send_response(304)
+            self.send_header("ETag", '"v1"')
+            self.end_headers()
+            return
+        type(self).full += 1
+        self.send_response(200)
+        if self.path == "/etag":
+            self.send_header("ETag", '"v1"')
+            self.send_header("Cache-Control", "max-age=0")
+        elif self.path == "/fresh":
+            self.send_header("Cache-Control", "max-age=60")
+        else:
+            self.send_header("Cache-Control", "no-store")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, format, *args):
+        return
+
+
+def _serve():
+    Handler.full = Handler.not_modified = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def test_freshness_rules():
+    assert freshness({"cache-control": "public, max-age=30"}, 5) == 30
+    assert freshness({"cache-control": "no-cache"}, 5) == 0
+    assert freshness({"cache-control": "no-store"}, 5) is None
+    assert freshness({"expires": "Thu, 01 Jan 1970 00:01:40 GMT"}, 5, now_wall=40) == 60
+    assert freshness({}, 5) == 5
+    # private cache: the shared-cache s-maxage neither applies nor overrides max-age
+    assert freshness({"cache-control": "s-maxage=300, max-age=10"}, 5) == 10
+    assert freshness({"cache-control": "s-maxage=300"}, 5) == 5
+
+
+def test_revalidation_outcome_is_counted_once():
+    c = ResponseCache(default_ttl_s=1.0)
+    c.store("u", 200, {"etag": '"v1"'}, b"body", now=0.0)
+    entry, fresh = c.lookup("u", now=5.0)
+    assert entry is not None and not fresh
+    assert (c.hits, c.misses, c.revalidations) == (0, 0, 0)  # outcome not known yet
+    c.record_not_modified(entry, {}, now=5.0)
+    assert (c.hits, c.misses, c.revalidations) == (0, 0, 1)
+
+    entry, fresh = c.lookup("u", now=10.0)
+    c.record_miss()  # the origin sent a new body
+    assert (c.hits, c.misses, c.revalidations) == (0, 1, 1)
+
+
+def test_lru_bounds_and_expiry():
+    c = ResponseCache(max_entries=2, max_bytes=10, default_ttl_s=1.0)
+    c.store("a", 200, {}, b"aaaa", now=0.0)
+    c.store("b", 200, {}, b"bbbb", now=0.0)
+    assert c.lookup("a", now=0.5)[1] is True  # "a" is now most recent
+    c.store("c", 200, {}, b"cccc", now=0.5)  # over 10 bytes: evicts "b"
+    assert c.lookup("b", now=0.5) == (None, False)
+    assert c.size_bytes == 8 and c.evictions == 1
+    entry, fresh = c.lookup("a", now=2.0)
+    assert entry is not None and fresh is False
+    # not cacheable: error status, oversized, or stale with no validators
+    assert c.store("d", 404, {}, b"x") is None
+    assert c.store("e", 200, {}, b"x" * 11) is None
+    assert ResponseCache().store("f", 200, {}, b"x") is None
+
+
+def test_fetch_hit_revalidate_and_no_store():
+    httpd = _serve()
+    host, port = httpd.server_address
+    try:
+        async def _run(pool):
+            cache = ResponseCache()
+            out = []
+            for path in ("/fresh", "/fresh", "/etag", "/etag", "/etag", "/private", "/private"):
+                res = await fetch_one(f"http://{host}:{port}{path}", timeout_s=3.0, pool=pool, cache=cache)
+                assert res.ok and res.status_code == 200 and res.bytes_read == len(BODY)
+                out.append(res.cache)
+            return out, cache
+
+        async def _pooled():
+            async with ConnectionPool() as pool:
+                return await _run(pool)
+
+        expected = ["miss", "hit", "miss", "revalidated", "revalidated", "miss", "miss"]
+        for runner in (lambda: _run(None), _pooled):
+            Handler.full = Handler.not_modified = 0
+            statuses, cache = asyncio.run(runner())
+            assert statuses == expected
+            assert (cache.hits, cache.misses, cache.revalidations) == (1, 4, 2)
+            assert (Handler.full, Handler.not_modified) == (4, 2)
+    finally:
+        httpd.shutdown()
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    httpd = _serve()
+    host, port = httpd.server_address
+    url = f"http://{host}:{port}/fresh"
+    try:
+        first = asyncio.run(fetch_one(url, cache=ResponseCache(disk_dir=str(tmp_path))))
+        again = ResponseCache(disk_dir=str(tmp_path))
+        second = asyncio.run(fetch_one(url, cache=again))
+        assert (first.cache, second.cache) == ("miss", "hit")
+        assert again.disk_hits == 1
+        assert Handler.full == 1
+    finally:
+        httpd.shutdown()
+
+
+def test_disk_tier_is_bounded_and_drops_expired_files(tmp_path):
+    fresh = {"cache-control": "max-age=60"}
+    bounded = ResponseCache(disk_dir=str(tmp_path / "n"), disk_max_entries=3)
+    for i in range(5):
+        bounded.store(f"http://a.test/{i}", 200, fresh, b"x" * 10)
+    assert len(os.listdir(tmp_path / "n")) == 3
+    assert bounded.disk_evictions == 2
+    reopened = ResponseCache(disk_dir=str(tmp_path / "n"))
+    assert reopened.lookup("http://a.test/0") == (None, False)  # least recently stored went first
+    assert reopened.lookup("http://a.test/4")[1] is True
+
+    sized = ResponseCache(disk_dir=str(tmp_path / "b"), disk_max_bytes=2500)
+    for i in range(5):
+        sized.store(f"http://a.test/{i}", 200, fresh, b"x" * 1000)
+    assert len(os.listdir(tmp_path / "b")) == 2
+
+    async def _roundtrip():
+        c = ResponseCache(disk_dir=str(tmp_path / "e"))
+        await c.astore("http://a.test/short", 200, {"cache-control": "max-age=0.05"}, b"y")
+        await c.astore("http://a.test/etag", 200, {"cache-control": "max-age=0.05", "etag": '"v1"'}, b"z")
+        await asyncio.sleep(0.1)
+        c2 = ResponseCache(disk_dir=str(tmp_path / "e"))
+        return await c2.alookup("http://a.test/short"), await c2.alookup("http://a.test/etag"), c2
+
+    short, etag, c2 = asyncio.run(_roundtrip())
+    # Expired without validators: deleted on read. With an ETag: kept for revalidation.
+    assert short == (None, False)
+    assert etag[0] is not None and etag[0].body == b"z" and etag[1] is False
+    assert len(os.listdir(tmp_path / "e")) == 1
+    assert c2.disk_evictions == 1
@@ -0,0 +1,91 @@
+import asyncio
+
+from ratelimmq.context import Context
+from ratelimmq.limiter import KeyedTokenBuckets
+from ratelimmq.server import handle_client, parse_command_costs
+
+
+def test_keyed_buckets_retry_after_and_expiry():
+    kb = KeyedTokenBuckets(capacity=2, refill_rate=4)
+    assert kb.reserve("a", now=0.0) == (True, 0.0)
+    assert kb.reserve("a", now=0.0) == (True, 0.0)
+    ok, retry = kb.reserve("a", now=0.0)
+    assert ok is False
+    assert retry == 0.25
+    assert kb.rejected == 1
+
+    # another key is unaffected
+    assert kb.allow("b", now=0.0)
+
+    # once both have refilled they are dropped as idle
+    kb.allow("c", now=10.0)
+    assert len(kb) == 1
+    assert kb.expired == 2
+
+
+def test_keyed_buckets_bounded_and_borrowing():
+    kb = KeyedTokenBuckets(capacity=1, refill_rate=0.001, max_keys=10)
+    for i in range(1000):
+        kb.allow(f"k{i}", now=0.0)
+    assert len(kb) <= 12
+
+    kb = KeyedTokenBuckets(capacity=1, refill_rate=10)
+    assert kb.reserve("a", now=0.0) == (True, 0.0)
+    ok, wait = kb.reserve("a", max_wait=0.5, now=0.0)
+    assert ok and abs(wait - 0.1) < 1e-9
+    # the borrowed token pushes the next caller further back
+    ok, retry = kb.reserve("a", now=0.0)
+    assert not ok and abs(retry - 0.2) < 1e-9
+
+
+def test_keyed_buckets_reject_a_cost_above_capacity_for_good():
+    kb = KeyedTokenBuckets(capacity=2, refill_rate=4)
+    assert kb.reserve("a", cost=3, max_wait=10.0, now=0.0) == (False, float("inf"))
+    assert kb.rejected == 1
+    # the key wasn't charged (or even created)
+    assert len(kb) == 0
+    assert kb.reserve("a", cost=2, now=0.0) == (True, 0.0)
+
+
+def test_parse_command_costs():
+    assert parse_command_costs("") == {}
+    assert parse_command_costs("ping=2, HELP=0") == {"PING": 2.0, "HELP": 0.0}
+
+
+async def _session(port: int, lines: list[bytes]) -> list[bytes]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    out = []
+    for line in lines:
+        writer.write(line)
+        await writer.drain()
+        out.append(await reader.readline())
+    writer.close()
+    return out
+
+
+def test_clients_are_limited_independently_with_retry_hint():
+    async def _run():
+        ctx = Context(
+            stop_event=asyncio.Event(),
+            client_limiter=KeyedTokenBuckets(capacity=2, refill_rate=1),
+            limit_by="client",
+            command_costs={"HELP": 2.0},
+        )
+        server = await asyncio.start_server(lambda r, w: handle_client(r, w, ctx, 256), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            noisy = await _session(port, [b"AUTH noisy\n", b"PING\n", b"PING\n", b"PING\n"])
+            quiet = await _session(port, [b"AUTH quiet\n", b"HELP\n", b"PING\n"])
+            anon = await _session(port, [b"PING\n", b"AUTH\n"])
+        return noisy, quiet, anon
+
+    noisy, quiet, anon = asyncio.run(_run())
+    assert noisy[:3] == [b"OK\n", b"PONG\n", b"PONG\n"]
+    assert noisy[3].startswith(b"ERR rate limited retry_after_ms=")
+    assert 900 <= int(noisy[3].split(b"=")[1]) <= 1000
+
+    # HELP costs both of quiet's tokens
+    assert quiet == [b"OK\n", b"OK\n", quiet[2]]
+    assert quiet[2].startswith(b"ERR rate limited")
+
+    assert anon == [b"PONG\n", b"ERR usage: AUTH <client_id>\n"]
@@ -1,6 +1,6 @@
 import asyncio
 
-from ratelimmq.dispatcher import PoolLimits, run_pool
+from ratelimmq.dispatcher import PoolLimits, PoolStats, normalize_url, run_pool
 
 
 def test_pool_respects_global_and_per_host_caps():
@@ -49,3 +49,87 @@ def test_pool_respects_global_and_per_host_caps():
         assert max_b <= limits.per_host_concurrency
 
     asyncio.run(_run())
+
+
+def test_host_semaphores_are_evicted_when_idle():
+    urls = [f"https://h{i}.example/x" for i in range(500)] + ["https://a.example/y"] * 50
+    stats = PoolStats()
+    peak_hosts = 0
+
+    async def fetch_one(url: str) -> str:
+        nonlocal peak_hosts
+        peak_hosts = max(peak_hosts, stats.hosts_active)
+        await asyncio.sleep(0)
+        return url
+
+    results = asyncio.run(
+        run_pool(urls, fetch_one, limits=PoolLimits(total_concurrency=16, per_host_concurrency=2), stats=stats)
+    )
+    assert len(results) == len(urls)
+    # Never more live hosts than in-flight workers, and nothing left behind.
+    assert 0 < peak_hosts <= 16
+    assert stats.hosts_active == 0
+    assert stats.hosts_evicted == stats.hosts_created >= 501
+
+
+def test_duplicate_urls_in_flight_share_one_fetch():
+    urls = ["http://a.example/x", "http://a.example/y", "http://a.example/x"] * 10
+    calls = {}
+
+    async def fetch_one(url: str) -> str:
+        calls[url] = calls.get(url, 0) + 1
+        await asyncio.sleep(0.02)
+        return url.upper()
+
+    stats = PoolStats()
+    results = asyncio.run(
+        run_pool(urls, fetch_one, limits=PoolLimits(total_concurrency=8), stats=stats, coalesce=True)
+    )
+
+    assert results == [u.upper() for u in urls]  # input order
+    assert sum(calls.values()) + stats.coalesced == len(urls)
+    assert sum(calls.values()) <= 4  # a handful of waves, not one fetch per URL
+    assert stats.coalesced >= 26
+
+
+def test_coalescing_by_normalized_url():
+    assert normalize_url("HTTP://Example.COM:80") == "http://example.com/"
+    assert normalize_url("https://example.com:443/a?x=1#top") == "https://example.com/a?x=1"
+    assert normalize_url("https://example.com:8443/a") == "https://example.com:8443/a"
+
+    urls = ["http://example.com/", "HTTP://example.com:80/#a", "http://EXAMPLE.com"]
+    calls = []
+
+    async def fetch_one(url: str) -> str:
+        calls.append(url)
+        await asyncio.sleep(0.02)
+        return "body"
+
+    stats = PoolStats()
+    results = asyncio.run(run_pool(urls, fetch_one, stats=stats, coalesce=normalize_url))
+    assert results == ["body"] * 3
+    assert len(calls) == 1 and stats.coalesced == 2
+
+
+def test_cancellation_inside_fetch_one_fails_the_pool_instead_of_hanging():
+    async def fetch_one(url: str) -> str:
+        if url.endswith("/bad"):
+            # A cancelled shared future, as seen by a waiter that wasn't cancelled itself.
+            fut = asyncio.get_running_loop().create_future()
+            fut.cancel()
+            await fut
+        await asyncio.sleep(0.01)
+        return url
+
+    urls = [f"http://h{i % 3}.example/{i}" for i in range(20)] + ["http://h0.example/bad"]
+
+    async def _run():
+        try:
+            await asyncio.wait_for(run_pool(urls, fetch_one, limits=PoolLimits(total_concurrency=4)), 2.0)
+        except RuntimeError as e:
+            return e
+        return None
+
+    err = asyncio.run(_run())
+    assert err is not None and "bad" in str(err)
+    assert isinstance(err.__cause__, asyncio.CancelledError)
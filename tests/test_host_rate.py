@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+from ratelimmq.dispatcher import PoolLimits, run_pool
+from ratelimmq.limiter import KeyedRateLimiter
+
+
+def test_run_pool_enforces_per_host_rate_with_override():
+    urls = (["https://slow.example/x"] * 6) + (["https://fast.example/y"] * 6)
+    limits = PoolLimits(
+        total_concurrency=12,
+        per_host_concurrency=12,
+        per_host_rate=50.0,
+        host_rates={"slow.example": 20.0},
+    )
+
+    starts: dict[str, list[float]] = {"slow.example": [], "fast.example": []}
+
+    async def fetch_one(url: str) -> str:
+        host = "slow.example" if "slow" in url else "fast.example"
+        starts[host].append(time.monotonic())
+        return host
+
+    t0 = time.monotonic()
+    results = asyncio.run(run_pool(urls, fetch_one, limits=limits))
+    assert len(results) == 12
+
+    # burst=1: n requests need (n - 1) / rate seconds.
+    slow = starts["slow.example"]
+    fast = starts["fast.example"]
+    assert slow[-1] - slow[0] >= 5 / 20.0 - 0.02
+    assert fast[-1] - fast[0] >= 5 / 50.0 - 0.02
+    assert fast[-1] - t0 < slow[-1] - t0
+
+
+def test_keyed_limiter_single_timer_for_many_hosts():
+    async def _run():
+        lim = KeyedRateLimiter(rate=10.0, burst=1.0)
+        hosts = [f"h{i}.example" for i in range(500)]
+        # First token per host is immediate, second waits for exactly one refill.
+        await asyncio.gather(*(lim.acquire(h) for h in hosts))
+        t0 = asyncio.get_running_loop().time()
+        await asyncio.gather(*(lim.acquire(h) for h in hosts))
+        elapsed = asyncio.get_running_loop().time() - t0
+        return lim, elapsed
+
+    lim, elapsed = asyncio.run(_run())
+    assert lim.immediate + lim.delayed == 1000
+    assert lim.delayed >= 450
+    assert elapsed >= 0.05
+    # All hosts share deadlines ~100ms out; they must not each get their own timer.
+    assert lim.timer_fires < 50
+    assert lim.waiting() == 0
+
+
+def test_keyed_limiter_cancelled_waiter_does_not_consume():
+    async def _run():
+        lim = KeyedRateLimiter(rate=20.0)
+        await lim.acquire("a")
+        t = asyncio.create_task(lim.acquire("a"))
+        await asyncio.sleep(0)
+        t.cancel()
+        await asyncio.gather(t, return_exceptions=True)
+        await asyncio.sleep(0.06)
+        # The token that refilled should still be there.
+        t0 = asyncio.get_running_loop().time()
+        await lim.acquire("a")
+        return asyncio.get_running_loop().time() - t0
+
+    assert asyncio.run(_run()) < 0.02
+
+
+def test_unlimited_override_is_exempt():
+    async def _run():
+        lim = KeyedRateLimiter(rate=1.0, overrides={"free.example": None})
+        for _ in range(100):
+            await lim.acquire("free.example")
+        return lim.key_count()
+
+    assert asyncio.run(_run()) == 0
+
+
+def test_keyed_limiter_forgets_idle_hosts():
+    async def _run():
+        lim = KeyedRateLimiter(rate=100.0, burst=1.0, overrides={"busy.example": 1e9})
+        for i in range(1000):
+            await lim.acquire(f"h{i}.example")
+        peak = lim.key_count()
+        # Every bucket refills in 10ms; later traffic sweeps the idle keys.
+        await asyncio.sleep(0.03)
+        for _ in range(600):
+            await lim.acquire("busy.example")
+        return lim, peak
+
+    lim, peak = asyncio.run(_run())
+    assert peak > 900
+    assert lim.key_count() <= 2
+    assert lim.expired >= 998
+    assert lim.waiting() == 0
@@ -0,0 +1,177 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ratelimmq.client import fetch_all
+from ratelimmq.dispatcher import PoolLimits
+from ratelimmq.fetcher import fetch_one
+from ratelimmq.httpclient import ConnectionPool
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    truncated_hits = 0
+
+    def do_GET(self):
+        if self.path == "/truncated":
+            # Promise 128 KiB, send 96 KiB, then drop the connection mid-body.
+            type(self).truncated_hits += 1
+            self.send_response(200)
+            self.send_header("Content-Length", str(128 * 1024))
+            self.end_headers()
+            self.wfile.write(b"p" * (96 * 1024))
+            self.wfile.flush()
+            self.close_connection = True
+            return
+
+        if self.path == "/chunked":
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for part in (b"hello ", b"chunked ", b"world"):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(part), part))
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        if self.path == "/missing":
+            body = b"nope"
+            self.send_response(404)
+        else:
+            body = b"hello"
+            self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return
+
+
+def _serve():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    t = threading.Thread(target=httpd.serve_forever, daemon=True)
+    t.start()
+    return httpd
+
+
+def test_pool_reuses_keepalive_connections():
+    httpd = _serve()
+    host, port = httpd.server_address
+    try:
+        async def _run():
+            async with ConnectionPool(per_host=2) as pool:
+                for _ in range(5):
+                    res = await fetch_one(f"http://{host}:{port}/", timeout_s=3.0, pool=pool)
+                    assert res.ok is True
+                    assert res.status_code == 200
+                    assert res.bytes_read == 5
+                return pool.connections_opened, pool.connections_reused
+
+        opened, reused = asyncio.run(_run())
+        assert opened == 1
+        assert reused == 4
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_pool_caps_idle_connections_and_forgets_unused_hosts():
+    servers = [_serve() for _ in range(5)]
+    urls = [f"http://127.0.0.1:{h.server_address[1]}/" for h in servers]
+    try:
+        async def _run():
+            async with ConnectionPool(max_idle=2, idle_timeout_s=0.2) as pool:
+                for url in urls:
+                    assert (await pool.request(url, timeout_s=3.0)).status == 200
+                # Only the two most recent origins keep an idle socket.
+                capped = (pool.idle_count(), pool.host_count(), pool.idle_closed)
+
+                await asyncio.sleep(0.3)
+                assert (await pool.request(urls[0], timeout_s=3.0)).status == 200
+                # Returning that connection closed the expired ones.
+                expired = (pool.idle_count(), pool.host_count(), pool.idle_closed)
+                return capped, expired
+
+        capped, expired = asyncio.run(_run())
+        assert capped == (2, 2, 3)
+        assert expired == (1, 1, 5)
+    finally:
+        for h in servers:
+            h.shutdown()
+            h.server_close()
+
+
+def test_pool_does_not_retry_a_reused_connection_that_fails_mid_body():
+    httpd = _serve()
+    host, port = httpd.server_address
+    Handler.truncated_hits = 0
+    try:
+        async def _run():
+            chunks = []
+            async with ConnectionPool() as pool:
+                assert (await pool.request(f"http://{host}:{port}/", timeout_s=3.0)).status == 200
+                try:
+                    await pool.request(f"http://{host}:{port}/truncated", timeout_s=3.0, on_chunk=chunks.append)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    err = e
+                else:
+                    err = None
+                return chunks, err, pool.connections_opened, pool.connections_reused
+
+        chunks, err, opened, reused = asyncio.run(_run())
+        assert err is not None
+        # The prefix reached the sink once; no second attempt streamed it again.
+        assert 0 < len(b"".join(chunks)) <= 96 * 1024
+        assert Handler.truncated_hits == 1
+        assert (opened, reused) == (1, 1)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_pool_chunked_and_http_errors():
+    httpd = _serve()
+    host, port = httpd.server_address
+    try:
+        async def _run():
+            async with ConnectionPool() as pool:
+                chunked = await fetch_one(f"http://{host}:{port}/chunked", timeout_s=3.0, pool=pool)
+                missing = await fetch_one(f"http://{host}:{port}/missing", timeout_s=3.0, pool=pool)
+                return chunked, missing
+
+        chunked, missing = asyncio.run(_run())
+        assert chunked.ok is True
+        assert chunked.bytes_read == len(b"hello chunked world")
+        assert missing.ok is False
+        assert missing.status_code == 404
+        assert missing.error is not None and "404" in missing.error
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_fetch_all_asyncio_backend():
+    httpd = _serve()
+    host, port = httpd.server_address
+    try:
+        urls = [f"http://{host}:{port}/"] * 20
+        limits = PoolLimits(total_concurrency=8, per_host_concurrency=3)
+        results = asyncio.run(fetch_all(urls, limits=limits, timeout_s=3.0, backend="asyncio"))
+        assert len(results) == 20
+        assert all(r.ok for r in results)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_fetch_one_connection_refused():
+    # Port 1 on localhost should not be listening.
+    async def _run():
+        async with ConnectionPool() as pool:
+            return await fetch_one("http://127.0.0.1:1/", timeout_s=2.0, pool=pool)
+
+    res = asyncio.run(_run())
+    assert res.ok is False
+    assert res.status_code is None
+    assert res.error
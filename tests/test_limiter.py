@@ -1,3 +1,5 @@
+import asyncio
+
 from ratelimmq.limiter import TokenBucket
 
 
@@ -30,3 +32,71 @@ def test_token_bucket_refill_caps_at_capacity():
     assert b.allow(now=100.0)
     assert b.allow(now=100.0)
     assert not b.allow(now=100.0)
+
+
+def test_acquire_waits_exact_refill_time_fifo():
+    async def _run():
+        b = TokenBucket(capacity=1, refill_rate=20)  # one token every 50ms
+        loop = asyncio.get_running_loop()
+        order = []
+        t0 = loop.time()
+
+        async def take(i):
+            await b.acquire()
+            order.append((i, loop.time() - t0))
+
+        await asyncio.gather(*(take(i) for i in range(4)))
+        return order
+
+    order = asyncio.run(_run())
+    assert [i for i, _ in order] == [0, 1, 2, 3]
+    # 1 immediate + 3 refills of 50ms each
+    assert 0.14 <= order[-1][1] < 0.3
+
+
+def test_try_acquire_rejects_up_front_when_deadline_too_short():
+    async def _run():
+        b = TokenBucket(capacity=1, refill_rate=1)
+        assert await b.try_acquire(max_wait=0.0)
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        ok = await b.try_acquire(max_wait=0.1)  # next token is ~1s away
+        return ok, loop.time() - t0
+
+    ok, elapsed = asyncio.run(_run())
+    assert ok is False
+    assert elapsed < 0.05
+
+
+def test_try_acquire_cancelled_waiter_returns_its_place():
+    async def _run():
+        b = TokenBucket(capacity=1, refill_rate=20)
+        await b.acquire()
+        first = asyncio.create_task(b.acquire())
+        second = asyncio.create_task(b.try_acquire(max_wait=1.0))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        ok = await second
+        return ok, loop.time() - t0, b.wait_time()
+
+    ok, elapsed, wait = asyncio.run(_run())
+    assert ok is True
+    # second only waits for one refill, not two
+    assert elapsed < 0.09
+    assert wait > 0.0
+
+
+def test_allow_does_not_jump_async_queue():
+    async def _run():
+        b = TokenBucket(capacity=1, refill_rate=50)
+        await b.acquire()
+        t = asyncio.create_task(b.acquire())
+        await asyncio.sleep(0)
+        jumped = b.allow(now=b.last_ts + 10)
+        await t
+        return jumped
+
+    assert asyncio.run(_run()) is False
@@ -0,0 +1,67 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+
+def _free_port() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def _wait_for_listen(port: int, timeout_s: float = 3.0) -> None:
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Server did not start listening on port {port} within {timeout_s}s")
+
+
+def test_limited_commands_wait_for_tokens_instead_of_erroring():
+    port = _free_port()
+    env = os.environ.copy()
+    env["PYTHONPATH"] = "src"
+    env["RATELIMMQ_HOST"] = "127.0.0.1"
+    env["RATELIMMQ_PORT"] = str(port)
+    env["RATELIMMQ_ENABLE_LIMITER"] = "1"
+    env["RATELIMMQ_CAPACITY"] = "1"
+    env["RATELIMMQ_REFILL_RATE"] = "20"
+    env["RATELIMMQ_LIMITER_MAX_WAIT_MS"] = "500"
+
+    proc = subprocess.Popen(
+        [sys.executable, "src/ratelimmq/server.py"],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+    try:
+        _wait_for_listen(port)
+
+        with socket.create_connection(("127.0.0.1", port), timeout=2.0) as s:
+            f = s.makefile("rwb", buffering=0)
+            for _ in range(4):
+                f.write(b"PING\n")
+                assert f.readline() == b"PONG\n"
+
+            f.write(b"SHUTDOWN\n")
+            assert f.readline() == b"BYE\n"
+
+        proc.wait(timeout=3.0)
+        assert proc.returncode == 0
+
+    finally:
+        if proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=2.0)
+            except subprocess.TimeoutExpired:
+                proc.kill()
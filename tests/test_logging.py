@@ -0,0 +1,67 @@
+import io
+import json
+import logging
+import threading
+import time
+
+from ratelimmq.logging_config import LogSampler, QueuedHandler, _JsonFormatter, parse_event_map
+
+
+def _record(msg, level=logging.INFO, **extra):
+    rec = logging.LogRecord("ratelimmq.fetcher", level, __file__, 1, msg, None, None)
+    rec.__dict__.update(extra)
+    return rec
+
+
+def test_sampler_keeps_failures_and_caps_rate():
+    s = LogSampler({"fetch_done": 0.0}, {"fetch_start": 5})
+    assert s.filter(_record("fetch_done", ok=True, error=None)) is False
+    assert s.filter(_record("fetch_done", ok=False, error="HTTPError: 500")) is True
+    assert s.filter(_record("other")) is True
+
+    now = time.time()
+    kept = 0
+    for _ in range(20):
+        rec = _record("fetch_start")
+        rec.created = now
+        kept += s.filter(rec)
+    assert kept == 5
+    assert (s.sampled_out, s.rate_limited) == (1, 15)
+
+    assert parse_event_map("fetch_done=0.01, fetch_start=0") == {"fetch_done": 0.01, "fetch_start": 0.0}
+
+
+def test_queued_handler_writes_batches_off_thread_and_counts_drops():
+    out = io.StringIO()
+    h = QueuedHandler(out, queue_size=1000, batch_size=100)
+    h.setFormatter(_JsonFormatter())
+    for i in range(250):
+        h.handle(_record("fetch_done", url=f"http://h/{i}", ok=True))
+    h.close()
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 250 == h.emitted
+    assert json.loads(lines[-1])["url"] == "http://h/249"
+    assert h.batches < 250 and h.dropped == 0
+
+    # A stuck stream must not block callers: the queue fills, then records drop.
+    class _Stuck(io.StringIO):
+        entered = threading.Event()
+        release = threading.Event()
+
+        def write(self, data):
+            self.entered.set()
+            self.release.wait(5)
+            return super().write(data)
+
+    stuck = _Stuck()
+    h = QueuedHandler(stuck, queue_size=2)
+    h.emit(_record("first"))
+    assert stuck.entered.wait(5)
+    t0 = time.perf_counter()
+    for _ in range(10):
+        h.emit(_record("more"))
+    assert time.perf_counter() - t0 < 0.5
+    assert h.dropped == 8
+    stuck.release.set()
+    h.close()
+    assert h.emitted == 3
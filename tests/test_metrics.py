@@ -1,4 +1,4 @@
-from ratelimmq.metrics import summarize_latencies
+from ratelimmq.metrics import LatencySketch, RollingLatency, summarize_latencies
 
 def test_latency_summary_basic():
     lat = [0.10, 0.20, 0.30, 0.40, 0.50]  # seconds
@@ -8,3 +8,149 @@ def test_latency_summary_basic():
     assert s.p95_ms >= s.p50_ms
     assert s.p99_ms >= s.p95_ms
     assert s.rps == 5.0
+
+
+def test_sketch_quantiles_within_relative_error():
+    import random
+
+    rng = random.Random(7)
+    vals = [rng.lognormvariate(-3.0, 1.0) for _ in range(20_000)]
+
+    sk = LatencySketch(relative_accuracy=0.01)
+    for v in vals:
+        sk.add(v)
+
+    exact = summarize_latencies(vals, total_time_s=10.0)
+    approx = sk.summary(total_time_s=10.0)
+    assert approx.count == exact.count
+    assert approx.rps == exact.rps
+    for a, e in ((approx.p50_ms, exact.p50_ms), (approx.p95_ms, exact.p95_ms), (approx.p99_ms, exact.p99_ms)):
+        assert abs(a - e) / e < 0.03
+    assert abs(approx.mean_ms - exact.mean_ms) < 1e-6
+
+
+def test_sketch_merge_and_roundtrip_match_single_sketch():
+    whole = LatencySketch()
+    parts = [LatencySketch() for _ in range(3)]
+    for i in range(3000):
+        v = 0.001 * (1 + i % 250)
+        whole.add(v)
+        parts[i % 3].add(v)
+
+    merged = LatencySketch.from_dict(parts[0].to_dict())
+    merged.merge(LatencySketch.from_dict(parts[1].to_dict()))
+    merged.merge(parts[2])
+
+    assert merged.count == whole.count
+    for q in (0.5, 0.95, 0.99):
+        assert merged.quantile(q) == whole.quantile(q)
+
+
+def test_rolling_window_expires_old_samples():
+    r = RollingLatency(window_s=10.0, slices=5)
+    for i in range(100):
+        r.add(1.0, now=i * 0.01)  # slow requests at t~0..1s
+    for i in range(100):
+        r.add(0.01, now=12.0 + i * 0.01)  # fast requests at t~12..13s
+
+    s = r.summary(now=13.0)
+    assert s.count == 100
+    assert s.p99_ms < 20.0
+    assert s.rps == 10.0  # 100 samples over a 10s window
+
+
+def test_registry_renders_prometheus_text_and_caps_series():
+    from ratelimmq.metrics import OVERFLOW_LABEL, MetricsRegistry
+
+    reg = MetricsRegistry()
+    c = reg.counter("x_total", "things", ("host",), max_series=2)
+    for h in ("a", "b", "c", "d"):
+        c.labels(h).inc()
+    g = reg.gauge("x_in_flight", "now")
+    g.inc(3)
+    g.dec()
+    hist = reg.histogram("x_seconds", "lat", buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 5.0):
+        hist.observe(v)
+
+    text = reg.render()
+    assert "# TYPE x_total counter" in text
+    assert 'x_total{host="a"} 1' in text
+    assert f'x_total{{host="{OVERFLOW_LABEL}"}} 2' in text and 'host="d"' not in text
+    assert "x_in_flight 2" in text
+    assert 'x_seconds_bucket{le="0.1"} 1' in text
+    assert 'x_seconds_bucket{le="1"} 2' in text
+    assert 'x_seconds_bucket{le="+Inf"} 3' in text
+    assert "x_seconds_count 3" in text
+
+
+def test_fetch_and_pool_metrics_are_served_over_http():
+    import asyncio
+
+    from ratelimmq.dispatcher import run_pool
+    from ratelimmq.fetcher import fetch_one
+    from ratelimmq.metrics import FetchMetrics, MetricsRegistry, PoolMetrics, serve_metrics
+
+    reg = MetricsRegistry()
+    fm, pm = FetchMetrics(reg), PoolMetrics(reg)
+
+    async def _run():
+        async def one(u):
+            return await fetch_one(u, timeout_s=1.0, metrics=fm)
+
+        await run_pool(["http://127.0.0.1:1/a", "http://127.0.0.1:1/b"], one, metrics=pm)
+        server = await serve_metrics(port=0, registry=reg)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: x\r\n\r\n")
+        raw = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return raw.decode()
+
+    raw = asyncio.run(_run())
+    assert raw.startswith("HTTP/1.1 200 OK")
+    assert "text/plain; version=0.0.4" in raw
+    assert 'ratelimmq_fetch_requests_total{host="127.0.0.1",outcome="error"} 2' in raw
+    assert "ratelimmq_fetch_in_flight 0" in raw
+    assert "ratelimmq_pool_in_flight 0" in raw
+    assert "ratelimmq_pool_queue_depth 0" in raw
+    assert "ratelimmq_pool_slot_wait_seconds_count 2" in raw
+
+
+def test_overflow_folds_only_the_unbounded_label():
+    from ratelimmq.metrics import OVERFLOW_LABEL, MetricsRegistry
+
+    reg = MetricsRegistry()
+    c = reg.counter("y_total", "things", ("host", "outcome"), max_series=2, overflow=("host",))
+    c.labels("a", "ok").inc()
+    c.labels("b", "ok").inc()
+    c.labels("c", "ok").inc()
+    c.labels("d", "error").inc()
+    c.labels("e", "error").inc()
+
+    text = reg.render()
+    assert f'y_total{{host="{OVERFLOW_LABEL}",outcome="ok"}} 1' in text
+    assert f'y_total{{host="{OVERFLOW_LABEL}",outcome="error"}} 2' in text
+    assert c.overflowed == 3
+
+
+def test_start_prometheus_reports_a_busy_port():
+    import asyncio
+    import socket
+
+    from ratelimmq import metrics
+
+    busy = socket.create_server(("0.0.0.0", 0))
+    port = busy.getsockname()[1]
+    try:
+        assert metrics.start_prometheus(port) is False  # background-thread path
+
+        async def _in_loop():
+            return metrics.start_prometheus(port)
+
+        assert asyncio.run(_in_loop()) is False
+        assert metrics._PROM_STARTED is False
+    finally:
+        busy.close()
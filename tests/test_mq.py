@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+from ratelimmq.context import Context
+from ratelimmq.handlers.queue import bpop
+from ratelimmq.mq import MessageQueue, QueueFull, QueueRegistry, TooManyQueues
+from ratelimmq.protocol import BINARY_MAGIC, LENGTH_PREFIX, Request, encode_request
+from ratelimmq.server import handle_client
+
+
+def test_queue_fifo_batches_and_backpressure():
+    q = MessageQueue(capacity=3)
+    assert q.push("a") == 1
+    assert q.push_many(["b", "c", "d"]) == 2
+    with pytest.raises(QueueFull):
+        q.push("e")
+    assert q.rejected == 2
+    assert q.pop() == "a"
+    assert q.pop_many(10) == ["b", "c"]
+    assert q.pop() is None
+
+    reg = QueueRegistry(capacity=1, max_queues=2)
+    reg.get_or_create("x")
+    reg.get_or_create("y")
+    assert reg.get_or_create("x") is reg.get("x")
+    with pytest.raises(TooManyQueues):
+        reg.get_or_create("z")
+
+
+def test_pop_wait_handoff_timeout_and_cancel():
+    async def _run():
+        q = MessageQueue(capacity=1)
+        first = asyncio.ensure_future(q.pop_wait(5.0))
+        second = asyncio.ensure_future(q.pop_wait(5.0))
+        await asyncio.sleep(0)
+        q.push("m1")
+        q.push("m2")  # goes straight to the second waiter, not the full-check
+        assert await first == "m1"
+        assert await second == "m2"
+        assert len(q) == 0
+
+        assert await q.pop_wait(0.05) is None
+
+        # A message handed to a waiter that gets cancelled is put back.
+        waiter = asyncio.ensure_future(q.pop_wait(None))
+        await asyncio.sleep(0)
+        q.push("kept")
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return q.pop()
+
+    assert asyncio.run(_run()) == "kept"
+
+
+async def _send(reader, writer, line: bytes, nlines: int = 1) -> list:
+    writer.write(line)
+    await writer.drain()
+    return [await reader.readline() for _ in range(nlines)]
+
+
+def test_queue_commands_over_tcp():
+    async def _run():
+        ctx = Context(stop_event=asyncio.Event(), queue=QueueRegistry(capacity=3, max_queues=1))
+        server = await asyncio.start_server(lambda r, w: handle_client(r, w, ctx, 256), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        out = {}
+        async with server:
+            r, w = await asyncio.open_connection("127.0.0.1", port)
+            out["push"] = await _send(r, w, b"PUSH jobs hello world\n")
+            out["mpush"] = await _send(r, w, b"MPUSH jobs a b c\n")
+            out["full"] = await _send(r, w, b"PUSH jobs x\n")
+            out["len"] = await _send(r, w, b"QLEN jobs\n")
+            out["pop"] = await _send(r, w, b"POP jobs\n")
+            out["mpop"] = await _send(r, w, b"MPOP jobs 5\n", 3)
+            out["nil"] = await _send(r, w, b"POP jobs\n")
+            out["other"] = await _send(r, w, b"PUSH other x\n")
+            out["usage"] = await _send(r, w, b"MPOP jobs\n")
+
+            # BPOP parks until another connection pushes.
+            r2, w2 = await asyncio.open_connection("127.0.0.1", port)
+            w.write(b"BPOP jobs 5\n")
+            await w.drain()
+            await asyncio.sleep(0.05)
+            out["push2"] = await _send(r2, w2, b"PUSH jobs late\n")
+            out["bpop"] = [await r.readline()]
+            out["timeout"] = await _send(r, w, b"BPOP jobs 0.05\n")
+
+            # Binary framing takes the same arguments as the payload.
+            w2.close()
+            r2, w2 = await asyncio.open_connection("127.0.0.1", port)
+            w2.write(BINARY_MAGIC + encode_request(5, b"jobs bin") + encode_request(6, b"jobs"))
+            await w2.drain()
+            assert await r2.readexactly(len(BINARY_MAGIC)) == BINARY_MAGIC
+            frames = []
+            for _ in range(2):
+                n = LENGTH_PREFIX.unpack(await r2.readexactly(LENGTH_PREFIX.size))[0]
+                frames.append(await r2.readexactly(n))
+            out["binary"] = frames
+            w.close()
+            w2.close()
+        return out
+
+    out = asyncio.run(_run())
+    assert out["push"] == [b"OK 1\n"]
+    assert out["mpush"] == [b"OK 2\n"]
+    assert out["full"] == [b"ERR queue full\n"]
+    assert out["len"] == [b"LEN 3\n"]
+    assert out["pop"] == [b"MSG hello world\n"]
+    assert out["mpop"] == [b"MSGS 2\n", b"a\n", b"b\n"]
+    assert out["nil"] == [b"NIL\n"]
+    assert out["other"] == [b"ERR too many queues\n"]
+    assert out["usage"] == [b"ERR usage: MPOP <queue> <n>\n"]
+    assert out["push2"] == [b"OK 0\n"]
+    assert out["bpop"] == [b"MSG late\n"]
+    assert out["timeout"] == [b"NIL\n"]
+    assert out["binary"] == [b"OK 1", b"MSG bin"]
+
+
+def test_bpop_returns_on_shutdown():
+    async def _run():
+        ctx = Context(stop_event=asyncio.Event())
+        server = await asyncio.start_server(lambda r, w: handle_client(r, w, ctx, 256), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            r, w = await asyncio.open_connection("127.0.0.1", port)
+            w.write(b"BPOP q 30\n")
+            await w.drain()
+            await asyncio.sleep(0.05)
+            ctx.stop_event.set()
+            line = await asyncio.wait_for(r.readline(), 2.0)
+            w.close()
+        return line
+
+    assert asyncio.run(_run()) == b"NIL\n"
+
+
+def test_bpop_cancelled_after_its_pop_completed_keeps_the_message():
+    async def _run():
+        ctx = Context(stop_event=asyncio.Event(), queue=QueueRegistry(capacity=10, max_queues=10))
+        task = asyncio.create_task(bpop(ctx, Request(cmd="BPOP", args=["q", "5"])))
+        await asyncio.sleep(0.01)  # parked
+        q = ctx.queue.get("q")
+        q.push("m")
+        await asyncio.sleep(0)  # the pop finishes; the handler hasn't resumed yet
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return list(q._items), q.popped
+
+    assert asyncio.run(_run()) == (["m"], 0)
@@ -0,0 +1,77 @@
+import asyncio
+
+from ratelimmq.context import Context
+from ratelimmq.limiter import TokenBucket
+from ratelimmq.mq import QueueRegistry
+from ratelimmq.server import handle_client
+
+
+async def _roundtrip(payload: bytes, *, ctx: Context | None = None, max_line_bytes: int = 64, **kw) -> bytes:
+    ctx = ctx or Context(stop_event=asyncio.Event())
+    server = await asyncio.start_server(
+        lambda r, w: handle_client(r, w, ctx, max_line_bytes, **kw), "127.0.0.1", 0
+    )
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(payload)
+        await writer.drain()
+        writer.write_eof()
+        data = await asyncio.wait_for(reader.read(), timeout=3.0)
+        writer.close()
+        return data
+
+
+def test_pipelined_pings_come_back_in_order():
+    n = 5000
+    data = asyncio.run(_roundtrip(b"PING\n" * n + b"WUT\n" + b"PING\n"))
+    lines = data.split(b"\n")[:-1]
+    assert len(lines) == n + 2
+    assert set(lines[:n]) == {b"PONG"}
+    assert lines[n] == b"ERR unknown command"
+    assert lines[-1] == b"PONG"
+
+
+def test_pipelined_lines_split_across_reads_and_oversized_lines():
+    payload = b"PING\n" + b"X" * 200 + b"\nPING\nPI" + b"NG\n" + b"Y" * 30 + b"\n"
+    # Tiny reads force lines (and the oversized one) to span many chunks.
+    data = asyncio.run(_roundtrip(payload, max_line_bytes=16, read_chunk=7, high_water=1))
+    assert data == b"PONG\nERR line too long\nPONG\nPONG\nERR line too long\n"
+
+
+def test_shutdown_stops_the_batch_and_final_line_without_newline():
+    ctx = Context(stop_event=asyncio.Event())
+    data = asyncio.run(_roundtrip(b"PING\nSHUTDOWN\nPING\nPING\n", ctx=ctx))
+    assert data == b"PONG\nBYE\n"
+    assert ctx.stop_event.is_set()
+
+    assert asyncio.run(_roundtrip(b"PING\nPING")) == b"PONG\nPONG\n"
+
+
+def test_limiter_applies_per_pipelined_command():
+    ctx = Context(stop_event=asyncio.Event(), limiter=TokenBucket(capacity=2, refill_rate=0))
+    data = asyncio.run(_roundtrip(b"PING\nPING\nPING\nSHUTDOWN\n", ctx=ctx))
+    assert data == b"PONG\nPONG\nERR rate limited\nBYE\n"
+
+
+def test_replies_before_a_parked_bpop_are_sent_right_away():
+    async def _run():
+        ctx = Context(stop_event=asyncio.Event(), queue=QueueRegistry(capacity=10, max_queues=10))
+        server = await asyncio.start_server(lambda r, w: handle_client(r, w, ctx, 256), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"PUSH q a\nBPOP q2 2\n")
+            await writer.drain()
+            t0 = asyncio.get_running_loop().time()
+            first = await asyncio.wait_for(reader.readline(), timeout=1.0)
+            elapsed = asyncio.get_running_loop().time() - t0
+            ctx.stop_event.set()
+            rest = await asyncio.wait_for(reader.readline(), timeout=1.0)
+            writer.close()
+            return first, elapsed, rest
+
+    first, elapsed, rest = asyncio.run(_run())
+    assert first == b"OK 1\n"
+    assert elapsed < 0.5  # not held back until the BPOP times out
+    assert rest == b"NIL\n"
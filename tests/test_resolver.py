@@ -0,0 +1,161 @@
+import asyncio
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ratelimmq.fetcher import fetch_one
+from ratelimmq.httpclient import ConnectionPool
+from ratelimmq.resolver import DNSCache
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = self.headers.get("Host", "").encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return
+
+
+class _FakeLookup:
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = 0
+
+    async def __call__(self, host, port):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        answer = self.answers[host]
+        if isinstance(answer, Exception):
+            raise answer
+        return list(answer)
+
+
+def test_static_hosts_and_ip_literals_skip_the_resolver():
+    lookup = _FakeLookup({})
+    dns = DNSCache(static_hosts={"Origin.test": ["10.0.0.1", "10.0.0.2"]}, lookup=lookup)
+
+    async def _run():
+        return [await dns.resolve("origin.test") for _ in range(3)] + [await dns.resolve("127.0.0.1")]
+
+    assert asyncio.run(_run()) == ["10.0.0.1", "10.0.0.2", "10.0.0.1", "127.0.0.1"]
+    assert lookup.calls == 0
+
+
+def test_concurrent_lookups_share_one_resolver_call():
+    lookup = _FakeLookup({"a.test": ["10.0.0.1", "10.0.0.2"]})
+    dns = DNSCache(lookup=lookup)
+
+    async def _run():
+        first = await asyncio.gather(*(dns.resolve("a.test") for _ in range(10)))
+        again = await dns.resolve("a.test")
+        return first, again
+
+    first, again = asyncio.run(_run())
+    assert lookup.calls == 1
+    assert (dns.misses, dns.coalesced, dns.hits) == (1, 9, 1)
+    assert set(first) == {"10.0.0.1", "10.0.0.2"}
+    assert again in ("10.0.0.1", "10.0.0.2")
+
+
+def test_leader_timeout_does_not_cancel_followers():
+    class _Slow(_FakeLookup):
+        async def __call__(self, host, port):
+            self.calls += 1
+            await asyncio.sleep(0.2)
+            return list(self.answers[host])
+
+    lookup = _Slow({"a.test": ["10.0.0.1"]})
+    dns = DNSCache(lookup=lookup)
+
+    async def _run():
+        leader = asyncio.ensure_future(asyncio.wait_for(dns.resolve("a.test"), 0.05))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(asyncio.wait_for(dns.resolve("a.test"), 2.0))
+        with pytest.raises(asyncio.TimeoutError):
+            await leader
+        return await follower
+
+    assert asyncio.run(_run()) == "10.0.0.1"
+    assert (lookup.calls, dns.coalesced) == (1, 1)
+
+
+def test_ttl_expiry_negative_caching_and_eviction():
+    lookup = _FakeLookup({"a.test": ["10.0.0.1"], "b.test": ["10.0.0.2"], "bad.test": socket.gaierror("nope")})
+    dns = DNSCache(ttl_s=0.05, negative_ttl_s=0.05, max_hosts=1, lookup=lookup)
+
+    async def _run():
+        await dns.resolve("a.test")
+        await dns.resolve("a.test")
+        await asyncio.sleep(0.06)
+        await dns.resolve("a.test")  # expired
+        for _ in range(2):
+            with pytest.raises(socket.gaierror):
+                await dns.resolve("bad.test")
+        await dns.resolve("b.test")
+
+    asyncio.run(_run())
+    assert (dns.misses, dns.hits, dns.negative_hits) == (4, 1, 1)
+    assert len(dns) == 1 and dns.evictions == 2
+
+
+def test_fetch_one_connects_to_cached_address_on_both_backends():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    port = httpd.server_address[1]
+    url = f"http://origin.test:{port}/"
+    try:
+        async def _run():
+            dns = DNSCache(static_hosts={"origin.test": ["127.0.0.1"]})
+            threaded = await fetch_one(url, timeout_s=3.0, resolver=dns)
+            async with ConnectionPool(resolver=dns) as pool:
+                pooled = await fetch_one(url, timeout_s=3.0, pool=pool)
+            unknown = await fetch_one("http://unknown.invalid/", timeout_s=3.0, resolver=DNSCache())
+            return threaded, pooled, unknown, dns.hits
+
+        threaded, pooled, unknown, hits = asyncio.run(_run())
+        assert (threaded.ok, threaded.status_code) == (True, 200)
+        assert (pooled.ok, pooled.status_code) == (True, 200)
+        assert hits == 2
+        assert unknown.ok is False and unknown.error
+    finally:
+        httpd.shutdown()
+
+
+def test_pinned_address_is_not_used_for_a_cross_host_redirect():
+    class Redirect(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(302)
+            self.send_header("Location", f"http://127.0.0.2:{target.server_address[1]}/final")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            return
+
+    # The redirect target only listens on 127.0.0.2, so dialling the pinned
+    # 127.0.0.1 for it would be refused.
+    target = ThreadingHTTPServer(("127.0.0.2", 0), Handler)
+    origin = ThreadingHTTPServer(("127.0.0.1", 0), Redirect)
+    for httpd in (target, origin):
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        async def _run():
+            dns = DNSCache(static_hosts={"origin.test": ["127.0.0.1"]})
+            return await fetch_one(f"http://origin.test:{origin.server_address[1]}/", timeout_s=3.0, resolver=dns)
+
+        res = asyncio.run(_run())
+        assert (res.ok, res.status_code, res.error) == (True, 200, None)
+    finally:
+        for httpd in (target, origin):
+            httpd.shutdown()
+            httpd.server_close()
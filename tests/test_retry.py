@@ -0,0 +1,127 @@
+import asyncio
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ratelimmq.client import fetch_all
+from ratelimmq.dispatcher import PoolLimits
+from ratelimmq.fetcher import fetch_one
+from ratelimmq.httpclient import ConnectionPool
+from ratelimmq.retry import RetryBudget, RetryPolicy
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    hits: dict = {}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            n = self.hits[self.path] = self.hits.get(self.path, 0) + 1
+        # /flaky-N fails with 503 N times, then succeeds
+        failures = int(self.path.rsplit("-", 1)[1]) if self.path.startswith("/flaky-") else 0
+        if self.path == "/missing":
+            status = 404
+        else:
+            status = 503 if n <= failures else 200
+        body = b"ok"
+        self.send_response(status)
+        if status == 503:
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return
+
+
+def _serve():
+    Handler.hits = {}
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+FAST = RetryPolicy(max_attempts=4, base_delay_s=0.0)
+
+
+def test_backoff_is_full_jitter_and_capped():
+    p = RetryPolicy(base_delay_s=0.1, max_delay_s=1.0)
+    rng = random.Random(1)
+    for retry in range(1, 10):
+        cap = min(1.0, 0.1 * 2 ** (retry - 1))
+        delays = [p.backoff(retry, rng=rng) for _ in range(200)]
+        assert all(0.0 <= d <= cap for d in delays)
+        assert max(delays) > cap / 2  # spread over the whole range
+    assert p.backoff(1, retry_after_s=0.5, rng=rng) >= 0.5
+    assert p.backoff(1, retry_after_s=60, rng=rng) <= 1.0
+
+
+def test_budget_caps_retries_to_a_fraction_of_requests():
+    b = RetryBudget(ratio=0.5, min_per_s=0.0)
+    for _ in range(4):
+        b.record_request(now=0.0)
+    assert [b.try_spend(now=0.0) for _ in range(3)] == [True, True, False]
+    assert (b.retries, b.exhausted) == (2, 1)
+
+    floor = RetryBudget(ratio=0.0, min_per_s=2.0)
+    assert floor.try_spend(now=floor._last) is False
+    assert floor.try_spend(now=floor._last + 0.5) is True
+
+
+def test_transient_failures_are_retried_on_both_backends():
+    httpd = _serve()
+    host, port = httpd.server_address
+    base = f"http://{host}:{port}"
+    try:
+        async def _run(pool):
+            flaky = await fetch_one(f"{base}/flaky-2", timeout_s=3.0, pool=pool, retry=FAST)
+            missing = await fetch_one(f"{base}/missing", timeout_s=3.0, pool=pool, retry=FAST)
+            hopeless = await fetch_one(f"{base}/flaky-9", timeout_s=3.0, pool=pool, retry=FAST)
+            return flaky, missing, hopeless
+
+        async def _pooled():
+            async with ConnectionPool() as pool:
+                return await _run(pool)
+
+        for runner in (lambda: _run(None), _pooled):
+            Handler.hits = {}
+            flaky, missing, hopeless = asyncio.run(runner())
+            assert (flaky.ok, flaky.status_code, flaky.attempts) == (True, 200, 3)
+            assert (missing.ok, missing.status_code, missing.attempts) == (False, 404, 1)
+            assert (hopeless.ok, hopeless.status_code, hopeless.attempts) == (False, 503, 4)
+    finally:
+        httpd.shutdown()
+
+
+def test_connection_errors_retry_until_budget_runs_out():
+    budget = RetryBudget(ratio=0.0, min_per_s=0.0, max_tokens=1)
+    budget._tokens = 1.0
+    policy = RetryPolicy(max_attempts=5, base_delay_s=0.0, budget=budget)
+
+    async def _run():
+        async with ConnectionPool() as pool:
+            return await fetch_one("http://127.0.0.1:1/", timeout_s=2.0, pool=pool, retry=policy)
+
+    res = asyncio.run(_run())
+    assert res.ok is False and res.attempts == 2
+    assert (budget.retries, budget.exhausted) == (1, 1)
+
+
+def test_retries_take_per_host_rate_tokens():
+    httpd = _serve()
+    host, port = httpd.server_address
+    try:
+        limits = PoolLimits(total_concurrency=4, per_host_rate=20.0, per_host_burst=1.0)
+        t0 = time.perf_counter()
+        results = asyncio.run(
+            fetch_all([f"http://{host}:{port}/flaky-2"], limits=limits, backend="asyncio", retry=FAST)
+        )
+        elapsed = time.perf_counter() - t0
+        assert results[0].ok and results[0].attempts == 3
+        # 3 attempts at 20/s with burst 1: two waits of 50ms
+        assert elapsed >= 0.09
+    finally:
+        httpd.shutdown()
@@ -0,0 +1,96 @@
+import multiprocessing as mp
+import threading
+
+import pytest
+
+from ratelimmq.shared_limiter import SharedBucketTable, SharedTokenBucket
+
+
+def test_shared_bucket_matches_token_bucket_semantics(tmp_path):
+    b = SharedTokenBucket(str(tmp_path / "b"), capacity=2, refill_rate=1)
+    try:
+        assert b.allow(now=0.0)
+        assert b.allow(now=0.0)
+        assert not b.allow(now=0.0)
+        assert b.allow(now=1.0)
+        assert not b.allow(now=1.0)
+        assert b.wait_time(now=1.0) == 1.0
+        # caps at capacity
+        assert b.allow(now=100.0)
+        assert b.allow(now=100.0)
+        assert not b.allow(now=100.0)
+    finally:
+        b.close()
+
+
+def test_state_is_shared_between_handles(tmp_path):
+    path = str(tmp_path / "t")
+    a = SharedBucketTable(path, capacity=3, refill_rate=0, slots=64)
+    b = SharedBucketTable(path, capacity=3, refill_rate=0, slots=64)
+    try:
+        assert a.allow("k", now=0.0)
+        assert b.allow("k", now=0.0)
+        assert a.allow("k", now=0.0)
+        assert not b.allow("k", now=0.0)
+        # other keys are independent
+        assert b.allow("other", now=0.0)
+    finally:
+        a.close()
+        b.close()
+
+
+def test_handles_in_one_process_exclude_each_other(tmp_path):
+    path = str(tmp_path / "t")
+    a = SharedBucketTable(path, capacity=1, refill_rate=0, slots=1)
+    b = SharedBucketTable(path, capacity=1, refill_rate=0, slots=1)
+    try:
+        # lockf alone doesn't block another thread of the same process.
+        a._lock(a._slot_offset(0), 32)
+        t = threading.Thread(target=b.allow, args=("k",), kwargs={"now": 0.0})
+        t.start()
+        t.join(0.1)
+        blocked = t.is_alive()
+        a._unlock(a._slot_offset(0), 32)
+        t.join(2.0)
+        assert blocked and not t.is_alive()
+        assert not a.allow("k", now=0.0)
+    finally:
+        a.close()
+        b.close()
+
+
+def test_reopening_with_a_different_limit_is_rejected(tmp_path):
+    path = str(tmp_path / "t")
+    with SharedBucketTable(path, capacity=5, refill_rate=1):
+        with pytest.raises(ValueError, match="capacity=5.0 refill_rate=1.0"):
+            SharedBucketTable(path, capacity=5, refill_rate=2)
+        with pytest.raises(ValueError, match="capacity=5.0"):
+            SharedTokenBucket(path, capacity=6, refill_rate=1)
+
+
+def test_full_table_never_loosens_the_limit(tmp_path):
+    with SharedBucketTable(str(tmp_path / "t"), capacity=1, refill_rate=0, slots=4) as t:
+        granted = sum(t.allow(f"k{i}", now=0.0) for i in range(50))
+        # at most one token per slot can ever be handed out
+        assert granted <= 4
+
+
+def _hammer(path: str, n: int, q) -> None:
+    t = SharedBucketTable(path, capacity=100, refill_rate=0, slots=16)
+    q.put(sum(t.allow("shared", now=0.0) for _ in range(n)))
+    t.close()
+
+
+def test_aggregate_limit_across_processes(tmp_path):
+    path = str(tmp_path / "t")
+    SharedBucketTable(path, capacity=100, refill_rate=0, slots=16).close()
+
+    ctx = mp.get_context("fork")
+    q = ctx.Queue()
+    procs = [ctx.Process(target=_hammer, args=(path, 200, q)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    total = sum(q.get(timeout=10) for _ in procs)
+    for p in procs:
+        p.join(timeout=10)
+    assert total == 100
@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ratelimmq.fetcher import fetch_one
+from ratelimmq.httpclient import READ_CHUNK_BYTES, ConnectionPool
+from ratelimmq.sinks import CallbackSink, FileSink, HashSink
+
+BODY = bytes(range(256)) * 4096  # 1 MiB
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        if self.path == "/chunked":
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(0, len(BODY), 100_000):
+                part = BODY[i : i + 100_000]
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(part), part))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_header("Content-Length", str(len(BODY)))
+            self.end_headers()
+            self.wfile.write(BODY)
+
+    def log_message(self, format, *args):
+        return
+
+
+class _Server(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        pass  # clients hang up mid-body on purpose
+
+
+def _serve():
+    httpd = _Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def _both_backends(coro_fn):
+    async def _pooled():
+        async with ConnectionPool() as pool:
+            return await coro_fn(pool)
+
+    return [asyncio.run(coro_fn(None)), asyncio.run(_pooled())]
+
+
+def test_hash_sink_streams_whole_body_in_bounded_chunks():
+    httpd = _serve()
+    base = "http://%s:%d" % httpd.server_address
+    sizes = []
+    try:
+        def _record(u):
+            return CallbackSink(lambda chunk: sizes.append(len(chunk)))
+
+        async def _run(pool):
+            out = []
+            for path in ("/", "/chunked"):
+                out.append(await fetch_one(base + path, timeout_s=5.0, pool=pool, body_sink=lambda u: HashSink()))
+            out.append(await fetch_one(base + "/", timeout_s=5.0, pool=pool, body_sink=_record))
+            return out
+
+        for results in _both_backends(_run):
+            for res in results:
+                assert (res.ok, res.bytes_read, res.truncated) == (True, len(BODY), False)
+            assert [r.sink.hexdigest() for r in results[:2]] == [hashlib.sha256(BODY).hexdigest()] * 2
+        assert sum(sizes) == 2 * len(BODY)
+        assert max(sizes) <= READ_CHUNK_BYTES
+    finally:
+        httpd.shutdown()
+
+
+def test_max_body_bytes_fails_early_and_stop_after_bytes_truncates(tmp_path):
+    httpd = _serve()
+    base = "http://%s:%d" % httpd.server_address
+    try:
+        async def _run(pool):
+            big = await fetch_one(base + "/chunked", timeout_s=5.0, pool=pool, max_body_bytes=200_000)
+            head = await fetch_one(
+                base + "/",
+                timeout_s=5.0,
+                pool=pool,
+                stop_after_bytes=1000,
+                max_body_bytes=200_000,
+                body_sink=lambda u: FileSink(tmp_path / "head.bin"),
+            )
+            after = await fetch_one(base + "/", timeout_s=5.0, pool=pool)
+            return big, head, after
+
+        for big, head, after in _both_backends(_run):
+            assert big.ok is False and big.status_code == 200
+            assert big.error.startswith("BodyTooLarge")
+            assert big.bytes_read <= 200_000
+            assert (head.ok, head.truncated, head.bytes_read) == (True, True, 1000)
+            assert (tmp_path / "head.bin").read_bytes() == BODY[:1000]
+            assert after.ok and after.bytes_read == len(BODY)  # aborted connections aren't reused
+    finally:
+        httpd.shutdown()
@@ -0,0 +1,69 @@
+import asyncio
+
+from ratelimmq.context import Context
+from ratelimmq.limiter import TokenBucket
+from ratelimmq.protocol import BINARY_MAGIC, LENGTH_PREFIX, encode_request
+from ratelimmq.server import handle_client
+from ratelimmq.stats import ServerStats
+
+
+def _fields(line: bytes) -> dict:
+    parts = line.decode().split()
+    assert parts[0] == "STATS"
+    return dict(p.split("=", 1) for p in parts[1:])
+
+
+def test_stats_reports_traffic_limiter_and_latency():
+    ctx = Context(stop_event=asyncio.Event(), limiter=TokenBucket(capacity=5, refill_rate=0))
+
+    async def _run():
+        server = await asyncio.start_server(lambda r, w: handle_client(r, w, ctx, 256), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            payload = b"PING\n" * 3 + b"WUT\n" + b"PING\n" * 3 + b"STATS\n"
+            writer.write(payload)
+            await writer.drain()
+            lines = [await asyncio.wait_for(reader.readline(), 3.0) for _ in range(8)]
+
+            # a second (binary) connection sees the first one as open
+            r2, w2 = await asyncio.open_connection("127.0.0.1", port)
+            w2.write(BINARY_MAGIC + encode_request(11))
+            await w2.drain()
+            assert await r2.readexactly(len(BINARY_MAGIC)) == BINARY_MAGIC
+            (length,) = LENGTH_PREFIX.unpack(await r2.readexactly(LENGTH_PREFIX.size))
+            frame = await r2.readexactly(length)
+            for r, w in ((reader, writer), (r2, w2)):
+                w.write_eof()
+                await r.read()
+                w.close()
+            return payload, lines, frame
+
+    payload, lines, frame = asyncio.run(_run())
+    assert lines[:5] == [b"PONG\n"] * 3 + [b"ERR unknown command\n", b"PONG\n"]
+    assert lines[5].startswith(b"ERR rate limited")  # 5 tokens: 4 PINGs + WUT
+
+    first = _fields(lines[-1])
+    assert first["commands"] == "5" and first["rejected"] == "2"
+    assert first["conns"] == "1" and first["conns_total"] == "1"
+    assert first["tokens"] == "0.00" and first["clients"] == "-"
+    assert first["bytes_in"] == str(len(payload))
+    assert first["bytes_out"] == "0"  # the batch's replies go out together, after STATS
+    assert float(first["cps"]) > 0
+    p50, p95, p99 = (float(x) for x in first["lat.PING"].split("/"))
+    assert 0 <= p50 <= p95 <= p99
+    assert "lat.OTHER" in first  # unknown commands share one entry
+
+    second = _fields(frame)
+    assert second["conns"] == "2" and second["commands"] == "6"
+    assert second["bytes_out"] == str(sum(len(x) for x in lines) + len(BINARY_MAGIC))
+
+
+def test_rate_counts_only_the_recent_window():
+    st = ServerStats()
+    st.started = 0.0
+    for i in range(100):
+        st.record("PING", 0.001, now=1.0 + i * 0.01)  # 100 commands at t=1..2s
+    assert st.rate(now=2.0) == 50.0
+    assert st.rate(now=30.0) == 0.0
+    assert st.latency_ms(now=2.0)["PING"][0] > 0
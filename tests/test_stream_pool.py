@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from ratelimmq.dispatcher import PoolLimits, run_pool, stream_pool
+
+
+def test_stream_pool_is_lazy_and_bounded():
+    pulled = 0
+
+    def gen():
+        nonlocal pulled
+        for i in range(100_000):
+            pulled += 1
+            yield f"https://h{i % 7}.example/{i}"
+
+    async def fetch_one(url: str) -> str:
+        await asyncio.sleep(0)
+        return url
+
+    async def _run():
+        limits = PoolLimits(total_concurrency=4, per_host_concurrency=2)
+        seen = 0
+        async for _ in stream_pool(gen(), fetch_one, limits=limits, queue_size=8):
+            seen += 1
+            if seen == 10:
+                break
+        return seen
+
+    seen = asyncio.run(_run())
+    assert seen == 10
+    # Only a small window beyond what was consumed should have been pulled.
+    assert pulled < 100
+
+
+def test_stream_pool_async_input_with_index():
+    async def agen():
+        for i in range(30):
+            await asyncio.sleep(0)
+            yield f"https://a.example/{i}"
+
+    async def fetch_one(url: str) -> int:
+        n = int(url.rsplit("/", 1)[1])
+        await asyncio.sleep(0.001 * (n % 3))
+        return n
+
+    async def _run():
+        return [pair async for pair in stream_pool(agen(), fetch_one, with_index=True)]
+
+    pairs = asyncio.run(_run())
+    assert sorted(i for i, _ in pairs) == list(range(30))
+    assert all(i == n for i, n in pairs)
+
+
+def test_stream_pool_propagates_fetch_errors():
+    async def fetch_one(url: str) -> str:
+        if url.endswith("/3"):
+            raise RuntimeError("boom")
+        await asyncio.sleep(0.001)
+        return url
+
+    async def _run():
+        async for _ in stream_pool([f"https://a.example/{i}" for i in range(10)], fetch_one):
+            pass
+
+    with pytest.raises(RuntimeError, match="boom"):
+        asyncio.run(_run())
+
+
+def test_run_pool_keeps_input_order():
+    async def fetch_one(url: str) -> str:
+        n = int(url.rsplit("/", 1)[1])
+        await asyncio.sleep(0.001 * ((7 * n) % 5))
+        return url
+
+    urls = [f"https://h{i % 3}.example/{i}" for i in range(40)]
+    results = asyncio.run(run_pool(urls, fetch_one, limits=PoolLimits(total_concurrency=6)))
+    assert results == urls
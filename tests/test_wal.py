@@ -0,0 +1,254 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from ratelimmq.mq import QueueRegistry
+from ratelimmq.wal import WriteAheadLog
+
+
+def _free_port() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def _wait_for_listen(port: int, timeout_s: float = 5.0) -> None:
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("server did not start listening in time")
+
+
+def _registry(path: str, **kw) -> QueueRegistry:
+    reg = QueueRegistry(capacity=1000, wal=WriteAheadLog(path, **kw))
+    reg.restore()
+    return reg
+
+
+async def _push(reg: QueueRegistry, name: str, *msgs: str) -> None:
+    q = reg.get_or_create(name)
+    accepted = q.push_many(msgs)
+    await reg.log_push(name, q, list(msgs[:accepted]))
+
+
+async def _pop(reg: QueueRegistry, name: str, n: int = 1) -> list:
+    q = reg.get(name)
+    out = q.pop_many(n)
+    await reg.log_pop(name, q)
+    return out
+
+
+def test_replay_restores_unconsumed_messages(tmp_path):
+    async def _first():
+        reg = _registry(str(tmp_path), durability="batch")
+        await _push(reg, "a", "1", "2", "3")
+        await _push(reg, "b", "x")
+        assert await _pop(reg, "a") == ["1"]
+        await reg.wal.aclose()
+
+    async def _second():
+        reg = _registry(str(tmp_path))
+        a, b = reg.get("a"), reg.get("b")
+        assert list(a._items) == ["2", "3"] and (a.pushed, a.popped) == (3, 1)
+        assert list(b._items) == ["x"]
+        # indexes continue where they left off
+        assert await _pop(reg, "a", 5) == ["2", "3"]
+        await _push(reg, "a", "4")
+        await reg.wal.aclose()
+
+    async def _third():
+        reg = _registry(str(tmp_path))
+        return list(reg.get("a")._items), list(reg.get("b")._items)
+
+    asyncio.run(_first())
+    asyncio.run(_second())
+    assert asyncio.run(_third()) == (["4"], ["x"])
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    async def _write():
+        reg = _registry(str(tmp_path), durability="none")
+        await _push(reg, "q", "keep", "lost")
+        await reg.wal.aclose()
+
+    asyncio.run(_write())
+    (seg,) = [p for p in tmp_path.iterdir()]
+    size = seg.stat().st_size
+    with open(seg, "r+b") as f:
+        f.truncate(size - 2)  # crash mid-record
+
+    reg = _registry(str(tmp_path))
+    assert list(reg.get("q")._items) == ["keep"]
+    assert seg.stat().st_size < size - 2
+
+
+def test_group_commit_batches_fsyncs_and_compacts(tmp_path):
+    async def _run():
+        reg = _registry(str(tmp_path), durability="batch", group_commit_ms=5, segment_bytes=1024)
+        wal = reg.wal
+        # 200 concurrent producers share a handful of fsyncs.
+        await asyncio.gather(*(_push(reg, "q", f"m{i}-" + "x" * 20) for i in range(200)))
+        assert wal.records == 200
+        assert 1 <= wal.fsyncs < 20
+        assert wal.segment_count() > 3
+
+        # Consuming everything lets all but the active segment go.
+        await _pop(reg, "q", 200)
+        await wal.flush()
+        assert wal.segments_deleted > 0
+        assert wal.segment_count() <= 2
+        await wal.aclose()
+
+    asyncio.run(_run())
+    reg = _registry(str(tmp_path))
+    assert len(reg.get("q")) == 0
+
+
+def test_compacted_pop_records_do_not_resurrect_messages(tmp_path):
+    async def _first():
+        reg = _registry(str(tmp_path), durability="batch", segment_bytes=1024)
+        await _push(reg, "q", "gone")
+        assert await _pop(reg, "q") == ["gone"]
+        await _push(reg, "other", "x" * 1100)  # fills the first segment
+        await _push(reg, "q", "keep")
+        assert await _pop(reg, "other") == ["x" * 1100]
+        await reg.wal.flush()
+        # The segment holding q's pop record is gone.
+        assert reg.wal.segments_deleted == 1
+        await reg.wal.aclose()
+
+    async def _second():
+        reg = _registry(str(tmp_path))
+        assert list(reg.get("q")._items) == ["keep"]
+        assert await _pop(reg, "q") == ["keep"]
+        await reg.wal.aclose()
+
+    asyncio.run(_first())
+    asyncio.run(_second())
+    reg = _registry(str(tmp_path))
+    assert len(reg.get("q")) == 0
+
+
+def test_pops_compact_segments_once_their_record_is_written(tmp_path):
+    async def _run():
+        reg = _registry(str(tmp_path), durability="batch", group_commit_ms=1, segment_bytes=1024)
+        for i in range(4):
+            await _push(reg, "q", f"m{i}-" + "x" * 1100)  # one segment each
+        before = reg.wal.segment_count()
+        assert await _pop(reg, "q", 3) == [f"m{i}-" + "x" * 1100 for i in range(3)]
+        # No explicit flush: the batch that wrote the pop record compacted.
+        after = (reg.wal.segment_count(), reg.wal.segments_deleted)
+        await reg.wal.aclose()
+        return before, after
+
+    before, after = asyncio.run(_run())
+    assert before == 4
+    assert after == (2, 3)  # the pop record opened a fifth
+
+
+def test_write_errors_in_none_mode_surface_on_the_next_call(tmp_path, monkeypatch, caplog):
+    def _enospc(chunks, sync):
+        raise OSError(28, "No space left on device")
+
+    async def _run():
+        reg = _registry(str(tmp_path), durability="none", group_commit_ms=1)
+        await _push(reg, "q", "a")  # buffered; nobody waits for the write
+        monkeypatch.setattr(reg.wal, "_write_batch", _enospc)
+        await asyncio.sleep(0.05)
+        errors = []
+        try:
+            await _push(reg, "q", "b")
+        except OSError as e:
+            errors.append(e.errno)
+        try:
+            await reg.wal.aclose()
+        except OSError as e:
+            errors.append(e.errno)
+        return errors
+
+    assert asyncio.run(_run()) == [28, 28]
+    assert any(r.getMessage() == "wal_write_failed" for r in caplog.records)
+
+
+def test_always_mode_fsyncs_every_write(tmp_path):
+    async def _run():
+        reg = _registry(str(tmp_path), durability="always")
+        await asyncio.gather(*(_push(reg, "q", str(i)) for i in range(10)))
+        fsyncs = reg.wal.fsyncs
+        await reg.wal.aclose()
+        return fsyncs
+
+    assert asyncio.run(_run()) == 10
+
+
+def test_always_mode_syncs_each_append_once_off_the_loop(tmp_path, monkeypatch):
+    threads = []
+    real_fsync = os.fsync
+
+    def _fsync(fd):
+        threads.append(threading.get_ident())
+        real_fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", _fsync)
+
+    async def _run():
+        reg = _registry(str(tmp_path), durability="always")
+        await _push(reg, "q", *(str(i) for i in range(100)))
+        fsyncs = reg.wal.fsyncs
+        await reg.wal.aclose()
+        return fsyncs
+
+    assert asyncio.run(_run()) == 1
+    assert threads and threading.get_ident() not in threads
+    assert len(_registry(str(tmp_path)).get("q")) == 100
+
+
+def _start(port: int, wal_dir: str) -> subprocess.Popen:
+    env = os.environ.copy()
+    env["PYTHONPATH"] = "src"
+    env["RATELIMMQ_HOST"] = "127.0.0.1"
+    env["RATELIMMQ_PORT"] = str(port)
+    env["RATELIMMQ_WAL_DIR"] = wal_dir
+    proc = subprocess.Popen(
+        [sys.executable, "-u", "src/ratelimmq/server.py"],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    _wait_for_listen(port)
+    return proc
+
+
+def _send(port: int, lines: list) -> bytes:
+    with socket.create_connection(("127.0.0.1", port), timeout=2.0) as s:
+        f = s.makefile("rb")
+        out = b""
+        for line in lines:
+            s.sendall(line)
+            out += f.readline()
+        return out
+
+
+def test_server_keeps_queued_messages_across_restart(tmp_path):
+    port = _free_port()
+    proc = _start(port, str(tmp_path))
+    try:
+        assert _send(port, [b"MPUSH jobs a b c\n", b"POP jobs\n", b"SHUTDOWN\n"]) == b"OK 3\nMSG a\nBYE\n"
+        assert proc.wait(timeout=5.0) == 0
+        proc = _start(port, str(tmp_path))
+        assert _send(port, [b"QLEN jobs\n", b"POP jobs\n", b"SHUTDOWN\n"]) == b"LEN 2\nMSG b\nBYE\n"
+        assert proc.wait(timeout=5.0) == 0
+    finally:
+        if proc.poll() is None:
+            proc.kill()
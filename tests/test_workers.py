@@ -0,0 +1,115 @@
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+
+def _free_port() -> int:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def _read_until(proc: subprocess.Popen, counts: dict[str, int], timeout_s: float = 5.0) -> str:
+    """Read stdout until each marker has been seen the given number of times."""
+    text = ""
+    deadline = time.time() + timeout_s
+    # Workers share the pipe, so two messages can land on one line: count in the text.
+    while any(text.count(k) < n for k, n in counts.items()):
+        if time.time() > deadline:
+            raise RuntimeError(f"timed out waiting for {counts!r}; got {text!r}")
+        line = proc.stdout.readline()
+        if not line:
+            raise RuntimeError(f"process exited; got {text!r}")
+        text += line
+    return text
+
+
+def _ping(port: int) -> bytes:
+    with socket.create_connection(("127.0.0.1", port), timeout=2.0) as s:
+        s.sendall(b"PING\n")
+        return s.recv(1024)
+
+
+def _start(port: int, workers: int) -> subprocess.Popen:
+    env = os.environ.copy()
+    env["PYTHONPATH"] = "src"
+    env["RATELIMMQ_HOST"] = "127.0.0.1"
+    env["RATELIMMQ_PORT"] = str(port)
+    env["RATELIMMQ_WORKERS"] = str(workers)
+    return subprocess.Popen(
+        [sys.executable, "-u", "src/ratelimmq/server.py"],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+
+def _cleanup(proc: subprocess.Popen) -> None:
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5.0)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def test_workers_restart_and_shutdown_propagates():
+    port = _free_port()
+    proc = _start(port, workers=3)
+    try:
+        text = _read_until(proc, {"listening on": 3, "started pid=": 3})
+        pids = [int(p) for p in re.findall(r"started pid=(\d+)", text)]
+        assert len(pids) == 3
+
+        for _ in range(10):
+            assert _ping(port) == b"PONG\n"
+
+        # A crashed worker is replaced.
+        os.kill(pids[0], signal.SIGKILL)
+        _read_until(proc, {"listening on": 1})
+        for _ in range(10):
+            assert _ping(port) == b"PONG\n"
+
+        # A worker that gets SIGTERM on its own exits 0, but is still replaced.
+        os.kill(pids[1], signal.SIGTERM)
+        _read_until(proc, {"listening on": 1, "restarting": 1})
+        for _ in range(10):
+            assert _ping(port) == b"PONG\n"
+        assert proc.poll() is None
+
+        # SHUTDOWN on any worker stops all of them and the supervisor.
+        with socket.create_connection(("127.0.0.1", port), timeout=2.0) as s:
+            s.sendall(b"SHUTDOWN\n")
+            assert s.recv(1024) == b"BYE\n"
+
+        assert proc.wait(timeout=8.0) == 0
+        for pid in pids[2:]:
+            try:
+                os.kill(pid, 0)
+                alive = True
+            except ProcessLookupError:
+                alive = False
+            assert not alive
+    finally:
+        _cleanup(proc)
+
+
+def test_sigterm_stops_all_workers():
+    port = _free_port()
+    proc = _start(port, workers=2)
+    try:
+        _read_until(proc, {"listening on": 2})
+        assert _ping(port) == b"PONG\n"
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=8.0) == 0
+        out = proc.stdout.read()
+        assert "supervisor shutdown complete" in out
+    finally:
+        _cleanup(proc)